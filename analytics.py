@@ -0,0 +1,109 @@
+import numpy as np
+
+from roster import ARRIVAL_TIMES, EPOCH, LATE_THRESHOLD, POSITIONS, PRESENT, parse_hours
+
+# Аналитика прибытия по массивам NumPy: каждая величина — один векторный
+# проход, без цикла по строкам. Кривая для диаграммы берётся из массива
+# фактов, который ведёт сама модель; полные массивы строятся из снимка
+# строк выгрузки (в рабочем потоке).
+
+LATE_MINUTES = LATE_THRESHOLD.total_seconds() / 60
+
+
+class Curve:
+    def __init__(self, sorted_offsets, total):
+        self.sorted = sorted_offsets  # минут от запуска до прибытия присутствующих, по возрастанию
+        self.total = total            # присутствующих
+
+    @classmethod
+    def from_roster(cls, roster):
+        # Roster.facts обновляется при каждой отметке; здесь только копия и сортировка
+        facts = np.array(roster.facts)
+        offsets = facts - (roster.start_time - EPOCH).total_seconds() / 60
+        with np.errstate(invalid="ignore"):
+            came = offsets >= 0  # nan — не пришёл
+        return cls(np.sort(offsets[came]), roster.counts[PRESENT])
+
+    def curve(self, points=100, span=None):
+        # Накопленный процент прибывших к моменту t (минуты от запуска)
+        if span is None:
+            span = float(self.sorted[-1]) if len(self.sorted) else 0.0
+        t = np.linspace(0.0, max(span, 1.0), points)
+        arrived = np.searchsorted(self.sorted, t, side="right")
+        return t, (arrived / self.total * 100) if self.total else np.zeros(points)
+
+    def percentiles(self, qs=(50, 90)):
+        # Минут до прибытия половины/90% пришедших
+        if not len(self.sorted):
+            return [None] * len(qs)
+        return [float(v) for v in np.percentile(self.sorted, qs)]
+
+    def cutoffs(self, hours_list=None):
+        # Процент присутствующих, пришедших к каждому сроку
+        if hours_list is None:
+            hours_list = [parse_hours(t) for t in ARRIVAL_TIMES]
+        limits = np.asarray(hours_list, dtype=float) * 60
+        arrived = np.searchsorted(self.sorted, limits, side="right")
+        if not self.total:
+            return [0.0] * len(limits)
+        return [float(v) for v in arrived / self.total * 100]
+
+
+class Arrivals(Curve):
+    def __init__(self, offsets, arrival, pos, present):
+        self.offsets = offsets    # минут от запуска до факта, nan — не пришёл
+        self.arrival = arrival    # ожидаемое время прибытия, минут
+        self.pos = pos            # номер должности в positions
+        self.present = present    # статус "Присутствует"
+        self.positions = list(POSITIONS)
+        came = present & ~np.isnan(offsets) & (offsets >= 0)
+        super().__init__(np.sort(offsets[came]), int(present.sum()))
+
+    @classmethod
+    def build(cls, start, items):
+        # items: [(должность, часы прибытия, факт, присутствует)]
+        positions = {p: k for k, p in enumerate(POSITIONS)}
+        n = len(items)
+        offsets = np.full(n, np.nan)
+        arrival = np.empty(n)
+        pos = np.empty(n, dtype=np.int64)
+        present = np.empty(n, dtype=bool)
+        extra = []
+        for k, (p, hours, fact, is_present) in enumerate(items):
+            if fact is not None and start is not None:
+                offsets[k] = (fact - start).total_seconds() / 60
+            arrival[k] = hours * 60
+            code = positions.get(p)
+            if code is None:
+                code = positions[p] = len(positions)
+                extra.append(p)
+            pos[k] = code
+            present[k] = is_present
+        stats = cls(offsets, arrival, pos, present)
+        stats.positions += extra
+        return stats
+
+    @classmethod
+    def from_rows(cls, rows, start):
+        # rows — из excel_io.export_rows(): (должность, ФИО, время, факт, опоздание, статус)
+        return cls.build(start, [(pos, parse_hours(arr), fact, status == PRESENT)
+                                 for pos, fio, arr, fact, late, status in rows])
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def by_position(self):
+        # [(должность, присутствует, пришли, опоздали, % прибытия)]
+        n = len(self.positions)
+        came = self.present & ~np.isnan(self.offsets) & (self.offsets >= 0)
+        with np.errstate(invalid="ignore"):
+            late = came & (self.offsets - self.arrival >= LATE_MINUTES)
+        present = np.bincount(self.pos[self.present], minlength=n)
+        arrived = np.bincount(self.pos[came], minlength=n)
+        lates = np.bincount(self.pos[late], minlength=n)
+        result = []
+        for k, name in enumerate(self.positions):
+            if present[k]:
+                result.append((name, int(present[k]), int(arrived[k]), int(lates[k]),
+                               float(arrived[k] / present[k] * 100)))
+        return result
@@ -1,48 +1,142 @@
 import tkinter as tk
-from tkinter import ttk, messagebox, simpledialog, filedialog
-from datetime import datetime, timedelta
-import json, os
-import pandas as pd
-
-DATA_FILE = "data.json"
-
-POSITIONS = ["Неизвестно", "Инженер", "Менеджер", "Техник", "Администратор", "Директор"]
-STATUSES = ["Присутствует", "Болен", "Командировка"]
-ARRIVAL_TIMES = ["1 час", "1.5 часа", "2 часа", "2.5 часа", "3 часа"]
+from tkinter import ttk, messagebox, simpledialog, filedialog, font as tkfont
+import os, queue, sys, threading, time
+from collections import Counter, deque
+from bisect import bisect_right
+from datetime import datetime
+from excel_io import read_names, export_rows, export_reports, EXPORT_HOURS, EXPORT_FORMATS
+from storage import DATA_FILE, Journal, Writer, lock_data
+from roster import Roster, POSITIONS, STATUSES, ARRIVAL_TIMES, PRESENT, iso, from_iso
+from table import VirtualTable
+from selector import Selector
+from rosters import Rosters, INDEX_FILE
+from search import build_index
+from turnstile import Ingest, chunks, follow, listen, read_log
+from sync import SyncClient
+from history import History, session_rows
+from undo import UndoLog, batch, delete, deleted_ids, restore
+from profiling import Profiler, TclCounter, ENABLED as PROFILE
+
+SAVE_FLUSH_TIMEOUT = 5  # сек. ожидания записи на диск при закрытии
 
 FONT_SIZE = 20
+ROW_HEIGHT = 40
 COMBO_FONT_SIZE = 20
+FONT_FAMILY = "Segoe UI"
 SEARCH_FONT_SIZE = 25
-
-def parse_hours(text):
-    return float(text.replace("час", "").replace("а", "").strip())
+SEARCH_DELAY = 150  # мс паузы при вводе перед поиском
+# Обработчики событий и сохранение, которые меряет Profiler
+PROFILED = ("on_tree_double_click", "mark_arrival", "on_tree_right_click", "on_tree_left_click",
+            "on_select", "fast_scroll", "open_selector", "commit_combo", "commit_text", "start_timer", "clear_data",
+            "add_row_values", "delete_row", "delete_selected_rows", "delete_all_table", "paste_rows",
+            "bulk_set_status", "bulk_set_arrival", "bulk_mark", "undo_last", "redo_last",
+            "on_search_key", "search_live", "search_from_entry", "search_next",
+            "switch_roster", "handle_scan", "poll_turnstile", "poll_sync", "on_deadline", "poll_import", "finish_import",
+            "export_reports", "update_counters", "update_chart", "update_curve",
+            "log", "save_data", "load_data")
+SYNC_ADDRESS = os.environ.get("ARRIVAL_SYNC")  # "хост:порт" сервера синхронизации станций
+SYNC_POLL = 50  # мс между проверками входящих изменений
+SCANNER = os.environ.get("ARRIVAL_SCANNER")  # "stdin" или путь к последовательному порту сканера
+SCAN_POLL = 20  # мс между проверками очереди сканов со stdin/порта
+SCAN_STATS = 200  # сколько последних задержек скан -> цвет строки хранить
+# Журнал турникетов, за которым следить: путь к CSV или "порт" для приёма по сокету
+TURNSTILE = os.environ.get("ARRIVAL_TURNSTILE")
+TURNSTILE_POLL = 100  # мс между проверками очереди пачек событий
+CURVE_DELAY = 500  # мс: кривая прибытия пересчитывается не чаще, чем раз в полсекунды
+CURVE_POINTS = 100
+SEARCH_INDEX_POLL = 100  # мс между проверками фонового построения индекса поиска
+HISTORY_POLL = 200  # мс между проверками фоновой записи сессии в историю
+DEADLINE_MAX_WAIT = 60_000  # мс; таймер сроков перепроверяется не реже, на случай перевода часов
+NEW_ROSTER = "Новый список…"
+DELETE_ROSTER = "Удалить список…"
+ROSTERS_SUMMARY = "Сводка по спискам"
 
 class App(tk.Tk):
     def __init__(self):
+        started = time.perf_counter()
         super().__init__()
         self.title("БЕТА-прибытие")
         self.state("zoomed")
 
-        self.start_time = None
-        self.rows = {}
+        # Замеры: обёртки ставятся всегда (выключенные почти ничего не стоят),
+        # счётчик вызовов Tcl — только при ARRIVAL_PROFILE=1, до создания виджетов
+        self.profiler = Profiler()
+        if PROFILE:
+            self.tk = self.profiler.counter = TclCounter(self.tk)
+        self.profiler.idle = self.update_idletasks
+        for name in PROFILED:
+            setattr(self, name, self.profiler.wrap(name, getattr(self, name)))
+
+        self.roster = Roster()
         self.clipboard_data = []  # Для копирования/вырезания
         self.current_item = None   # Текущая выделенная строка
         self.edit_widget = None
         self.edit_popup = None
         self.suppress_select = False
         self.last_selection = ()
-        self.prev_grab = None
-        self.search_matches = []
+        self.selectors = {}  # набор значений -> Selector
+        self.add_dlg = None  # окно «Добавить строку», строится при первом открытии
+        self.search_matches = []  # [(ключ сортировки, id)] в порядке таблицы
         self.search_index = -1
-
+        self.search_current = None
+        self.search_job = None
+        self.rosters = Rosters(INDEX_FILE, DATA_FILE)  # открыт только активный список
+        try:
+            # Пока окно открыто, файл списка не трогает ни второе окно, ни cli
+            self.data_lock = lock_data(self.rosters.file(self.rosters.active))
+        except OSError as e:
+            messagebox.showerror("Ошибка", f"Список не открыт:\n{e}")
+            self.destroy()
+            raise SystemExit(1)
+        self.journal = Journal(self.rosters.file(self.rosters.active))
+        self.writer = Writer(self.journal)
+        self.writer.start()
+        self.save_poll = None
+        self.import_job = None
+        self.turnstile_job = None
+        self.export_job = None
+        self.export_format = EXPORT_FORMATS[0]
+        self.sync = None
+        self.scan_queue = queue.Queue()  # (номер пропуска, время скана); пачка сканов не теряется
+        self.scan_latency = deque(maxlen=SCAN_STATS)  # мс от скана до перекрашенной строки
+        self.badge_target = None  # id строки, к которой привяжется следующий скан
+        self.deadline_job = None
+        self.deadline_at = None   # срок, на который сейчас заведён таймер
+        self.history = History()
+        self.undo = UndoLog()
+        self.curve_job = None
+
+        # Время запуска по этапам — в панели замеров и в profile_stats.json
+        t = self.profiler.phase("tk", started)
+        self.setup_fonts()
         self.setup_style()
+        t = self.profiler.phase("style", t)
         self.create_widgets()
+        t = self.profiler.phase("widgets", t)
         self.load_data()
-        self.sort_table()
-        self.update_numbers()
         self.update_counters()
+        t = self.profiler.phase("data", t)
+
+        def first_draw():
+            self.update_idletasks()
+            self.profiler.phase("first_draw", t)
+            self.profiler.phase("total", started)
+        self.after_idle(first_draw)
+        if SYNC_ADDRESS:
+            self.start_sync(SYNC_ADDRESS)
+        if SCANNER:
+            self.start_scanner(SCANNER)
+        if TURNSTILE:
+            self.start_turnstile(TURNSTILE, live=True)
+        # Списки выбора строятся после первой отрисовки, до первого клика
+        self.after_idle(self.prebuild_selectors)
 
         self.bind("<Control-f>", self.search_dialog)
+        self.bind("<Control-D>", self.open_profiler)  # Ctrl+Shift+D — панель замеров
+        for key in ("<Control-z>", "<Control-Z>"):
+            self.bind(key, self.undo_last)
+        for key in ("<Control-y>", "<Control-Y>"):
+            self.bind(key, self.redo_last)
         self.bind("<Escape>", self.clear_selection)
         #self.bind_all("<Button-1>", self.global_click, add="+")  # Удалено
         self.tree.bind("<MouseWheel>", self.fast_scroll)
@@ -54,9 +148,23 @@ class App(tk.Tk):
         self.tree.bind("<ButtonPress-3>", self.on_tree_right_click, add="+")
         self.tree.bind("<ButtonRelease-3>", lambda e: "break", add="+")
         self.tree.bind("<Button-1>", self.on_tree_left_click, add="+")
+        self.tree.bind("<Delete>", lambda e: self.delete_selected_rows())
+        self.tree.bind("<Control-c>", lambda e: self.copy_rows())
+        self.tree.bind("<Control-x>", lambda e: self.cut_rows())
+        self.tree.bind("<Control-v>", lambda e: self.paste_rows())
 
         self.protocol("WM_DELETE_WINDOW", self.on_close)
 
+    def setup_fonts(self):
+        # Именованные шрифты создаются один раз: стили и виджеты ссылаются
+        # на них по имени, и Tk не разбирает описание шрифта для каждого виджета
+        self.fonts = {}
+        for key, size, weight in (("base", FONT_SIZE, "normal"), ("bold", FONT_SIZE, "bold"),
+                                  ("title", FONT_SIZE * 2, "normal"), ("combo", COMBO_FONT_SIZE, "normal"),
+                                  ("search", SEARCH_FONT_SIZE, "normal"), ("small", 10, "normal")):
+            self.fonts[key] = tkfont.Font(self, name=f"Arrival{key.title()}", family=FONT_FAMILY,
+                                          size=size, weight=weight)
+
     def setup_style(self):
         style = ttk.Style(self)
         style.theme_use("default")
@@ -67,10 +175,10 @@ class App(tk.Tk):
 
         self.configure(bg=bg)
 
-        style.configure(".", background=bg, foreground=fg, font=("Segoe UI", FONT_SIZE))
-        style.configure("Treeview", font=("Segoe UI", FONT_SIZE), rowheight=40,
+        style.configure(".", background=bg, foreground=fg, font=self.fonts["base"])
+        style.configure("Treeview", font=self.fonts["base"], rowheight=ROW_HEIGHT,
                         background="#2a2a2a", fieldbackground="#2a2a2a", foreground="white")
-        style.configure("Treeview.Heading", font=("Segoe UI", FONT_SIZE, "bold"),
+        style.configure("Treeview.Heading", font=self.fonts["bold"],
                         background="#2255aa", foreground="white")
         style.map("Treeview.Heading", background=[("active", "#3366cc")])
 
@@ -82,9 +190,9 @@ class App(tk.Tk):
 
         style.configure("TEntry", fieldbackground=field, foreground="black")
         style.configure("TCombobox", fieldbackground=field, foreground="black",
-                        font=("Segoe UI", COMBO_FONT_SIZE))
+                        font=self.fonts["combo"])
         style.configure("Big.TCombobox", fieldbackground=field, foreground="black",
-                        font=("Segoe UI", COMBO_FONT_SIZE))
+                        font=self.fonts["combo"])
 
         # Кнопочный стиль для выпадающих списков
         combo_bg = "#1f1f1f"
@@ -97,7 +205,7 @@ class App(tk.Tk):
                         bordercolor=combo_border,
                         lightcolor=combo_border,
                         darkcolor="#101010",
-                        font=("Segoe UI", COMBO_FONT_SIZE),
+                        font=self.fonts["combo"],
                         relief="raised",
                         borderwidth=2,
                         padding=6)
@@ -109,7 +217,7 @@ class App(tk.Tk):
                   lightcolor=[("readonly", combo_border), ("active", combo_border)],
                   darkcolor=[("readonly", "#101010"), ("active", "#101010")])
 
-        self.option_add("*TCombobox*Listbox.font", ("Segoe UI", COMBO_FONT_SIZE))
+        self.option_add("*TCombobox*Listbox.font", self.fonts["combo"])
         self.option_add("*TCombobox*Listbox.background", "#1f1f1f")
         self.option_add("*TCombobox*Listbox.foreground", "white")
         self.option_add("*TCombobox*Listbox.selectBackground", "#2f2f2f")
@@ -117,7 +225,7 @@ class App(tk.Tk):
 
         style.configure("Dialog.TEntry", fieldbackground="#2a2a2a", foreground="white")
         style.configure("Dialog.TCombobox", fieldbackground="#2a2a2a", foreground="white",
-                        font=("Segoe UI", COMBO_FONT_SIZE))
+                        font=self.fonts["combo"])
         style.configure("Dialog.Fancy.TCombobox",
                         fieldbackground=combo_bg,
                         foreground="white",
@@ -126,7 +234,7 @@ class App(tk.Tk):
                         bordercolor=combo_border,
                         lightcolor=combo_border,
                         darkcolor="#101010",
-                        font=("Segoe UI", COMBO_FONT_SIZE),
+                        font=self.fonts["combo"],
                         relief="raised",
                         borderwidth=2,
                         padding=6)
@@ -144,18 +252,35 @@ class App(tk.Tk):
         self.clear_btn.pack(side="left", padx=10)
 
         self.start_lbl = ttk.Label(top, text="Время запуска: ---",
-                                   font=("Segoe UI", FONT_SIZE * 2), foreground="red")
+                                   font=self.fonts["title"], foreground="red")
         self.start_lbl.pack(side="left", padx=20)
 
+        self.save_lbl = ttk.Label(top, text="Сохранено", foreground="#888888")
+        self.save_lbl.pack(side="left", padx=10)
+
+        self.sync_lbl = ttk.Label(top, text="", foreground="#888888")
+        self.sync_lbl.pack(side="left", padx=10)
+
+        # Сканер в режиме клавиатуры печатает номер пропуска и Enter
+        ttk.Label(top, text="Пропуск:").pack(side="left", padx=(10, 4))
+        self.scan_ent = ttk.Entry(top, font=self.fonts["search"], width=12)
+        self.scan_ent.pack(side="left")
+        self.scan_ent.bind("<Return>", self.on_scan_entry)
+        self.scan_lbl = ttk.Label(top, text="", foreground="#888888")
+        self.scan_lbl.pack(side="left", padx=10)
+
         self.search_clear_btn = ttk.Button(top, text="X", command=self.clear_search,
                                            style="Red.TButton", width=3)
         self.search_clear_btn.pack(side="right", padx=6)
         self.search_next_btn = ttk.Button(top, text="Далее", command=self.search_next,
                                           style="Blue.TButton", width=8)
         self.search_next_btn.pack(side="right", padx=6)
-        self.search_ent = ttk.Entry(top, font=("Segoe UI", SEARCH_FONT_SIZE), width=18)
+        self.search_count_lbl = ttk.Label(top, text="", foreground="#888888")
+        self.search_count_lbl.pack(side="right")
+        self.search_ent = ttk.Entry(top, font=self.fonts["search"], width=18)
         self.search_ent.pack(side="right", padx=10)
         self.search_ent.bind("<Return>", self.search_from_entry)
+        self.search_ent.bind("<KeyRelease>", self.on_search_key)
         ttk.Label(top, text="Поиск:").pack(side="right", padx=6)
 
         main = ttk.Frame(self)
@@ -180,6 +305,7 @@ class App(tk.Tk):
         self.tree.tag_configure("late", background="#661111")
         self.tree.tag_configure("ontime", background="#114411")
         self.tree.tag_configure("other", background="#112244")
+        self.tree.tag_configure("overdue", background="#5a3a00")
 
         self.tree.pack(side="left", fill="both", expand=True)
         self.tree.bind("<Double-1>", self.on_tree_double_click)
@@ -188,9 +314,11 @@ class App(tk.Tk):
         self.tree.bind("<ButtonRelease-1>", self.on_tree_left_release, add="+")
         self.tree.bind("<ButtonPress-1>", self.on_tree_left_press, add="+")
 
-        scroll = ttk.Scrollbar(main, orient="vertical", command=self.tree.yview)
-        self.tree.configure(yscrollcommand=scroll.set)
+        # Прокрутка идёт по модели: в Treeview только видимые строки
+        scroll = ttk.Scrollbar(main, orient="vertical")
         scroll.pack(side="left", fill="y")
+        self.table = VirtualTable(self.tree, scroll, self.roster, ROW_HEIGHT)
+        self.table.render = self.profiler.wrap("table.render", self.table.render)
 
         right = ttk.Frame(main)
         right.pack(side="right", fill="y", padx=10)
@@ -199,6 +327,11 @@ class App(tk.Tk):
         def label(txt):
             ttk.Label(right, text=txt).pack(anchor="w", pady=(6,0))
 
+        label("Список")
+        self.roster_btn = ttk.Button(right, text=self.rosters.active, command=self.open_roster_menu,
+                                     style="Blue.TButton")
+        self.roster_btn.pack(fill="x")
+
         btn_add = ttk.Button(right, text="Добавить", command=self.open_add_dialog)
         btn_add.pack(fill="x", pady=5)
 
@@ -206,12 +339,38 @@ class App(tk.Tk):
         btn_del.pack(fill="x")
 
         ttk.Button(right, text="Загрузка ФИО из Excel", command=self.import_excel).pack(fill="x", pady=5)
+        ttk.Button(right, text="Привязать пропуск", command=self.bind_badge).pack(fill="x")
+        ttk.Button(right, text="Журнал турникетов", command=self.load_turnstile_log).pack(fill="x", pady=(5, 0))
+        self.turnstile_lbl = ttk.Label(right, text="", foreground="#888888")
+        self.turnstile_lbl.pack(anchor="w")
+        ttk.Button(right, text="История", command=self.open_history).pack(fill="x", pady=5)
+
+        label("Выделенные строки")
+        bulk = ttk.Frame(right)
+        bulk.pack(fill="x")
+        bulk_status = ttk.Button(bulk, text="Статус", width=9)
+        bulk_status.config(command=lambda: self.open_bulk_menu(bulk_status, STATUSES, self.bulk_set_status))
+        bulk_status.grid(row=0, column=0, sticky="ew")
+        bulk_arr = ttk.Button(bulk, text="Время", width=9)
+        bulk_arr.config(command=lambda: self.open_bulk_menu(bulk_arr, ARRIVAL_TIMES, self.bulk_set_arrival))
+        bulk_arr.grid(row=0, column=1, sticky="ew")
+        ttk.Button(bulk, text="Прибыли", width=9, command=self.bulk_mark).grid(row=0, column=2, sticky="ew")
+        ttk.Button(bulk, text="Копировать", width=9, command=self.copy_rows).grid(row=1, column=0, sticky="ew")
+        ttk.Button(bulk, text="Вырезать", width=9, command=self.cut_rows).grid(row=1, column=1, sticky="ew")
+        ttk.Button(bulk, text="Вставить", width=9, command=self.paste_rows).grid(row=1, column=2, sticky="ew")
+        ttk.Button(bulk, text="Удалить выделенные", command=self.delete_selected_rows,
+                   style="Red.TButton").grid(row=2, column=0, columnspan=3, sticky="ew")
+        for c in range(3):
+            bulk.columnconfigure(c, weight=1)
 
         ttk.Separator(right).pack(fill="x", pady=8)
 
         label("Выгрузка")
         self.export_btn = ttk.Button(right, text="Выбрать", command=self.open_export_menu, style="Blue.TButton")
         self.export_btn.pack(fill="x")
+        self.export_fmt_btn = ttk.Button(right, text=f"Формат: {self.export_format}",
+                                         command=self.open_export_format_menu)
+        self.export_fmt_btn.pack(fill="x", pady=(5, 0))
 
         ttk.Separator(right).pack(fill="x", pady=8)
 
@@ -220,6 +379,7 @@ class App(tk.Tk):
         self.sick_lbl = ttk.Label(right)
         self.trip_lbl = ttk.Label(right)
         self.arrived_lbl = ttk.Label(right)
+        self.overdue_lbl = ttk.Label(right)
         self.percent_lbl = ttk.Label(right)
 
         self.total_lbl.pack(anchor="w")
@@ -227,10 +387,18 @@ class App(tk.Tk):
         self.sick_lbl.pack(anchor="w")
         self.trip_lbl.pack(anchor="w")
         self.arrived_lbl.pack(anchor="w")
+        self.overdue_lbl.pack(anchor="w")
         self.percent_lbl.pack(anchor="w")
+        self.counter_lbls = (self.total_lbl, self.present_lbl, self.sick_lbl, self.trip_lbl,
+                             self.arrived_lbl, self.overdue_lbl, self.percent_lbl)
+        self.counter_texts = (None,) * len(self.counter_lbls)
 
-        self.chart = tk.Canvas(right, width=320, height=180, bg="#2a2a2a", highlightthickness=0)
+        self.chart = tk.Canvas(right, width=320, height=300, bg="#2a2a2a", highlightthickness=0)
         self.chart.pack(fill="x", pady=10)
+        self.chart_bars = []
+        self.chart_counts = []
+        self.chart_values = None
+        self.chart_curve = None
 
         ttk.Separator(right).pack(fill="x", pady=15)
         
@@ -243,16 +411,17 @@ class App(tk.Tk):
 
     # ====== Методы ======
     def fast_scroll(self, event):
-        self.tree.yview_scroll(int(-3*(event.delta/120)), "units")
+        return self.table.scroll(int(-3*(event.delta/120)))
+
+    def person(self, item):
+        # id строки Treeview совпадает с id человека в Roster
+        return self.roster.people[int(item)]
 
-    def format_timedelta(self, td):
-        total_minutes = int(td.total_seconds() // 60)
-        hours = total_minutes // 60
-        minutes = total_minutes % 60
-        return f"{hours:02d}:{minutes:02d}"
+    def refresh_row(self, p):
+        self.table.refresh(p)
 
     def clear_selection(self, event=None):
-        self.tree.selection_remove(self.tree.selection())
+        self.table.select([])
         self.current_item = None
         if hasattr(self, "search_ent"):
             self.search_ent.selection_clear()
@@ -262,10 +431,12 @@ class App(tk.Tk):
             self.search_ent.delete(0, tk.END)
         self.search_matches = []
         self.search_index = -1
+        self.search_current = None
+        self.search_count_lbl.config(text="")
         self.clear_selection()
 
     def on_tree_right_click(self, event):
-        saved_selection = self.tree.selection()
+        saved_selection = self.table.selection()
         self.suppress_select = True
         item = self.tree.identify_row(event.y)
         if not item:
@@ -292,14 +463,14 @@ class App(tk.Tk):
     def restore_selection(self, selection):
         def _restore():
             if selection:
-                self.tree.selection_set(selection)
+                self.table.select(selection)
             self.suppress_select = False
         self.after_idle(_restore)
 
     def force_restore_selection(self, selection):
         def _force():
             if selection:
-                self.tree.selection_set(selection)
+                self.table.select(selection)
         self.after(10, _force)
 
     def on_tree_left_press(self, event):
@@ -330,108 +501,174 @@ class App(tk.Tk):
             return "break"
 
     def copy_rows(self):
-        selected = self.tree.selection()
+        selected = self.table.selection()
         if not selected:
             return
         self.clipboard_data = []
-        for item in selected:
-            row_data = {
-                "values": self.tree.item(item)["values"],
-                "row_info": self.rows[item].copy()
-            }
-            self.clipboard_data.append(row_data)
+        for pid in selected:
+            self.clipboard_data.append(self.roster.to_record(self.roster.people[pid]))
         messagebox.showinfo("Копирование", f"Скопировано строк: {len(selected)}")
 
     def cut_rows(self):
-        selected = self.tree.selection()
+        selected = self.table.selection()
         if not selected:
             return
         self.copy_rows()
         self.delete_selected_rows()
 
     def delete_selected_rows(self):
-        selected = self.tree.selection()
+        selected = self.table.selection()
         if not selected:
             return
         if not messagebox.askyesno("Удаление", f"Удалить выбранных строк: {len(selected)}?"):
             return
-        for item in selected:
-            self.tree.delete(item)
-            del self.rows[item]
-        self.update_numbers()
+        before = [self.roster.to_record(p) for p in self.roster.remove_many(selected)]
+        self.table.forget(selected)
+        self.commit_batch([{"op": "del", "id": pid} for pid in selected], restore(before))
+
+    def paste_rows(self):
+        if not self.clipboard_data:
+            return
+        records = []
+        for r in self.clipboard_data:
+            # Пропуск остаётся у строки, только если он ещё ни за кем не закреплён
+            badge = r.get("badge")
+            if badge and self.roster.find_badge(badge) is not None:
+                badge = None
+            p = self.roster.add(r["pos"], r["fio"], r["arr"], r["status"], from_iso(r["fact"]),
+                                keep_order=False, badge=badge)
+            records.append({"op": "row", "row": self.roster.to_record(p)})
+        self.roster.sort()
+        added = [r["row"]["id"] for r in records]
+        self.table.select(added)
+        self.commit_batch(records, delete(added))
+
+    # ====== Действия над выделенными строками ======
+    # Каждое действие — одна пачка: одна отрисовка, одно обновление счётчиков
+    # и одна запись в журнал на все строки
+    def commit_batch(self, records, undo):
+        # undo — обратная запись для всей пачки: отменяется одним шагом
+        if not records:
+            return
+        self.table.render()
         self.update_counters()
-        self.save_data()
+        self.log(batch(records), undo)
+
+    def bulk_update(self, change):
+        # change(pid) меняет строку и возвращает True, если она изменилась
+        records, before = [], []
+        for pid in self.table.selection():
+            old = self.roster.to_record(self.roster.people[pid])
+            if change(pid):
+                before.append(old)
+                records.append({"op": "row", "row": self.roster.to_record(self.roster.people[pid])})
+        self.commit_batch(records, restore(before))
+
+    def bulk_set_status(self, status):
+        def change(pid):
+            if self.roster.people[pid].status == status:
+                return False
+            self.roster.set_status(pid, status)
+            return True
+        self.bulk_update(change)
+
+    def bulk_set_arrival(self, arr):
+        def change(pid):
+            if self.roster.people[pid].arr == arr:
+                return False
+            self.roster.set_arrival(pid, arr)
+            return True
+        self.bulk_update(change)
+
+    def bulk_mark(self):
+        if not self.roster.start_time:
+            messagebox.showwarning("Отметка", "Сначала нажмите ЗАПУСК")
+            return
+        now = datetime.now()
+        self.bulk_update(lambda pid: self.roster.mark(pid, now))
+
+    def open_bulk_menu(self, btn, values, on_select):
+        if not self.table.selection():
+            messagebox.showinfo("Выделение", "Выделите строки в таблице")
+            return
+        bx = btn.winfo_rootx()
+        by = btn.winfo_rooty() + btn.winfo_height()
+        self.open_selector(values, bx, by, btn.winfo_width(), on_select)
 
     def delete_all_table(self):
-        if not self.rows:
+        if not len(self.roster):
             messagebox.showinfo("Информация", "Таблица уже пуста")
             return
+        undoable = self.undo.fits(len(self.roster))
+        warning = "Отменить можно через Ctrl+Z." if undoable else "Это действие нельзя отменить!"
         if not messagebox.askyesno("Удаление всей таблицы", 
-                                   "Вы уверены, что хотите удалить ВСЕ строки из таблицы?\n\n"
-                                   "Это действие нельзя отменить!"):
+                                   "Вы уверены, что хотите удалить ВСЕ строки из таблицы?\n\n" + warning):
             return
-        for item in list(self.rows.keys()):
-            self.tree.delete(item)
-        self.rows.clear()
-        self.update_numbers()
+        self.archive_session()
+        before = [self.roster.to_record(p) for p in self.roster] if undoable else None
+        self.roster.remove_all()
+        self.table.select([])
+        self.table.render()
         self.update_counters()
-        self.save_data()
+        if undoable:
+            self.log({"op": "wipe"}, restore(before))
+        else:
+            # Старые шаги отмены ссылаются на удалённые строки
+            self.undo.clear()
+            self.log({"op": "wipe"})
         messagebox.showinfo("Готово", "Все строки удалены")
 
     def start_timer(self):
-        self.start_time = datetime.now()
-        self.start_lbl.config(text=f"Время запуска: {self.start_time.strftime('%H:%M')}")
-        self.save_data()
+        # Повторный ЗАПУСК начинает новую сессию: прежняя уходит в историю
+        self.archive_session()
+        old = iso(self.roster.start_time)
+        self.roster.start()
+        self.start_lbl.config(text=f"Время запуска: {self.roster.start_time.strftime('%H:%M')}")
+        # Опоздание считается от времени запуска: перерисовываем видимые строки
+        self.table.render()
+        self.update_counters()
+        self.log({"op": "start", "start": iso(self.roster.start_time)}, {"op": "start", "start": old})
 
-    def add_row_values(self, pos, fio, arr, status="Присутствует"):
+    def add_row_values(self, pos, fio, arr, status=PRESENT):
         if not fio:
             return
-        for r in self.rows.values():
-            if fio.lower() == r["fio"].lower():
-                if not messagebox.askyesno("Совпадение", "Есть совпадение. Продолжить?"):
-                    return
-        item = self.tree.insert("", "end",
-            values=("", pos, fio,
-                    arr,"","",status))
-        self.rows[item] = {
-            "fio": fio,
-            "arrival": parse_hours(arr),
-            "fact": None,
-            "status": status
-        }
-        self.sort_table()
-        self.update_numbers()
+        if self.roster.find_fio(fio):
+            if not messagebox.askyesno("Совпадение", "Есть совпадение. Продолжить?"):
+                return
+        p = self.roster.add(pos, fio, arr, status)
+        self.table.render()
         self.update_counters()
-        self.save_data()
+        self.log_row(p, None)
 
-    def open_add_dialog(self):
+    def build_add_dialog(self):
+        # Диалог строится один раз и дальше только показывается и прячется
         dlg = tk.Toplevel(self)
+        dlg.withdraw()
         dlg.title("Добавить строку")
         dlg.configure(bg="#1e1e1e")
         dlg.transient(self)
-        dlg.grab_set()
 
         tk.Label(dlg, text="Должность", bg="#1e1e1e", fg="white",
-                 font=("Segoe UI", FONT_SIZE)).pack(anchor="w", padx=10, pady=(10, 0))
+                 font=self.fonts["base"]).pack(anchor="w", padx=10, pady=(10, 0))
         pos_btn = ttk.Button(dlg, text="Должность", style="Blue.TButton")
         pos_btn.pack(fill="x", padx=10)
 
         tk.Label(dlg, text="ФИО", bg="#1e1e1e", fg="white",
-                 font=("Segoe UI", FONT_SIZE)).pack(anchor="w", padx=10, pady=(10, 0))
-        fio_ent = tk.Entry(dlg, font=("Segoe UI", FONT_SIZE), bg="#2a2a2a", fg="white",
+                 font=self.fonts["base"]).pack(anchor="w", padx=10, pady=(10, 0))
+        fio_ent = tk.Entry(dlg, font=self.fonts["base"], bg="#2a2a2a", fg="white",
                            insertbackground="white", highlightthickness=1,
                            highlightbackground="#4a4a4a", relief="flat")
         fio_ent.pack(fill="x", padx=10)
 
         tk.Label(dlg, text="Время прибытия", bg="#1e1e1e", fg="white",
-                 font=("Segoe UI", FONT_SIZE)).pack(anchor="w", padx=10, pady=(10, 0))
+                 font=self.fonts["base"]).pack(anchor="w", padx=10, pady=(10, 0))
         arr_btn = ttk.Button(dlg, text="ч+", style="Blue.TButton")
         arr_btn.pack(fill="x", padx=10, pady=(0, 10))
 
         btn_frame = ttk.Frame(dlg)
         btn_frame.pack(fill="x", padx=10, pady=(0, 10))
 
-        def submit():
+        def submit(event=None):
             fio = fio_ent.get().strip()
             if not fio:
                 return
@@ -441,92 +678,212 @@ class App(tk.Tk):
                 pos_val = POSITIONS[0]
             if arr_val == "ч+":
                 arr_val = ARRIVAL_TIMES[0]
+            self.hide_add_dialog()
             self.add_row_values(pos_val, fio, arr_val, "Присутствует")
-            dlg.destroy()
 
         ttk.Button(btn_frame, text="Добавить", command=submit, style="Green.TButton").pack(side="left", fill="x", expand=True)
-        ttk.Button(btn_frame, text="Отмена", command=dlg.destroy, style="Red.TButton").pack(side="left", fill="x", expand=True, padx=(10, 0))
-
-        fio_ent.focus_set()
-        dlg.update_idletasks()
-        w = dlg.winfo_width()
-        h = dlg.winfo_height()
-        x = (dlg.winfo_screenwidth() // 2) - (w // 2)
-        y = (dlg.winfo_screenheight() // 2) - (h // 2)
-        dlg.geometry(f"{w}x{h}+{x}+{y}")
+        ttk.Button(btn_frame, text="Отмена", command=self.hide_add_dialog, style="Red.TButton").pack(side="left", fill="x", expand=True, padx=(10, 0))
 
         def open_pos_menu():
             bx = pos_btn.winfo_rootx()
             by = pos_btn.winfo_rooty() + pos_btn.winfo_height()
             self.open_selector(POSITIONS, bx, by, pos_btn.winfo_width(),
                                lambda v: (pos_btn.config(text=v), fio_ent.focus_set()),
-                               parent=dlg, modal=True)
+                               parent=dlg, modal=True, current=pos_btn.cget("text"))
 
         def open_arr_menu():
             bx = arr_btn.winfo_rootx()
             by = arr_btn.winfo_rooty() + arr_btn.winfo_height()
             self.open_selector(ARRIVAL_TIMES, bx, by, arr_btn.winfo_width(),
                                lambda v: (arr_btn.config(text=v), fio_ent.focus_set()),
-                               parent=dlg, modal=True)
+                               parent=dlg, modal=True, current=arr_btn.cget("text"))
 
         pos_btn.config(command=open_pos_menu)
         arr_btn.config(command=open_arr_menu)
+        fio_ent.bind("<Return>", submit)
+        dlg.bind("<Escape>", lambda e: self.hide_add_dialog())
+        dlg.protocol("WM_DELETE_WINDOW", self.hide_add_dialog)
+
+        # Размер меряется один раз, при постройке, а не при каждом открытии
+        dlg.update_idletasks()
+        w, h = dlg.winfo_reqwidth(), dlg.winfo_reqheight()
+        x = (dlg.winfo_screenwidth() // 2) - (w // 2)
+        y = (dlg.winfo_screenheight() // 2) - (h // 2)
+        dlg.geometry(f"{w}x{h}+{x}+{y}")
+        self.add_dlg = {"win": dlg, "pos": pos_btn, "fio": fio_ent, "arr": arr_btn}
+
+    def open_add_dialog(self):
+        if self.add_dlg is None:
+            self.build_add_dialog()
+        d = self.add_dlg
+        d["pos"].config(text="Должность")
+        d["arr"].config(text="ч+")
+        d["fio"].delete(0, tk.END)
+        d["win"].deiconify()
+        d["win"].lift()
+        try:
+            d["win"].grab_set()
+        except tk.TclError:
+            pass
+        d["fio"].focus_set()
+
+    def hide_add_dialog(self):
+        d = self.add_dlg
+        if d is None:
+            return
+        self.destroy_editor()  # список выбора диалога, если открыт
+        d["win"].grab_release()
+        d["win"].withdraw()
 
     def delete_row(self):
-        sel = self.tree.selection()
+        sel = self.table.selection()
         if not sel: return
-        item = sel[0]
-        self.tree.delete(item)
-        del self.rows[item]
-        self.update_numbers()
+        pid = sel[0]
+        before = self.roster.to_record(self.roster.people[pid])
+        self.log({"op": "del", "id": pid}, restore([before]))
+        self.roster.remove(pid)
+        self.table.forget([pid])
+        self.table.render()
         self.update_counters()
-        self.save_data()
 
     def import_excel(self):
+        if self.import_job:
+            return
         file = filedialog.askopenfilename(filetypes=[("Excel","*.xlsx *.xls")])
         if not file: return
+        # Файл читается в рабочем потоке, строки приходят в UI пачками через after()
+        job = {"queue": queue.Queue(maxsize=8), "cancel": threading.Event(),
+               "names": [], "seen": Counter(), "read": 0, "skipped": 0}
+        self.import_job = job
+
+        def worker():
+            try:
+                for chunk, done, total in read_names(file):
+                    if job["cancel"].is_set():
+                        return
+                    job["queue"].put(("rows", chunk, done, total))
+                job["queue"].put(("done",))
+            except Exception as e:
+                job["queue"].put(("error", str(e)))
+
+        self.open_import_progress()
+        threading.Thread(target=worker, daemon=True).start()
+        self.after(50, self.poll_import)
+
+    def open_import_progress(self):
+        job = self.import_job
+        dlg = tk.Toplevel(self)
+        dlg.title("Импорт")
+        dlg.configure(bg="#1e1e1e")
+        dlg.transient(self)
+        dlg.grab_set()
+        dlg.protocol("WM_DELETE_WINDOW", self.cancel_import)
+        job["label"] = ttk.Label(dlg, text="Чтение файла...")
+        job["label"].pack(anchor="w", padx=10, pady=(10, 5))
+        job["bar"] = ttk.Progressbar(dlg, length=400, mode="indeterminate")
+        job["bar"].pack(fill="x", padx=10)
+        job["bar"].start(20)
+        ttk.Button(dlg, text="Отмена", command=self.cancel_import,
+                   style="Red.TButton").pack(fill="x", padx=10, pady=10)
+        job["dlg"] = dlg
+
+    def poll_import(self):
+        job = self.import_job
+        if job is None:
+            return
         try:
-            df = pd.read_excel(file)
-            if df.empty or len(df.columns) == 0:
-                messagebox.showerror("Ошибка", "Файл Excel пустой или не содержит данных")
-                return
-            imported_count = 0
-            for name in df.iloc[:, 0].dropna():
-                fio = str(name).strip()
-                if not fio:
-                    continue
-                item = self.tree.insert("", "end",
-                    values=("", "Неизвестно", fio,
-                            ARRIVAL_TIMES[0], "", "", "Присутствует"))
-                self.rows[item] = {
-                    "fio": fio,
-                    "arrival": 1,
-                    "fact": None,
-                    "status": "Присутствует"
-                }
-                imported_count += 1
-            self.sort_table()
-            self.update_numbers()
-            self.update_counters()
-            self.save_data()
-            messagebox.showinfo("Импорт завершен", f"Импортировано ФИО: {imported_count}")
-        except Exception as e:
-            messagebox.showerror("Ошибка", f"Не удалось загрузить файл:\n{str(e)}")
+            msg = job["queue"].get_nowait()
+        except queue.Empty:
+            self.after(50, self.poll_import)
+            return
+        if msg[0] == "error":
+            self.close_import()
+            messagebox.showerror("Ошибка", f"Не удалось загрузить файл:\n{msg[1]}")
+            return
+        if msg[0] == "done":
+            self.finish_import()
+            return
+        _, chunk, done, total = msg
+        seen = job["seen"]
+        for fio in chunk:
+            # Повторный импорт того же файла не создаёт дубликатов: пропускается
+            # столько повторов имени, сколько было в списке, тёзки из файла добавляются
+            seen[fio.lower()] += 1
+            if seen[fio.lower()] <= len(self.roster.find_fio(fio)):
+                job["skipped"] += 1
+                continue
+            # В список строки попадают только в finish_import
+            job["names"].append(fio)
+        job["read"] = done
+        if total:
+            if str(job["bar"]["mode"]) != "determinate":
+                job["bar"].stop()
+                job["bar"].config(mode="determinate", maximum=total)
+            job["bar"]["value"] = done
+        job["label"].config(text=f"Прочитано строк: {done}" + (f" из {total}" if total else ""))
+        self.after(1, self.poll_import)
+
+    def cancel_import(self):
+        if self.import_job:
+            self.close_import()
+
+    def close_import(self):
+        job = self.import_job
+        self.import_job = None
+        job["cancel"].set()
+        # Освобождаем рабочий поток, если он ждёт места в очереди
+        while True:
+            try:
+                job["queue"].get_nowait()
+            except queue.Empty:
+                break
+        job["dlg"].destroy()
+        # Сканер в режиме клавиатуры не опрашивается по таймеру: сканы, пришедшие
+        # за время импорта, разбираем сразу, а не со следующим сканом
+        self.process_scans()
+        return job
+
+    def finish_import(self):
+        job = self.close_import()
+        if not job["read"]:
+            messagebox.showerror("Ошибка", "Файл Excel пустой или не содержит данных")
+            return
+        # Добавление, отрисовка, счётчики и сохранение — один раз на весь импорт
+        added = [self.roster.add(POSITIONS[0], fio, ARRIVAL_TIMES[0], keep_order=False).id
+                 for fio in job["names"]]
+        self.roster.sort()
+        self.table.render()
+        self.update_counters()
+        if added:
+            # Одной пачкой через log: уходит на сервер синхронизации и отменяется одним шагом
+            undo = delete(added) if self.undo.fits(2 * len(added)) else None
+            if undo is None:
+                self.undo.clear()
+            people = self.roster.people
+            self.log(batch([{"op": "row", "row": self.roster.to_record(people[pid])} for pid in added]), undo)
+        # Снимок заменяет запись пачки в журнал
+        self.save_data()
+        msg = f"Импортировано ФИО: {len(added)}"
+        if job["skipped"]:
+            msg += f"\nПропущено (уже в списке): {job['skipped']}"
+        messagebox.showinfo("Импорт завершен", msg)
 
     def clear_data(self):
         if not messagebox.askyesno("Очистка","Обнулить факт, опоздание и статус?"):
             return
-        for i in self.rows:
-            self.tree.set(i,"fact","")
-            self.tree.set(i,"late","")
-            self.tree.set(i,"status","Присутствует")
-            self.rows[i]["fact"]=None
-            self.rows[i]["status"]="Присутствует"
-            self.tree.item(i,tags=())
-        self.start_time=None
-        self.start_lbl.config(text="Время запуска: ---")
+        self.archive_session()
+        # Для отмены хватает времени запуска и строк, где был факт или не тот статус
+        touched = [self.roster.to_record(p) for p in self.roster if p.fact or p.status != PRESENT]
+        undo = None
+        if self.undo.fits(len(touched)):
+            undo = batch([{"op": "start", "start": iso(self.roster.start_time)}, restore(touched)])
+        else:
+            self.undo.clear()
+        self.roster.reset()
+        self.table.render()
+        self.show_start_time()
         self.update_counters()
-        self.save_data()
+        self.log({"op": "clear"}, undo)
 
     def on_tree_double_click(self, event):
         item = self.tree.identify_row(event.y)
@@ -535,23 +892,13 @@ class App(tk.Tk):
         self.mark_arrival(item)
 
     def mark_arrival(self, item):
-        if not self.start_time:
-            return
-        if self.rows[item]["fact"] is not None:
-            return
-        if self.rows[item]["status"] != "Присутствует":
+        p = self.person(item)
+        before = self.roster.to_record(p)
+        if not self.roster.mark(p.id):
             return
-        now = datetime.now()
-        self.rows[item]["fact"] = now
-        self.tree.set(item, "fact", now.strftime("%H:%M"))
-        expected = self.start_time + timedelta(hours=self.rows[item]["arrival"])
-        late = now - expected
-        if late.total_seconds() < 0:
-            late = timedelta(0)
-        self.tree.set(item, "late", self.format_timedelta(late))
-        self.apply_color(item)
+        self.refresh_row(p)
         self.update_counters()
-        self.save_data()
+        self.log_row(p, before)
 
     def start_combo_edit(self, item, col, col_id, values):
         self.destroy_editor()
@@ -561,89 +908,44 @@ class App(tk.Tk):
         abs_x = self.tree.winfo_rootx() + x
         abs_y = self.tree.winfo_rooty() + y + h
         self.open_selector(values, abs_x, abs_y, w,
-                           lambda v: self.commit_combo(item, col_id, v))
-
-    def open_selector(self, values, x, y, width, on_select, parent=None, modal=False):
+                           lambda v: self.commit_combo(item, col_id, v),
+                           current=getattr(self.person(item), col_id))
+
+    def selector(self, values, slot=None):
+        # Один готовый список на набор значений; строится при первом открытии.
+        # slot — для меняющихся наборов: одно окно, значения обновляются
+        key = tuple(values) if slot is None else slot
+        sel = self.selectors.get(key)
+        if sel is None:
+            sel = self.selectors[key] = Selector(self, values, self.fonts["combo"])
+        elif slot is not None:
+            sel.set_values(values)
+        return sel
+
+    def prebuild_selectors(self):
+        for values in (POSITIONS, ARRIVAL_TIMES, STATUSES, self.export_menu_values(), EXPORT_FORMATS):
+            self.selector(values)
+
+    def open_selector(self, values, x, y, width, on_select, parent=None, modal=False, current=None,
+                      slot=None):
         self.destroy_editor()
-        popup_parent = parent if parent else self
-        popup = tk.Toplevel(popup_parent)
-        popup.overrideredirect(True)
-        popup.attributes("-topmost", True)
-        popup.configure(bg="#1e1e1e")
-        item_h = 32
-        height = item_h * len(values) + 2
-        width_px = max(200, width)
-        # Подгоняем по экрану
-        screen_h = popup.winfo_screenheight()
-        screen_w = popup.winfo_screenwidth()
-        if y + height > screen_h:
-            y = max(0, y - height)
-        if x + width_px > screen_w:
-            x = max(0, screen_w - width_px)
-        popup.geometry(f"{width_px}x{height}+{x}+{y}")
-        popup.update_idletasks()
-        popup.attributes("-topmost", True)
-        if parent:
-            popup.transient(parent)
-        if modal:
-            try:
-                self.prev_grab = popup.grab_current()
-                if self.prev_grab:
-                    self.prev_grab.grab_release()
-                popup.grab_set()
-            except Exception:
-                self.prev_grab = None
-        popup.lift()
-        popup.focus_force()
-
-        container = tk.Frame(popup, bg="#1f1f1f", highlightthickness=1, highlightbackground="#4a4a4a")
-        container.pack(fill="both", expand=True)
-
-        def make_row(text):
-            row = tk.Frame(container, bg="#1f1f1f", height=item_h)
-            row.pack_propagate(False)
-            row.pack(fill="x")
-            lbl = tk.Label(row, text=text, bg="#1f1f1f", fg="white",
-                           font=("Segoe UI", COMBO_FONT_SIZE), anchor="w", padx=10)
-            lbl.pack(fill="both", expand=True)
-            sep = tk.Frame(container, bg="#3a3a3a", height=1)
-            sep.pack(fill="x")
-
-            def set_hover(on):
-                color = "#5a5a5a" if on else "#1f1f1f"
-                row.configure(bg=color)
-                lbl.configure(bg=color)
-
-            def choose():
-                on_select(text)
-                self.destroy_editor()
-
-            row.bind("<Enter>", lambda e: set_hover(True))
-            row.bind("<Leave>", lambda e: set_hover(False))
-            lbl.bind("<Enter>", lambda e: set_hover(True))
-            lbl.bind("<Leave>", lambda e: set_hover(False))
-            row.bind("<ButtonRelease-1>", lambda e: choose())
-            lbl.bind("<ButtonRelease-1>", lambda e: choose())
-            return row
-
-        for v in values:
-            make_row(v)
-
-        popup.bind("<Escape>", lambda e: self.destroy_editor())
-        popup.focus_set()
-        self.edit_widget = container
-        self.edit_popup = popup
+        sel = self.selector(values, slot)
+        sel.show(x, y, width, on_select, parent, modal, current)
+        self.edit_popup = sel
+        if self.profiler.enabled:
+            # Открытие вместе с отрисовкой списка, отдельно от всего обработчика
+            self.profiler.record("selector_show", sel.open_ms, None)
 
     def start_text_edit(self, item, col, col_id):
         self.destroy_editor()
         x, y, w, h = self.tree.bbox(item, col)
         if w <= 0:
             return
-        ent = tk.Entry(self.tree, font=("Segoe UI", FONT_SIZE), bg="#3a3a3a", fg="white",
+        ent = tk.Entry(self.tree, font=self.fonts["base"], bg="#3a3a3a", fg="white",
                        insertbackground="white", highlightthickness=1,
                        highlightbackground="#555555", relief="flat")
         ent.place(x=x, y=y, width=w, height=h)
-        ent.insert(0, self.tree.set(item, col_id))
+        ent.insert(0, self.person(item).fio)
         ent.select_range(0, tk.END)
         ent.bind("<Return>", lambda e: self.commit_text(item, col_id, ent.get()))
         ent.bind("<FocusOut>", lambda e: self.commit_text(item, col_id, ent.get()))
@@ -658,244 +960,960 @@ class App(tk.Tk):
             finally:
                 self.edit_widget = None
         if getattr(self, "edit_popup", None):
-            try:
-                try:
-                    self.edit_popup.grab_release()
-                except Exception:
-                    pass
-                self.edit_popup.destroy()
-            finally:
-                self.edit_popup = None
-        if getattr(self, "prev_grab", None):
-            try:
-                self.prev_grab.grab_set()
-            except Exception:
-                pass
-            self.prev_grab = None
+            self.edit_popup.hide()
+            self.edit_popup = None
 
     def commit_combo(self, item, col_id, value):
         self.destroy_editor()
-        if not self.tree.exists(item):
+        if int(item) not in self.roster.people:
             return
-        self.tree.set(item, col_id, value)
+        p = self.person(item)
+        before = self.roster.to_record(p)
         if col_id == "pos":
-            pass
+            self.roster.set_pos(p.id, value)
         elif col_id == "arr":
-            self.rows[item]["arrival"] = parse_hours(value)
+            self.roster.set_arrival(p.id, value)
         elif col_id == "status":
-            self.rows[item]["status"] = value
-        self.apply_color(item)
+            self.roster.set_status(p.id, value)
+        self.refresh_row(p)
         self.update_counters()
-        self.save_data()
+        self.log_row(p, before)
 
     def commit_text(self, item, col_id, value):
         self.destroy_editor()
-        if not self.tree.exists(item):
+        if int(item) not in self.roster.people:
             return
         value = value.strip()
         if not value:
             return
-        self.tree.set(item, col_id, value)
+        p = self.person(item)
+        before = self.roster.to_record(p)
         if col_id == "fio":
-            self.rows[item]["fio"] = value
-        self.sort_table()
-        self.update_numbers()
-        self.update_counters()
-        self.save_data()
+            self.roster.rename(p.id, value)
+        self.table.render()
+        self.log_row(p, before)
 
-    def apply_color(self, item):
-        status = self.rows[item]["status"]
-        late_text = self.tree.set(item,"late")
-        if status != "Присутствует":
-            self.tree.item(item, tags=("other",))
-        elif late_text and late_text != "00:00":
-            self.tree.item(item, tags=("late",))
-        elif self.rows[item]["fact"]:
-            self.tree.item(item, tags=("ontime",))
-        else:
-            self.tree.item(item, tags=())
-
-    def sort_table(self):
-        items = list(self.tree.get_children())
-        items.sort(key=lambda i: self.tree.set(i,"fio").lower())
-        for i in items:
-            self.tree.move(i, "", "end")
-
-    def update_numbers(self):
-        for idx, item in enumerate(self.tree.get_children(), start=1):
-            self.tree.set(item, "num", idx)
-
-    def update_chart(self, total, present, sick, trip):
-        self.chart.delete("all")
+    def update_chart(self, total, late, other, ontime):
+        # Столбцы и подписи создаются один раз, дальше двигаем их через coords;
+        # при тех же числах холст не трогаем вовсе
         max_h = 150
-        w = int(self.chart.winfo_width() or 320)
         pad = 10
         bar_w = 40
         gap = 12
-        x = pad
-
-        show_stats = self.start_time is not None
-
-        def bar(count, color, label=None):
-            nonlocal x
-            height = int((count / total) * max_h) if total else 0
-            y0 = max_h - height + 10
-            y1 = max_h + 10
-            self.chart.create_rectangle(x, y0, x + bar_w, y1, fill=color, outline="")
-            if label:
-                self.chart.create_text(x + bar_w / 2, y1 + 12, text=label, fill="white", font=("Segoe UI", 10))
-            x += bar_w + gap
-
-        # Всего всегда активно
-        bar(total, "#d6b400", "Всего")
-
-        if show_stats:
-            late = sum(1 for i, r in self.rows.items()
-                       if r["status"] == "Присутствует"
-                       and r["fact"]
-                       and self.tree.set(i, "late") not in ("", "00:00"))
-            ontime = sum(1 for i, r in self.rows.items()
-                         if r["status"] == "Присутствует"
-                         and r["fact"]
-                         and self.tree.set(i, "late") in ("", "00:00"))
-            blue_total = sick + trip
-            bar(late, "#aa2222")
-            bar(blue_total, "#2255aa")
-            bar(ontime, "#1e8f3a")
-        else:
-            bar(0, "#aa2222")
-            bar(0, "#2255aa")
-            bar(0, "#1e8f3a")
+        if not self.chart_bars:
+            colors = ["#d6b400", "#aa2222", "#2255aa", "#1e8f3a"]
+            for n, color in enumerate(colors):
+                x = pad + n * (bar_w + gap)
+                self.chart_bars.append(self.chart.create_rectangle(
+                    x, max_h + 10, x + bar_w, max_h + 10, fill=color, outline=""))
+                self.chart_counts.append(self.chart.create_text(
+                    x + bar_w / 2, max_h + 36, text="", fill="white", font=self.fonts["small"]))
+            self.chart.create_text(pad + bar_w / 2, max_h + 22, text="Всего",
+                                   fill="white", font=self.fonts["small"])
+
+        show_stats = self.roster.start_time is not None
+        if not show_stats:
+            late = other = ontime = 0
+        values = (total, late, other, ontime)
+        if values != self.chart_values:
+            self.chart_values = values
+            for n, count in enumerate(values):
+                height = int((count / total) * max_h) if total else 0
+                x = pad + n * (bar_w + gap)
+                self.chart.coords(self.chart_bars[n], x, max_h - height + 10, x + bar_w, max_h + 10)
+                self.chart.itemconfig(self.chart_counts[n], text=str(count))
+        if self.curve_job is None:
+            self.curve_job = self.after(CURVE_DELAY, self.update_curve)
+
+    def update_curve(self):
+        # Накопленный процент прибытия под столбцами; считается в analytics (NumPy)
+        self.curve_job = None
+        top, bottom, left, right = 200, 280, 10, 310
+        if self.chart_curve is None:
+            self.chart.create_rectangle(left, top, right, bottom, outline="#4a4a4a")
+            self.chart_curve = self.chart.create_line(left, bottom, right, bottom,
+                                                      fill="#1e8f3a", width=2)
+            self.chart_curve_lbl = self.chart.create_text(left, bottom + 10, anchor="w", fill="white",
+                                                          font=self.fonts["small"], text="")
+        if self.roster.start_time is None:
+            self.chart.coords(self.chart_curve, left, bottom, right, bottom)
+            self.chart.itemconfig(self.chart_curve_lbl, text="")
+            return
+        try:
+            from analytics import Curve  # numpy грузится после показа окна
+        except ImportError:
+            return
+        stats = Curve.from_roster(self.roster)
+        t, pct = stats.curve(CURVE_POINTS)
+        span = t[-1]
+        points = []
+        for minute, value in zip(t, pct):
+            points += [left + minute / span * (right - left), bottom - value / 100 * (bottom - top)]
+        self.chart.coords(self.chart_curve, *points)
+        p50, p90 = stats.percentiles((50, 90))
+        text = f"0–{span:.0f} мин"
+        if p50 is not None:
+            text += f"   p50 {p50:.0f} мин   p90 {p90:.0f} мин"
+        self.chart.itemconfig(self.chart_curve_lbl, text=text)
 
     def update_counters(self):
-        total = len(self.rows)
-        present = sum(1 for r in self.rows.values() if r["status"]=="Присутствует")
-        sick = sum(1 for r in self.rows.values() if r["status"]=="Болен")
-        trip = sum(1 for r in self.rows.values() if r["status"]=="Командировка")
-        arrived = sum(1 for r in self.rows.values() if r["status"]=="Присутствует" and r["fact"])
+        c = self.roster.counts
+        total = c["total"]
+        present = c["Присутствует"]
+        sick = c["Болен"]
+        trip = c["Командировка"]
+        arrived = c["arrived"]
         percent = (arrived/present*100) if present else 0
 
         def pct(n):
             return (n/total*100) if total else 0
 
-        self.total_lbl.config(text=f"Всего по списку: {total}")
-        self.present_lbl.config(text=f"Присутствует: {present} ({pct(present):.1f}%)")
-        self.sick_lbl.config(text=f"Болен: {sick} ({pct(sick):.1f}%)")
-        self.trip_lbl.config(text=f"Командировка: {trip} ({pct(trip):.1f}%)")
-        self.arrived_lbl.config(text=f"Пришли: {arrived}")
-        self.percent_lbl.config(text=f"Процент прибытия: {percent:.1f}%")
-        self.update_chart(total, present, sick, trip)
+        texts = (f"Всего по списку: {total}",
+                 f"Присутствует: {present} ({pct(present):.1f}%)",
+                 f"Болен: {sick} ({pct(sick):.1f}%)",
+                 f"Командировка: {trip} ({pct(trip):.1f}%)",
+                 f"Пришли: {arrived}",
+                 f"Не пришли в срок: {len(self.roster.overdue)}",
+                 f"Процент прибытия: {percent:.1f}%")
+        # Перенастраиваются только изменившиеся подписи: каждая config — пересчёт геометрии
+        for lbl, text, old in zip(self.counter_lbls, texts, self.counter_texts):
+            if text != old:
+                lbl.config(text=text)
+        self.counter_texts = texts
+        self.update_chart(total, c["late"], sick + trip, c["ontime"])
+        self.schedule_deadline()
+
+    # ====== Сроки прибытия ======
+    # Один таймер на ближайший срок: когда он наступает, перекрашиваются
+    # только строки, у которых срок только что прошёл
+    def schedule_deadline(self):
+        when = self.roster.next_deadline()
+        if when == self.deadline_at and (when is None or self.deadline_job):
+            return
+        if self.deadline_job:
+            self.after_cancel(self.deadline_job)
+            self.deadline_job = None
+        self.deadline_at = when
+        if when is None:
+            return
+        delay = int((when - datetime.now()).total_seconds() * 1000)
+        self.deadline_job = self.after(max(0, min(delay, DEADLINE_MAX_WAIT)), self.on_deadline)
+
+    def on_deadline(self):
+        self.deadline_job = None
+        self.deadline_at = None
+        due = self.roster.advance(datetime.now())
+        people = self.roster.people
+        for pid in due:
+            self.table.refresh(people[pid])
+        # update_counters заводит таймер на следующий срок
+        self.update_counters()
 
     def on_select(self, event):
         if self.suppress_select:
             return
-        sel = self.tree.selection()
+        self.table.sync_selection()
+        sel = self.table.selection()
         if not sel: return
-        item = sel[0]
-        self.current_item = item
+        self.current_item = str(sel[0])
+
+    # ====== Сканер пропусков ======
+    def on_scan_entry(self, event=None):
+        badge = self.scan_ent.get().strip()
+        self.scan_ent.delete(0, "end")
+        if badge:
+            self.scan_queue.put((badge, time.perf_counter()))
+            self.process_scans()
+        return "break"
+
+    def start_scanner(self, source):
+        try:
+            f = sys.stdin if source == "stdin" else open(source, "r", encoding="utf8", errors="replace")
+        except OSError as e:
+            messagebox.showerror("Сканер", f"Не удалось открыть {source}: {e}")
+            return
+
+        def reader():
+            for line in f:
+                badge = line.strip()
+                if badge:
+                    self.scan_queue.put((badge, time.perf_counter()))
+
+        threading.Thread(target=reader, daemon=True).start()
+        self.after(SCAN_POLL, self.poll_scans)
+
+    def poll_scans(self):
+        self.process_scans()
+        self.after(SCAN_POLL, self.poll_scans)
+
+    def process_scans(self):
+        while True:
+            try:
+                badge, t0 = self.scan_queue.get_nowait()
+            except queue.Empty:
+                break
+            self.handle_scan(badge, t0)
+
+    def bind_badge(self):
+        sel = self.table.selection()
+        if len(sel) != 1:
+            messagebox.showwarning("Пропуск", "Выберите одну строку")
+            return
+        self.badge_target = sel[0]
+        self.scan_lbl.config(text=f"Отсканируйте пропуск: {self.roster.people[sel[0]].fio}",
+                             foreground="#d6b400")
+        self.scan_ent.focus_set()
+
+    def handle_scan(self, badge, t0):
+        people = self.roster.people
+        if self.badge_target is not None:
+            pid, self.badge_target = self.badge_target, None
+            if pid not in people:
+                return
+            owner = self.roster.find_badge(badge)
+            before = self.roster.to_record(people[pid])
+            if not self.roster.set_badge(pid, badge):
+                self.scan_lbl.config(text=f"Пропуск {badge} уже у: {people[owner].fio}", foreground="red")
+                return
+            self.log_row(people[pid], before)
+            self.scan_lbl.config(text=f"Пропуск {badge} привязан: {people[pid].fio}", foreground="#888888")
+            return
+        pid = self.roster.find_badge(badge)
+        if pid is None:
+            self.scan_lbl.config(text=f"Пропуск {badge} не найден", foreground="red")
+            return
+        p = people[pid]
+        self.table.see(pid)
+        self.table.select([pid])
+        if not self.roster.start_time:
+            self.scan_lbl.config(text=f"{p.fio}: не нажат ЗАПУСК", foreground="red")
+        elif p.status != PRESENT:
+            self.scan_lbl.config(text=f"{p.fio}: {p.status}", foreground="red")
+        elif p.fact:
+            self.scan_lbl.config(text=f"{p.fio}: уже отмечен в {p.fact.strftime('%H:%M')}",
+                                 foreground="#d6b400")
+        else:
+            self.mark_arrival(str(pid))
+            self.update_idletasks()  # строка перекрашена на экране
+            ms = (time.perf_counter() - t0) * 1000
+            self.scan_latency.append(ms)
+            p95 = sorted(self.scan_latency)[int(len(self.scan_latency) * 0.95)]
+            self.scan_lbl.config(text=f"{p.fio} — {ms:.0f} мс (p95 {p95:.0f} мс)", foreground="#888888")
+        self.scan_ent.focus_set()
+
+    # ====== Турникеты ======
+    def load_turnstile_log(self):
+        if self.turnstile_job:
+            if messagebox.askyesno("Турникеты", "Остановить приём событий турникетов?"):
+                self.stop_turnstile()
+            return
+        if not self.roster.start_time:
+            messagebox.showwarning("Турникеты", "Сначала нажмите ЗАПУСК")
+            return
+        file = filedialog.askopenfilename(filetypes=[("Журнал доступа", "*.csv *.txt *.log"),
+                                                     ("Все файлы", "*.*")])
+        if file:
+            self.start_turnstile(file)
+
+    def start_turnstile(self, source, live=False):
+        # Строки читаются и разбираются в рабочем потоке, в UI приходят пачки
+        # событий; live — дописываемый файл или порт, иначе файл целиком
+        stop = threading.Event()
+        if live and source.isdigit():
+            lines = listen(int(source), stop)
+        elif live:
+            lines = follow(source, stop)
+        else:
+            lines = read_log(source)
+        day = (self.roster.start_time or datetime.now()).date()
+        ingest = Ingest(self.roster, self.rosters.active)
+        job = {"queue": queue.Queue(maxsize=8), "stop": stop, "ingest": ingest,
+               "live": live, "source": source}
+        self.turnstile_job = job
+
+        def put(msg):
+            # Очередь ограничена: чтение ждёт UI и не держит журнал в памяти
+            while not stop.is_set():
+                try:
+                    job["queue"].put(msg, timeout=TURNSTILE_POLL / 1000)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def worker():
+            try:
+                for chunk in chunks(lines, day, stats=ingest.stats):
+                    if not put(("events", chunk)):
+                        return
+                put(("done",))
+            except Exception as e:
+                put(("error", str(e)))
+
+        threading.Thread(target=worker, daemon=True).start()
+        self.turnstile_lbl.config(text=f"Турникеты: {source}", foreground="#d6b400")
+        self.after(TURNSTILE_POLL, self.poll_turnstile)
+
+    def stop_turnstile(self):
+        job = self.turnstile_job
+        if job is None:
+            return
+        self.turnstile_job = None
+        job["stop"].set()
+        self.show_turnstile_stats(job, "остановлен")
+
+    def poll_turnstile(self):
+        job = self.turnstile_job
+        if job is None:
+            return
+        try:
+            msg = job["queue"].get_nowait()
+        except queue.Empty:
+            self.after(TURNSTILE_POLL, self.poll_turnstile)
+            return
+        if msg[0] == "events":
+            try:
+                changed = job["ingest"].apply(msg[1], self.rosters.active)
+            except ValueError as e:
+                # Пачка для другого списка: приём останавливается, модель не трогаем
+                self.stop_turnstile()
+                messagebox.showerror("Турникеты", str(e))
+                return
+            people = self.roster.people
+            # Одна перерисовка, пересчёт счётчиков и запись журнала на пачку
+            self.commit_batch([{"op": "row", "row": self.roster.to_record(people[pid])} for pid in changed],
+                              None)
+            # Отмена прежних шагов не должна затирать отметки турникетов
+            self.undo.forget(changed)
+            self.show_turnstile_stats(job, "приём" if job["live"] else "загрузка")
+            self.after(1, self.poll_turnstile)
+            return
+        self.turnstile_job = None
+        if msg[0] == "error":
+            self.turnstile_lbl.config(text="Турникеты: ошибка", foreground="red")
+            messagebox.showerror("Турникеты", f"Не удалось прочитать журнал:\n{msg[1]}")
+            return
+        self.show_turnstile_stats(job, "готово")
+
+    def show_turnstile_stats(self, job, state):
+        st = job["ingest"].stats
+        text = (f"Турникеты ({state}): событий {st['events']}, отмечено {st['marked']}, "
+                f"не найдено {st['unknown'] + st['ambiguous']}, до запуска {st['early']}")
+        self.turnstile_lbl.config(text=text, foreground="#888888", wraplength=340)
 
     def search_dialog(self, event=None):
         if hasattr(self, "search_ent"):
             self.search_ent.focus_set()
             self.search_ent.select_range(0, tk.END)
 
+    def on_search_key(self, event=None):
+        # Поиск по мере ввода, с паузой, чтобы не искать на каждую букву
+        if event is not None and event.keysym in ("Return", "Escape"):
+            return
+        if self.search_job is not None:
+            self.after_cancel(self.search_job)
+        self.search_job = self.after(SEARCH_DELAY, self.search_live)
+
+    def search_live(self):
+        self.search_job = None
+        q = self.search_ent.get().strip()
+        if not q:
+            self.search_matches = []
+            self.search_index = -1
+            self.search_count_lbl.config(text="")
+            return
+        self.run_search(q)
+
+    def run_search(self, q):
+        self.search_matches = self.roster.find(q)
+        if not self.search_matches:
+            self.search_index = -1
+            self.search_count_lbl.config(text="0")
+            return False
+        self.search_index = 0
+        self.show_match()
+        return True
+
     def search_from_entry(self, event=None):
         if not hasattr(self, "search_ent"):
             return
         q = self.search_ent.get().strip()
         if not q:
             return
-        self.search_matches = [i for i in self.tree.get_children()
-                               if q.lower() in self.tree.set(i,"fio").lower()]
-        if not self.search_matches:
+        if not self.run_search(q):
             messagebox.showinfo("Поиск","Не найдено")
-            return
-        self.search_index = 0
-        item = self.search_matches[self.search_index]
-        self.tree.selection_set(item)
-        self.tree.see(item)
 
     def search_next(self):
+        q = self.search_ent.get().strip()
+        if not q:
+            return
+        # Результаты берутся из индекса заново, поэтому учитывают правки и удаления
+        self.search_matches = self.roster.find(q)
         if not self.search_matches:
-            self.search_from_entry()
+            self.search_count_lbl.config(text="0")
+            messagebox.showinfo("Поиск","Не найдено")
             return
-        self.search_index = (self.search_index + 1) % len(self.search_matches)
-        item = self.search_matches[self.search_index]
-        self.tree.selection_set(item)
-        self.tree.see(item)
+        p = self.roster.get(self.search_current)
+        if p:
+            pos = bisect_right(self.search_matches, (p.key, p.id))
+            self.search_index = pos % len(self.search_matches)
+        else:
+            self.search_index = 0
+        self.show_match()
+
+    def show_match(self):
+        _, pid = self.search_matches[self.search_index]
+        self.search_current = pid
+        self.table.see(pid)
+        self.table.select([pid])
+        self.search_count_lbl.config(text=f"{self.search_index + 1} из {len(self.search_matches)}")
 
     def export_excel(self, hours):
-        if not self.start_time:
+        self.export_reports([hours])
+
+    def export_reports(self, hours_list):
+        start_time = self.roster.start_time
+        if not start_time:
             messagebox.showerror("Ошибка","Нажмите Запуск")
             return
-        data=[]
-        present_total = 0
-        present_arrived = 0
-        end = self.start_time + timedelta(hours=hours)
-        for i,r in self.rows.items():
-            row = list(self.tree.item(i)["values"])
-            if not r["fact"]:
-                row[4] = "Еще не прибыл"
-                row[5] = ""
-            data.append(row[1:])
-            if r["status"]=="Присутствует":
-                present_total += 1
-                if r["fact"] and self.start_time <= r["fact"] <= end:
-                    present_arrived += 1
-        percent = (present_arrived/present_total*100) if present_total else 0
-        date_str = (self.start_time or datetime.now()).strftime("%Y-%m-%d")
-        header_text = f"{date_str}.прибытие ч+{hours}"
-        data = [[header_text, "", "", "", "", ""]] + data
-        df=pd.DataFrame(data,columns=["Должность","ФИО","Время прибытия","Факт","Опоздание","Статус"])
-        df.loc[len(df)] = ["","","","","",""]
-        df.loc[len(df)] = ["Процент прибытия","","","","",f"{percent:.1f}%"]
-
-        fname=f"export_{hours}h.xlsx"
-        df.to_excel(fname,index=False)
-        full_path = os.path.abspath(fname)
-        messagebox.showinfo("Готово",f"Сохранено: {full_path}")
+        if self.export_job:
+            return
+        # Файлы пишутся в фоновом потоке из снимка строк
+        rows = export_rows(self.roster)
+        fmt = self.export_format
+        job = {"result": None}
+        self.export_job = job
+
+        def worker():
+            try:
+                job["result"] = ("ok", export_reports(rows, start_time, hours_list, fmt))
+            except Exception as e:
+                job["result"] = ("error", str(e))
+
+        self.export_btn.config(text="Выгрузка...")
+        threading.Thread(target=worker, daemon=True).start()
+        self.after(100, self.poll_export)
+
+    def poll_export(self):
+        job = self.export_job
+        if job["result"] is None:
+            self.after(100, self.poll_export)
+            return
+        self.export_job = None
+        self.export_btn.config(text="Выбрать")
+        status, result = job["result"]
+        if status == "error":
+            messagebox.showerror("Ошибка", f"Не удалось выгрузить:\n{result}")
+            return
+        messagebox.showinfo("Готово", "Сохранено:\n" + "\n".join(result))
+
+    def export_menu_values(self):
+        return [f"{h} ч" for h in EXPORT_HOURS] + ["Все"]
 
     def open_export_menu(self):
-        values = [f"{h} ч" for h in [1, 1.5, 2, 2.5, 3]]
+        values = self.export_menu_values()
         bx = self.export_btn.winfo_rootx()
         by = self.export_btn.winfo_rooty() + self.export_btn.winfo_height()
-        self.open_selector(values, bx, by, self.export_btn.winfo_width(),
-                           lambda v: self.export_excel(float(v.replace("ч", "").replace(" ", ""))))
+
+        hours = dict(zip(values, EXPORT_HOURS))
+
+        def choose(v):
+            if v == "Все":
+                self.export_reports(EXPORT_HOURS)
+            else:
+                self.export_excel(hours[v])
+
+        self.open_selector(values, bx, by, self.export_btn.winfo_width(), choose)
+
+    def open_export_format_menu(self):
+        bx = self.export_fmt_btn.winfo_rootx()
+        by = self.export_fmt_btn.winfo_rooty() + self.export_fmt_btn.winfo_height()
+
+        def choose(v):
+            self.export_format = v
+            self.export_fmt_btn.config(text=f"Формат: {v}")
+
+        self.open_selector(EXPORT_FORMATS, bx, by, self.export_fmt_btn.winfo_width(), choose,
+                           current=self.export_format)
+
+    def log(self, record, undo=None):
+        # Одна запись на изменение вместо перезаписи всего data.json.
+        # undo — обратная запись; с ней изменение попадает в журнал отмены
+        if self.sync:
+            self.sync.send(record)
+        if self.writer.append(record):
+            self.save_data()
+        self.mark_pending()
+        if undo is not None:
+            self.undo.push(record, undo)
+
+    def log_row(self, p, before):
+        # before — строка до изменения, None — строка новая
+        undo = restore([before]) if before is not None else delete([p.id])
+        self.log({"op": "row", "row": self.roster.to_record(p)}, undo)
+
+    # ====== Отмена/повтор ======
+    def undo_last(self, event=None):
+        return self.replay(self.undo.undo)
+
+    def redo_last(self, event=None):
+        return self.replay(self.undo.redo)
+
+    def replay(self, take):
+        # В полях ввода Ctrl+Z/Ctrl+Y остаются полям
+        if isinstance(self.focus_get(), (tk.Entry, ttk.Entry)):
+            return None
+        record = take()
+        if record is None:
+            return "break"
+        self.destroy_editor()
+        self.roster.apply(record)
+        self.table.forget(deleted_ids(record))
+        self.show_start_time()
+        self.table.render()
+        self.update_counters()
+        self.log(record)
+        return "break"
 
     def save_data(self):
-        data={"start": self.start_time.isoformat() if self.start_time else None,
-              "rows":[]}
-        for i,r in self.rows.items():
-            vals = list(self.tree.item(i)["values"])
-            data["rows"].append({
-                "values": vals,
-                "fact": r["fact"].isoformat() if r["fact"] else None,
-                "arrival": r["arrival"],
-                "status": r["status"]
-            })
-        with open(DATA_FILE,"w",encoding="utf8") as f:
-            json.dump(data,f,ensure_ascii=False,indent=2)
+        self.writer.save(self.roster.snapshot())
+        self.mark_pending()
+
+    def mark_pending(self):
+        # Запись идёт в фоновом потоке; метку обновляем опросом из mainloop
+        if self.save_poll is None:
+            self.save_lbl.config(text="Сохранение...", foreground="#d6b400")
+            self.save_poll = self.after(100, self.poll_saved)
+
+    def poll_saved(self):
+        # При ошибке диска несохранённое остаётся в очереди и пишется повторно
+        idle = self.writer.idle()
+        if self.writer.error:
+            self.save_lbl.config(text="Ошибка сохранения", foreground="red")
+        elif idle:
+            self.save_lbl.config(text="Сохранено", foreground="#888888")
+        if not idle:
+            self.save_poll = self.after(100, self.poll_saved)
+            return
+        self.save_poll = None
+
+    def show_start_time(self):
+        if self.roster.start_time:
+            self.start_lbl.config(text=f"Время запуска: {self.roster.start_time.strftime('%H:%M')}")
+        else:
+            self.start_lbl.config(text="Время запуска: ---")
 
     def load_data(self):
-        if not os.path.exists(DATA_FILE): return
-        with open(DATA_FILE,"r",encoding="utf8") as f:
-            data=json.load(f)
-        if data["start"]:
-            self.start_time=datetime.fromisoformat(data["start"])
-            self.start_lbl.config(text=f"Время запуска: {self.start_time.strftime('%H:%M')}")
-        for row in data["rows"]:
-            vals = list(row["values"])
-            i=self.tree.insert("", "end", values=vals)
-            self.rows[i]={ 
-                "fio": row["values"][2],
-                "arrival":row["arrival"],
-                "fact": datetime.fromisoformat(row["fact"]) if row["fact"] else None,
-                "status":row["status"]
-            }
-            self.apply_color(i)
+        data = self.journal.load()
+        self.roster.load(data)
+        # Поток записи сам сворачивает журнал в снимок, начиная с загруженных строк
+        self.writer.seed(data)
+        self.show_start_time()
+        self.table.render()
+        self.after_idle(self.start_search_index)
+        if self.journal.recovered:
+            gen, errors = self.journal.recovered
+            where = f"резервной копии №{gen}" if gen else "журнала изменений"
+            messagebox.showwarning("Восстановление",
+                                   "Файл данных повреждён, список восстановлен из " + where
+                                   + ".\n\n" + "\n".join(errors))
+        # Сворачиваем журнал в снимок, накопленный с прошлого запуска,
+        # и переписываем data.json старого формата
+        if self.journal.count or self.journal.migrate:
+            self.save_data()
+
+    def start_search_index(self):
+        # Индекс поиска строится в фоне после загрузки, чтобы первый Ctrl+F не ждал
+        if self.roster.search.ready:
+            return
+        items, token = self.roster.search_items()
+        job = {"index": None}
+
+        def worker():
+            job["index"] = build_index(items)
+
+        threading.Thread(target=worker, daemon=True).start()
+        self.after(SEARCH_INDEX_POLL, self.poll_search_index, job, token)
+
+    def poll_search_index(self, job, token):
+        if job["index"] is None:
+            self.after(SEARCH_INDEX_POLL, self.poll_search_index, job, token)
+            return
+        # Строки, изменённые за время построения, накладываются здесь
+        self.roster.install_search(job["index"], token)
+
+    # ====== Списки ======
+    def open_roster_menu(self):
+        values = self.rosters.names() + [NEW_ROSTER, DELETE_ROSTER, ROSTERS_SUMMARY]
+        bx = self.roster_btn.winfo_rootx()
+        by = self.roster_btn.winfo_rooty() + self.roster_btn.winfo_height()
+
+        def choose(v):
+            if v == NEW_ROSTER:
+                self.new_roster()
+            elif v == DELETE_ROSTER:
+                self.delete_roster_menu()
+            elif v == ROSTERS_SUMMARY:
+                self.open_rosters_summary()
+            else:
+                self.switch_roster(v)
+
+        self.open_selector(values, bx, by, self.roster_btn.winfo_width(), choose,
+                           current=self.rosters.active, slot="rosters")
+
+    def new_roster(self):
+        name = simpledialog.askstring("Новый список", "Название (подразделение, смена):", parent=self)
+        if name is None:
+            return
+        try:
+            self.rosters.create(name)
+        except (ValueError, OSError) as e:
+            messagebox.showerror("Ошибка", str(e))
+            return
+        self.switch_roster(name.strip())
+
+    def delete_roster_menu(self):
+        values = [n for n in self.rosters.names() if n != self.rosters.active]
+        if not values:
+            messagebox.showinfo("Списки", "Кроме открытого, списков нет")
+            return
+        bx = self.roster_btn.winfo_rootx()
+        by = self.roster_btn.winfo_rooty() + self.roster_btn.winfo_height()
+
+        def choose(name):
+            if not messagebox.askyesno("Удаление списка", f"Удалить список «{name}» со всеми строками?"):
+                return
+            try:
+                self.rosters.delete(name)
+            except (ValueError, OSError) as e:
+                messagebox.showerror("Ошибка", str(e))
+
+        self.open_selector(values, bx, by, self.roster_btn.winfo_width(), choose, slot="delete_roster")
+
+    def switch_roster(self, name):
+        if name == self.rosters.active or self.import_job:
+            return
+        if self.sync:
+            messagebox.showinfo("Списки", "При синхронизации станций открыт общий список сервера")
+            return
+        if self.turnstile_job:
+            # События турникетов относятся к открытому списку: чужой список они не отмечают
+            if not messagebox.askyesno("Турникеты", "Остановить приём событий турникетов и открыть другой список?"):
+                return
+            self.stop_turnstile()
+        try:
+            lock = lock_data(self.rosters.file(name))
+        except OSError as e:
+            messagebox.showerror("Ошибка", f"Список не открыт:\n{e}")
+            return
+        self.destroy_editor()
+        # Уходящий список не пересобирается: дописываем журнал и запоминаем итоги
+        self.writer.stop(SAVE_FLUSH_TIMEOUT)
+        self.rosters.remember(self.rosters.active, self.roster)
+        self.data_lock.close()
+        self.data_lock = lock
+        self.rosters.active = name
+        try:
+            self.rosters.save()
+        except OSError:
+            pass
+        self.journal = Journal(self.rosters.file(name))
+        self.writer = Writer(self.journal)
+        self.writer.start()
+        # Шаги отмены, пропуск для привязки и поиск относятся к прежнему списку
+        self.undo.clear()
+        self.badge_target = None
+        self.clear_search()
+        self.table.top = 0
+        self.load_data()
+        self.roster_btn.config(text=name)
+        self.update_counters()
+
+    def open_rosters_summary(self):
+        # Итоги неактивных списков берутся из каталога, строки не загружаются
+        dlg = tk.Toplevel(self)
+        dlg.title(ROSTERS_SUMMARY)
+        dlg.configure(bg="#1e1e1e")
+        dlg.transient(self)
+        dlg.geometry("1000x500")
+        cols = (("name", "Список", 220), ("total", "Всего", 90), ("present", "Присутствует", 130),
+                ("arrived", "Пришли", 90), ("late", "Опоздали", 100), ("percent", "Прибытие", 100),
+                ("start", "Запуск", 160))
+        tree = ttk.Treeview(dlg, columns=[c for c, _, _ in cols], show="headings")
+        for c, t, w in cols:
+            tree.heading(c, text=t)
+            tree.column(c, width=w, anchor="w" if c == "name" else "center")
+        tree.pack(fill="both", expand=True, padx=10, pady=10)
+
+        names = {}  # iid строки -> название списка
+
+        def row(name, s):
+            present = s[PRESENT]
+            percent = f"{s['arrived'] / present * 100:.1f}%" if present else "—"
+            start = from_iso(s["start"])
+            return (name, s["total"], present, s["arrived"], s["late"], percent,
+                    start.strftime("%d.%m %H:%M") if start else "---")
+
+        def fill():
+            tree.delete(*tree.get_children())
+            try:
+                totals = self.rosters.totals(self.roster)
+            except (OSError, ValueError) as e:
+                messagebox.showerror("Ошибка", f"Не удалось прочитать список:\n{e}", parent=dlg)
+                return
+            names.clear()
+            all_counts = dict.fromkeys(("total", PRESENT, "arrived", "late"), 0)
+            for name, s in totals:
+                names[tree.insert("", "end", values=row(name, s))] = name
+                for k in all_counts:
+                    all_counts[k] += s.get(k, 0)
+            tree.insert("", "end", values=row("Все списки", dict(all_counts, start=None)))
+
+        def open_roster(event=None):
+            sel = tree.selection()
+            if sel and sel[0] in names:
+                dlg.destroy()
+                self.switch_roster(names[sel[0]])
+
+        tree.bind("<Double-1>", open_roster)
+        ttk.Button(dlg, text="Обновить", command=fill).pack(side="left", padx=10, pady=(0, 10))
+        fill()
+
+    # ====== Синхронизация станций ======
+    def start_sync(self, address):
+        host, port = address.rsplit(":", 1)
+        self.sync = SyncClient(host, int(port))
+        self.sync.start()
+        self.sync_lbl.config(text="Нет связи с сервером", foreground="red")
+        self.after(SYNC_POLL, self.poll_sync)
+
+    def poll_sync(self):
+        if self.sync is None:
+            return
+        changed = False
+        snapshot = False
+        try:
+            while True:
+                msg = self.sync.inbox.get_nowait()
+                if msg[0] == "online":
+                    if msg[1]:
+                        self.sync_lbl.config(text="Связь с сервером", foreground="#888888")
+                    else:
+                        self.sync_lbl.config(text="Нет связи с сервером", foreground="red")
+                elif msg[0] == "snapshot":
+                    # Сервер главный: берём его список и досылаем поверх свои
+                    # изменения, ушедшие после запроса снимка
+                    _, data, next_id, replay = msg
+                    self.roster.load(data)
+                    self.roster.next_id = max(self.roster.next_id, next_id)
+                    for record in replay:
+                        self.roster.apply(record)
+                    self.after_idle(self.start_search_index)
+                    self.table.select([])
+                    changed = snapshot = True
+                else:
+                    record = msg[1]
+                    # Своё же изменение, вернувшееся с сервера, повторно не пишем
+                    if self.is_echo(record):
+                        continue
+                    self.roster.apply(record)
+                    if record["op"] == "del":
+                        self.table.forget([record["id"]])
+                    elif record["op"] == "batch":
+                        self.table.forget([r["id"] for r in record["records"] if r["op"] == "del"])
+                    elif record["op"] == "wipe":
+                        self.table.select([])
+                    if self.writer.append(record):
+                        self.save_data()
+                    changed = True
+        except queue.Empty:
+            pass
+        if changed:
+            self.show_start_time()
+            self.table.render()
+            self.update_counters()
+            if snapshot:
+                self.save_data()
+            else:
+                self.mark_pending()
+        self.after(SYNC_POLL, self.poll_sync)
+
+    # ====== История сессий ======
+    def archive_session(self):
+        # Только снимок в памяти; запись в SQLite идёт в фоне
+        if self.roster.start_time:
+            self.history.archive(self.roster.start_time, session_rows(self.roster), self.rosters.active)
+            self.after(HISTORY_POLL, self.poll_history)
+
+    def poll_history(self):
+        if not self.history.wait(0):
+            self.after(HISTORY_POLL, self.poll_history)
+            return
+        error = self.history.take_error()
+        if error is not None:
+            messagebox.showerror("История", f"Сессия не записана в историю:\n{error}")
+
+    def open_history(self):
+        dlg = tk.Toplevel(self)
+        roster = self.rosters.active
+        dlg.title(f"История — {roster}")
+        dlg.configure(bg="#1e1e1e")
+        dlg.transient(self)
+        dlg.geometry("1100x700")
+
+        left = ttk.Frame(dlg)
+        left.pack(side="left", fill="both", expand=True, padx=10, pady=10)
+        right = ttk.Frame(dlg)
+        right.pack(side="left", fill="both", expand=True, padx=10, pady=10)
+
+        ttk.Label(left, text="Сессии").pack(anchor="w")
+        sessions = ttk.Treeview(left, columns=("start", "total", "arrived", "late"),
+                                show="headings", height=8, selectmode="browse")
+        for c, t, w in (("start", "Запуск", 200), ("total", "Всего", 90),
+                        ("arrived", "Пришли", 90), ("late", "Опоздали", 110)):
+            sessions.heading(c, text=t)
+            sessions.column(c, width=w, anchor="center")
+        sessions.pack(fill="x")
+        curve = tk.Canvas(left, height=260, bg="#2a2a2a", highlightthickness=0)
+        curve.pack(fill="both", expand=True, pady=10)
+
+        present = {}
+        for sid, start, total, pres, arrived, late in self.history.sessions(roster=roster):
+            present[str(sid)] = pres
+            sessions.insert("", "end", iid=str(sid),
+                            values=(start.strftime("%Y-%m-%d %H:%M"), total, arrived, late))
+
+        def show_curve(event=None):
+            sel = sessions.selection()
+            curve.delete("all")
+            if not sel:
+                return
+            offsets = self.history.session_offsets(int(sel[0]))
+            total = present[sel[0]]
+            if not offsets or not total:
+                return
+            w = curve.winfo_width() - 20
+            h = curve.winfo_height() - 30
+            span = max(offsets[-1], 1)
+            # Кривая: доля пришедших к моменту t; точек не больше ширины холста
+            step = max(1, len(offsets) // max(w, 1))
+            points = [10, h + 10]
+            for k in range(0, len(offsets), step):
+                points += [10 + offsets[k] / span * w, h + 10 - (k + 1) / total * h]
+            points += [10 + w, h + 10 - len(offsets) / total * h]
+            curve.create_line(*points, fill="#1e8f3a", width=2)
+            curve.create_text(10, h + 22, anchor="w", fill="white", font=self.fonts["small"],
+                              text=f"0 — {span:.0f} мин, пришли {len(offsets) / total * 100:.1f}%")
+
+        sessions.bind("<<TreeviewSelect>>", show_curve)
+
+        ttk.Label(right, text="ФИО").pack(anchor="w")
+        fio_ent = ttk.Entry(right, font=self.fonts["base"])
+        fio_ent.pack(fill="x")
+        person = ttk.Treeview(right, columns=("date", "status", "fact", "late"),
+                              show="headings", selectmode="browse")
+        for c, t, w in (("date", "Дата", 130), ("status", "Статус", 170),
+                        ("fact", "Факт", 90), ("late", "Опоздание", 110)):
+            person.heading(c, text=t)
+            person.column(c, width=w, anchor="center")
+        person.pack(fill="both", expand=True, pady=10)
+
+        def show_person(event=None):
+            fio = fio_ent.get().strip()
+            if not fio:
+                return
+            names = self.history.find_people(fio, limit=1, roster=roster)
+            person.delete(*person.get_children())
+            if not names:
+                return
+            fio_ent.delete(0, "end")
+            fio_ent.insert(0, names[0])
+            for date, pos, status, fact, late in self.history.person_history(names[0], roster=roster):
+                person.insert("", "end", values=(
+                    date, status, fact.strftime("%H:%M") if fact else "",
+                    f"{int(late) // 60:02d}:{int(late) % 60:02d}" if late is not None else ""))
+
+        fio_ent.bind("<Return>", show_person)
+        ttk.Button(right, text="Найти", command=show_person, style="Blue.TButton").pack(fill="x")
+        if self.current_item and int(self.current_item) in self.roster.people:
+            fio_ent.insert(0, self.person(self.current_item).fio)
+            show_person()
+
+    def is_echo(self, record):
+        op = record["op"]
+        if op == "row":
+            p = self.roster.get(record["row"]["id"])
+            return p is not None and self.roster.to_record(p) == record["row"]
+        if op == "del":
+            return record["id"] not in self.roster.people
+        if op == "batch":
+            return all(self.is_echo(r) for r in record["records"])
+        return False
+
+    # ====== Замеры ======
+    def open_profiler(self, event=None):
+        dlg = tk.Toplevel(self)
+        dlg.title("Замеры обработчиков")
+        dlg.transient(self)
+        dlg.geometry("900x500")
+        cols = (("name", "Обработчик", 260), ("count", "Вызовов", 90), ("p50", "p50, мс", 90),
+                ("p99", "p99, мс", 90), ("max", "max, мс", 90), ("tcl", "Tcl/вызов", 90))
+        view = ttk.Treeview(dlg, columns=[c[0] for c in cols], show="headings")
+        for c, t, w in cols:
+            view.heading(c, text=t)
+            view.column(c, width=w, anchor="w" if c == "name" else "center")
+        view.pack(fill="both", expand=True, padx=10, pady=10)
+        bar = ttk.Frame(dlg)
+        bar.pack(fill="x", padx=10, pady=(0, 10))
+        status = ttk.Label(bar, text="")
+
+        def fill():
+            view.delete(*view.get_children())
+            for name, count, p50, p99, worst, tcl in self.profiler.stats():
+                view.insert("", "end", values=(name, count, f"{p50:.2f}", f"{p99:.2f}", f"{worst:.2f}",
+                                               "—" if tcl is None else f"{tcl:.0f}"))
+            startup = ", ".join(f"{k} {v:.0f}" for k, v in self.profiler.startup.items())
+            status.config(text=("Замер включён" if self.profiler.enabled else "Замер выключен")
+                          + (f". Запуск, мс: {startup}" if startup else ""))
+
+        def toggle():
+            self.profiler.enabled = not self.profiler.enabled
+            fill()
+
+        def reset():
+            self.profiler.reset()
+            fill()
+
+        def dump():
+            status.config(text=f"Сохранено: {self.profiler.dump()}")
+
+        ttk.Button(bar, text="Вкл/Выкл", command=toggle).pack(side="left")
+        ttk.Button(bar, text="Обновить", command=fill).pack(side="left", padx=6)
+        ttk.Button(bar, text="Сбросить", command=reset).pack(side="left")
+        ttk.Button(bar, text="Сохранить в файл", command=dump).pack(side="left", padx=6)
+        status.pack(side="left", padx=10)
+        fill()
 
     def on_close(self):
+        if self.sync:
+            self.sync.stop()
+        if self.turnstile_job:
+            self.turnstile_job["stop"].set()
         self.save_data()
+        self.writer.stop(SAVE_FLUSH_TIMEOUT)
+        self.rosters.remember(self.rosters.active, self.roster)
+        try:
+            self.rosters.save()
+        except OSError:
+            pass
+        self.data_lock.close()
+        self.history.wait(SAVE_FLUSH_TIMEOUT)
+        self.history.close()
+        if self.profiler.samples:
+            self.profiler.dump()
+        for job in (self.save_poll, self.curve_job, self.deadline_job):
+            if job is not None:
+                self.after_cancel(job)
         self.destroy()
 
 
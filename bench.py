@@ -0,0 +1,474 @@
+import argparse, itertools, json, os, platform, random, subprocess, sys, tempfile, threading, time
+from datetime import datetime, timedelta
+
+from excel_io import EXPORT_HOURS, export_reports, export_rows, read_names
+from history import session_rows
+from roster import Roster, POSITIONS, STATUSES, ARRIVAL_TIMES, PRESENT, iso
+from storage import Journal
+from sync import SyncClient, SyncServer
+from turnstile import Ingest, chunks, read_log
+
+# Замеры без окна: работают на модели Roster (то же, что делают обработчики App).
+# Запуск: python bench.py [--json results.json] [--compare old.json] [--gui] [--details]
+
+SIZES = [1_000, 10_000, 100_000]
+DETAIL_SIZES = [10_000, 100_000]
+
+
+def make_roster(n, seed=1):
+    rnd = random.Random(seed)
+    roster = Roster()
+    for k in range(n):
+        roster.add(rnd.choice(POSITIONS), f"Сотрудник {k:06d}", rnd.choice(ARRIVAL_TIMES),
+                   rnd.choices(STATUSES, weights=(90, 5, 5))[0])
+    roster.start()
+    return roster
+
+
+def full_rescan(roster):
+    # Как update_counters/update_chart до инкрементальных счётчиков
+    people = list(roster)
+    total = len(people)
+    present = sum(1 for p in people if p.status == PRESENT)
+    sick = sum(1 for p in people if p.status == "Болен")
+    trip = sum(1 for p in people if p.status == "Командировка")
+    arrived = sum(1 for p in people if p.status == PRESENT and p.fact)
+    late = sum(1 for p in people if roster.is_late(p))
+    ontime = sum(1 for p in people if roster.is_ontime(p))
+    return total, present, sick, trip, arrived, late, ontime
+
+
+def bench_click(n, clicks=200):
+    roster = make_roster(n)
+    ids = [p.id for p in roster if p.status == PRESENT][:clicks * 2]
+    now = roster.start_time + timedelta(hours=1, minutes=30)
+
+    t = time.perf_counter()
+    for pid in ids[:clicks]:
+        roster.mark(pid, now)
+        full_rescan(roster)
+    rescan = (time.perf_counter() - t) / clicks
+
+    t = time.perf_counter()
+    for pid in ids[clicks:]:
+        roster.mark(pid, now)
+        dict(roster.counts)
+    incremental = (time.perf_counter() - t) / clicks
+    return rescan, incremental
+
+
+def bench_search(n, queries=200):
+    roster = make_roster(n)
+    rnd = random.Random(2)
+    names = [f"сотрудник {rnd.randrange(n):06d}" for _ in range(queries)]
+    roster.find("")  # индекс строится при первом поиске
+
+    t = time.perf_counter()
+    for q in names:
+        [p for p in roster.sorted() if q in p.fio.lower()]
+    scan = (time.perf_counter() - t) / queries
+
+    t = time.perf_counter()
+    for q in names:
+        roster.find(q)
+    indexed = (time.perf_counter() - t) / queries
+    return scan, indexed
+
+
+def bench_scan(n, scans=1000):
+    # Путь скана без окна: номер пропуска -> строка -> отметка
+    roster = make_roster(n)
+    for p in roster:
+        roster.set_badge(p.id, f"B{p.id:08d}")
+    ids = [p.id for p in roster if p.status == PRESENT][:scans]
+    badges = [f"B{pid:08d}" for pid in ids]
+    now = roster.start_time + timedelta(hours=1)
+    t = time.perf_counter()
+    for badge in badges:
+        pid = roster.find_badge(badge)
+        roster.mark(pid, now)
+        roster.values(roster.people[pid], roster.index_of(pid) + 1)
+    return (time.perf_counter() - t) / len(badges)
+
+
+def bench_deadlines(n, ticks=60):
+    # Раз в секунду проверять всех против одного таймера на ближайший срок
+    roster = make_roster(n)
+    start = roster.start_time
+    moments = [start + timedelta(hours=1, seconds=30 * k) for k in range(ticks)]
+
+    t = time.perf_counter()
+    for now in moments:
+        [p.id for p in roster if roster._waiting(p) and roster.deadline(p) <= now]
+    rescan = (time.perf_counter() - t) / ticks
+
+    t = time.perf_counter()
+    for now in moments:
+        roster.advance(now)
+        roster.next_deadline()
+    heap = (time.perf_counter() - t) / ticks
+    return rescan, heap
+
+
+def old_snapshot(roster):
+    # Формат data.json до журнала: значения строки Treeview + поля, с отступами
+    rows = []
+    for n, p in enumerate(roster.sorted(), start=1):
+        rows.append({"values": [n] + list(roster.values(p)[1:]), "fact": iso(p.fact),
+                     "arrival": p.arrival, "status": p.status})
+    return json.dumps({"start": iso(roster.start_time), "rows": rows}, ensure_ascii=False, indent=2)
+
+
+def bench_startup(n):
+    roster = make_roster(n)
+    now = roster.start_time + timedelta(hours=1)
+    for p in list(roster)[::2]:
+        roster.mark(p.id, now)
+    with tempfile.TemporaryDirectory() as tmp:
+        old_file = os.path.join(tmp, "old.json")
+        with open(old_file, "w", encoding="utf8") as f:
+            f.write(old_snapshot(roster))
+        new_file = os.path.join(tmp, "data.json")
+        Journal(new_file).compact(roster.snapshot())
+
+        t = time.perf_counter()
+        with open(old_file, "r", encoding="utf8") as f:
+            data = json.load(f)
+        before = Roster()
+        before.load(data)
+        before.find("x")  # раньше индекс поиска строился при загрузке
+        old_time = time.perf_counter() - t
+
+        t = time.perf_counter()
+        Roster().load(Journal(new_file).load())
+        new_time = time.perf_counter() - t
+        sizes = os.path.getsize(old_file), os.path.getsize(new_file)
+    return old_time, new_time, sizes
+
+
+def bench_sync(stations, marks=2000):
+    # Отметки со всех станций сразу: время, пока каждая станция не получит все
+    roster = make_roster(stations * marks)
+    with tempfile.TemporaryDirectory() as tmp:
+        server = SyncServer(("127.0.0.1", 0), os.path.join(tmp, "server.json"))
+        server.state.rows = {p.id: roster.to_record(p) for p in roster}
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        clients = [SyncClient("127.0.0.1", server.server_address[1]) for _ in range(stations)]
+        for c in clients:
+            c.start()
+            c.inbox.get()  # online
+            c.inbox.get()  # snapshot
+        now = iso(roster.start_time + timedelta(hours=1))
+        rows = [dict(roster.to_record(p), fact=now) for p in roster]
+
+        def send(c, part):
+            for r in part:
+                c.send({"op": "row", "row": r})
+
+        t = time.perf_counter()
+        senders = [threading.Thread(target=send, args=(c, rows[k * marks:(k + 1) * marks]))
+                   for k, c in enumerate(clients)]
+        for s in senders:
+            s.start()
+        for c in clients:
+            for _ in range(stations * marks):
+                c.inbox.get(timeout=30)
+        elapsed = time.perf_counter() - t
+        for c in clients:
+            c.stop()
+        server.shutdown()
+        server.server_close()
+        server.state.journal.close()
+    return stations * marks / elapsed
+
+
+def pandas_import_time():
+    code = "import time; t = time.perf_counter(); import pandas; print(time.perf_counter() - t)"
+    res = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+    return float(res.stdout) if res.returncode == 0 else None
+
+
+# ====== Набор замеров ======
+def timed(fn, runs, setup=None):
+    # setup() перед каждым прогоном, вне замера; его результат передаётся в fn
+    times = []
+    for _ in range(runs):
+        arg = setup() if setup else None
+        t = time.perf_counter()
+        fn(arg) if setup else fn()
+        times.append(time.perf_counter() - t)
+    times.sort()
+    return {"mean_ms": sum(times) / runs * 1e3, "median_ms": times[runs // 2] * 1e3,
+            "min_ms": times[0] * 1e3, "runs": runs}
+
+
+def write_names_xlsx(path, n):
+    from openpyxl import Workbook
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(["ФИО"])
+    for k in range(n):
+        ws.append([f"Импорт {k:06d}"])
+    wb.save(path)
+
+
+def suite(n, tmp):
+    # Операции обработчиков App на модели; для каждой — время одного вызова
+    res = {}
+    roster = make_roster(n)
+    data_file = os.path.join(tmp, f"data_{n}.json")
+    journal = Journal(data_file)
+
+    res["save_data"] = timed(lambda: journal.compact(roster.snapshot()), 5)
+    res["load_data"] = timed(lambda: Roster().load(Journal(data_file).load()), 5)
+
+    rnd = random.Random(3)
+    counter = itertools.count()
+
+    def add_row():
+        p = roster.add(rnd.choice(POSITIONS), f"Новый {next(counter):06d}", rnd.choice(ARRIVAL_TIMES))
+        journal.append({"op": "row", "row": roster.to_record(p)})
+    res["add_row_values"] = timed(add_row, 200)
+
+    now = roster.start_time + timedelta(hours=1, minutes=30)
+    waiting = iter([p.id for p in roster if p.status == PRESENT and p.fact is None])
+
+    def mark():
+        pid = next(waiting)
+        roster.mark(pid, now)
+        p = roster.people[pid]
+        roster.values(p, roster.index_of(pid) + 1)
+        journal.append({"op": "row", "row": roster.to_record(p)})
+    res["mark_arrival"] = timed(mark, 200)
+
+    # Одна отметка в журнал при разных политиках fsync: цена надёжности на клик
+    record = {"op": "row", "row": roster.to_record(next(iter(roster)))}
+    for policy in ("always", "interval", "close"):
+        j = Journal(os.path.join(tmp, f"fsync_{policy}_{n}.json"), fsync=policy)
+        res[f"journal_append_{policy}"] = timed(lambda: j.append(record), 100)
+        j.close()
+
+    ids = itertools.cycle([p.id for p in roster][::max(1, n // 200)])
+    res["sort_table"] = timed(lambda: roster.rename(next(ids), f"Переименован {rnd.randrange(n):06d}"), 200)
+    res["sort_full"] = timed(roster.sort, 5)
+
+    def update_counters():
+        dict(roster.counts)
+        len(roster.overdue)
+        roster.next_deadline()
+    res["update_counters"] = timed(update_counters, 200)
+    res["full_rescan"] = timed(lambda: full_rescan(roster), 5)
+    try:
+        from analytics import Curve
+        res["update_curve"] = timed(lambda: Curve.from_roster(roster).curve(), 5)
+    except ImportError:
+        pass
+
+    res["search_index_build"] = timed(lambda: roster.find("сотрудник"), 1)
+    queries = itertools.cycle([f"сотрудник {rnd.randrange(n):06d}" for _ in range(50)] + ["сотр", "ов 00"])
+    res["search_from_entry"] = timed(lambda: roster.find(next(queries)), 200)
+
+    cwd = os.getcwd()
+    os.chdir(tmp)
+    try:
+        try:
+            xlsx = os.path.join(tmp, f"names_{n}.xlsx")
+            write_names_xlsx(xlsx, n)
+
+            def import_excel(target):
+                for chunk, done, total in read_names(xlsx):
+                    for fio in chunk:
+                        if not target.find_fio(fio):
+                            target.add(POSITIONS[0], fio, ARRIVAL_TIMES[0], keep_order=False)
+                target.sort()
+            res["import_excel"] = timed(import_excel, 1, setup=Roster)
+        except ImportError:
+            pass
+        for fmt in ("xlsx", "csv"):
+            try:
+                res[f"export_excel_{fmt}"] = timed(
+                    lambda: export_reports(export_rows(roster), roster.start_time, EXPORT_HOURS, fmt), 1)
+            except ImportError:
+                pass
+    finally:
+        os.chdir(cwd)
+
+    snapshot = roster.snapshot()
+
+    def fresh():
+        copy = Roster()
+        copy.load(snapshot)
+        return copy
+
+    def clear_data(target):
+        session_rows(target)
+        target.reset()
+    res["clear_data"] = timed(clear_data, 3, setup=fresh)
+
+    # Журнал турникетов: 3 события на человека, часть до запуска и с повторами
+    log = os.path.join(tmp, f"access_{n}.csv")
+    people = [p.fio for p in roster]
+    with open(log, "w", encoding="utf8") as f:
+        f.write("время;пропуск\n")
+        for _ in range(3 * n):
+            when = roster.start_time + timedelta(minutes=rnd.uniform(-30, 200))
+            f.write(f"{when.isoformat(timespec='seconds')};{rnd.choice(people)}\n")
+
+    def ingest(target):
+        engine = Ingest(target)
+        for chunk in chunks(read_log(log), target.start_time.date(), stats=engine.stats):
+            engine.apply(chunk)
+    res["turnstile_ingest"] = timed(ingest, 1, setup=fresh)
+    journal.close()
+    return res
+
+
+def virtual_display():
+    # Без DISPLAY таблицу Tk меряем на Xvfb (pip install xvfbwrapper)
+    if os.environ.get("DISPLAY") or sys.platform in ("win32", "darwin"):
+        return None
+    from xvfbwrapper import Xvfb
+    display = Xvfb(width=1920, height=1080)
+    display.start()
+    return display
+
+
+def gui_suite(n):
+    # Отрисовка окна таблицы: прокрутка на страницу и перекраска строки
+    import tkinter as tk
+    from tkinter import ttk
+    from table import VirtualTable
+    roster = make_roster(n)
+    root = tk.Tk()
+    root.geometry("1600x900")
+    cols = ("num", "pos", "fio", "arr", "fact", "late", "status")
+    tree = ttk.Treeview(root, columns=cols, show="headings")
+    scroll = ttk.Scrollbar(root, orient="vertical")
+    tree.pack(side="left", fill="both", expand=True)
+    scroll.pack(side="left", fill="y")
+    table = VirtualTable(tree, scroll, roster, 40)
+    root.update()
+    res = {}
+
+    def page():
+        table.yview("scroll", 1, "pages")
+        root.update_idletasks()
+    res["table_scroll_page"] = timed(page, 50)
+
+    now = roster.start_time + timedelta(hours=2)
+    visible = iter(table.window)
+
+    def recolor():
+        pid = next(visible, None)
+        if pid is not None:
+            roster.mark(pid, now)
+            table.refresh(roster.people[pid])
+        root.update_idletasks()
+    res["table_refresh_row"] = timed(recolor, min(20, len(table.window)))
+
+    # Список выбора: первое открытие строит окно, дальше оно только показывается
+    from roster import POSITIONS
+    from selector import Selector
+    sel = Selector(root, POSITIONS, ("Segoe UI", 20))
+
+    def open_selector():
+        sel.show(100, 100, 300, lambda v: None)
+        sel.hide()
+    res["selector_open"] = timed(open_selector, 50)
+
+    def build_selector():
+        Selector(root, POSITIONS, ("Segoe UI", 20)).popup.destroy()
+    res["selector_build"] = timed(build_selector, 20)
+    root.destroy()
+    return res
+
+
+def run_suite(sizes, gui=False):
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in sizes:
+            results[str(n)] = suite(n, tmp)
+    if gui:
+        display = virtual_display()
+        try:
+            for n in sizes:
+                results[str(n)].update(gui_suite(n))
+        finally:
+            if display is not None:
+                display.stop()
+    return results
+
+
+def git_revision():
+    try:
+        res = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+        return res.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def print_results(results, old=None):
+    for n, ops in results.items():
+        print(f"--- {n} строк")
+        for op, r in ops.items():
+            line = f"  {op:<24} {r['median_ms']:10.3f} мс"
+            prev = (old or {}).get(n, {}).get(op)
+            if prev:
+                ratio = r["median_ms"] / prev["median_ms"] if prev["median_ms"] else float("inf")
+                line += f"   было {prev['median_ms']:10.3f} мс  x{ratio:.2f}"
+            print(line)
+
+
+def details():
+    # Сравнения старых и новых алгоритмов
+    for n in DETAIL_SIZES:
+        rescan, incremental = bench_click(n)
+        print(f"{n:>7} строк  отметка прибытия: пересчёт {rescan * 1e3:8.3f} мс  "
+              f"инкрементально {incremental * 1e3:8.4f} мс")
+        scan, indexed = bench_search(n)
+        print(f"{n:>7} строк  поиск по ФИО:     перебор  {scan * 1e3:8.3f} мс  "
+              f"индекс         {indexed * 1e3:8.4f} мс")
+        rescan, heap = bench_deadlines(n)
+        print(f"{n:>7} строк  сроки прибытия:   перебор  {rescan * 1e3:8.3f} мс  "
+              f"куча           {heap * 1e3:8.4f} мс")
+        print(f"{n:>7} строк  скан пропуска:    {bench_scan(n) * 1e3:8.4f} мс")
+        old_time, new_time, (old_size, new_size) = bench_startup(n)
+        print(f"{n:>7} строк  загрузка данных:  было     {old_time * 1e3:8.1f} мс  "
+              f"стало          {new_time * 1e3:8.1f} мс  "
+              f"(файл {old_size // 1024} КБ -> {new_size // 1024} КБ)")
+    for stations in (1, 2, 4):
+        print(f"станций: {stations}  синхронизация отметок: {bench_sync(stations):8.0f} в секунду")
+    pandas_time = pandas_import_time()
+    if pandas_time is not None:
+        print(f"import pandas при запуске больше не нужен: {pandas_time * 1e3:.0f} мс")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замеры операций со списком прибытия")
+    parser.add_argument("--sizes", default=",".join(map(str, SIZES)), help="размеры списков через запятую")
+    parser.add_argument("--json", help="записать результаты в JSON")
+    parser.add_argument("--compare", help="JSON прошлого прогона: показать изменения")
+    parser.add_argument("--gui", action="store_true", help="также замерить таблицу Tk (дисплей или Xvfb)")
+    parser.add_argument("--details", action="store_true", help="сравнения старых и новых алгоритмов")
+    args = parser.parse_args()
+
+    sizes = [int(x) for x in args.sizes.split(",")]
+    results = run_suite(sizes, args.gui)
+    old = None
+    if args.compare:
+        with open(args.compare, encoding="utf8") as f:
+            old = json.load(f)["results"]
+    print_results(results, old)
+    if args.json:
+        meta = {"date": datetime.now().isoformat(timespec="seconds"), "revision": git_revision(),
+                "python": platform.python_version(), "platform": platform.platform(),
+                "sizes": sizes, "gui": args.gui}
+        with open(args.json, "w", encoding="utf8") as f:
+            json.dump({"meta": meta, "results": results}, f, ensure_ascii=False, indent=1)
+    if args.details:
+        details()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,327 @@
+import argparse, json, re, sqlite3, sys, threading
+from collections import Counter
+from datetime import datetime
+
+from excel_io import EXPORT_FORMATS, EXPORT_HOURS, export_reports, export_rows, read_names
+from history import HISTORY_FILE, session_rows, write_session
+from roster import ARRIVAL_TIMES, POSITIONS, PRESENT, STATUSES, Roster, from_iso, iso, parse_time
+from rosters import INDEX_FILE, Rosters
+from storage import COMPACT_EVERY, DATA_FILE, Journal, lock_data
+from turnstile import TURNSTILE_PORT, Ingest, chunks, follow, listen, read_log
+from undo import batch
+
+# Работа со списком без окна: ночное обновление списка, отметки из журнала
+# турникетов, отчёты ч+X на сервере без дисплея.
+#
+#   python -m cli import names.xlsx [--prune]
+#   python -m cli start [--at 08:00]
+#   python -m cli mark log.txt       (строки "ФИО или пропуск[;время]", "-" — stdin)
+#   python -m cli ingest access.csv [--follow | --port 8766]   (журнал турникетов)
+#   python -m cli export --hours 1 2.5 --format csv --out reports
+#   python -m cli stats [--json]
+#   python -m cli clear
+#
+# Файл читается один раз, все изменения применяются в памяти и пишутся
+# одним снимком. Пока список открыт в окне (или другой командой), файл
+# заблокирован: меняющие его команды завершаются с ошибкой, ничего не записав.
+
+SHOW_KEYS = 20  # сколько ненайденных ключей отметки выводить
+
+
+class CliError(Exception):
+    pass
+
+
+class Session:
+    # Загруженный список и его файл: один load в начале, один save в конце
+    def __init__(self, roster_name=None, data_file=None, lock=True):
+        self.rosters = None
+        self.name = None
+        if data_file is None:
+            self.rosters = Rosters(INDEX_FILE, DATA_FILE)
+            self.name = roster_name or self.rosters.active
+            if self.name not in self.rosters.items:
+                raise CliError(f"Нет списка «{self.name}». Есть: {', '.join(self.rosters.names())}")
+            data_file = self.rosters.file(self.name)
+        elif roster_name:
+            raise CliError("Укажите либо --roster, либо --data")
+        # Чтение (export, stats) блокировку не берёт: файл оно не меняет
+        self.lock = lock_data(data_file) if lock else None
+        self.journal = Journal(data_file)
+        self.roster = Roster()
+        try:
+            self.roster.load(self.journal.load())
+        except Exception:
+            self.close()
+            raise
+
+    def history_name(self):
+        # Список, под которым сессия уходит в историю; без каталога — имя файла
+        return self.name or self.journal.data_file
+
+    def close(self):
+        self.journal.close()
+        if self.lock is not None:
+            self.lock.close()
+
+    def save(self):
+        self.journal.compact(self.roster.snapshot())
+        self.journal.close()
+        if self.rosters is not None:
+            self.rosters.remember(self.name, self.roster)
+            self.rosters.save()
+
+
+def read_lines(path):
+    if path == "-":
+        return [line.rstrip("\n") for line in sys.stdin]
+    with open(path, "r", encoding="utf8") as f:
+        return [line.rstrip("\n") for line in f]
+
+
+def find_people(roster, key):
+    # Сначала номер пропуска, потом ФИО (одинаковых ФИО может быть несколько)
+    pid = roster.find_badge(key)
+    if pid is not None:
+        return [pid]
+    return list(roster.find_fio(key))
+
+
+def archive(s):
+    # Сессия уходит в историю до изменения списка: без записи в историю список не трогаем
+    try:
+        write_session(HISTORY_FILE, s.roster.start_time, session_rows(s.roster), s.history_name())
+    except sqlite3.Error as e:
+        raise CliError(f"Сессия не записана в историю ({HISTORY_FILE}): {e}")
+
+
+# ====== Команды ======
+def cmd_import(s, args):
+    roster = s.roster
+    names = set()
+    before = {}  # имя -> сколько таких строк было до импорта
+    seen = Counter()
+    added = skipped = 0
+    for chunk, done, total in read_names(args.file):
+        for fio in chunk:
+            key = fio.lower()
+            names.add(key)
+            # Повторный импорт того же файла не создаёт дубликатов: пропускается
+            # столько повторов имени, сколько было в списке, тёзки из файла добавляются
+            if key not in before:
+                before[key] = len(roster.find_fio(fio))
+            seen[key] += 1
+            if seen[key] <= before[key]:
+                skipped += 1
+                continue
+            roster.add(args.pos, fio, args.arr, keep_order=False)
+            added += 1
+    roster.sort()
+    msg = f"Добавлено: {added}, уже в списке: {skipped}"
+    if args.prune:
+        # Ночное обновление: кого нет в новом файле, из списка убираем
+        gone = [p.id for p in roster if p.fio.lower() not in names]
+        roster.remove_many(gone)
+        msg += f", удалено: {len(gone)}"
+    print(msg)
+
+
+def cmd_start(s, args):
+    roster = s.roster
+    # Как в окне: повторный запуск отправляет прежнюю сессию в историю
+    if roster.start_time and len(roster):
+        archive(s)
+    now = datetime.now()
+    s.roster.start(parse_time(args.at, now.date()) if args.at else now)
+    print(f"Время запуска: {s.roster.start_time.strftime('%Y-%m-%d %H:%M')}")
+
+
+def cmd_mark(s, args):
+    roster = s.roster
+    if not roster.start_time:
+        raise CliError("Список не запущен: сначала python -m cli start")
+    day = roster.start_time.date()
+    default = parse_time(args.at, day) if args.at else datetime.now()
+    lines = list(args.keys)
+    for path in args.file:
+        lines += read_lines(path)
+    marked = skipped = 0
+    not_found = []
+    ambiguous = []
+    for line in lines:
+        key, _, when = re.sub(r"\t", ";", line).partition(";")
+        key = key.strip()
+        if not key:
+            continue
+        ids = find_people(roster, key)
+        if not ids:
+            not_found.append(key)
+        elif len(ids) > 1:
+            ambiguous.append(key)
+        elif roster.mark(ids[0], parse_time(when, day) if when.strip() else default):
+            marked += 1
+        else:
+            skipped += 1
+    print(f"Отмечено: {marked}, уже отмечены или не присутствуют: {skipped}, "
+          f"не найдено: {len(not_found)}, несколько строк с таким ФИО: {len(ambiguous)}")
+    for key in not_found[:SHOW_KEYS]:
+        print(f"  не найден: {key}", file=sys.stderr)
+    for key in ambiguous[:SHOW_KEYS]:
+        print(f"  несколько строк: {key}", file=sys.stderr)
+
+
+def cmd_ingest(s, args):
+    roster = s.roster
+    if not roster.start_time:
+        raise CliError("Список не запущен: сначала python -m cli start")
+    if not args.file and not args.port:
+        raise CliError("Укажите журнал доступа или --port")
+    live = args.follow or args.port
+    stop = threading.Event()
+    if args.port:
+        lines = listen(args.port, stop)
+    elif args.follow:
+        lines = follow(args.file, stop)
+    else:
+        lines = read_log(args.file)
+    ingest = Ingest(roster, s.name)
+    st = ingest.stats
+
+    def report():
+        print(f"Событий: {st['events']}, отмечено: {st['marked']}, не найдено: {st['unknown']}, "
+              f"несколько строк с таким ФИО: {st['ambiguous']}, до запуска: {st['early']}, "
+              f"не присутствуют: {st['other']}, нераспознанных строк: {st['bad']}")
+
+    try:
+        for chunk in chunks(lines, roster.start_time.date(), stats=st):
+            changed = ingest.apply(chunk, s.name)
+            if live and changed:
+                # Без конца потока: каждая пачка сразу одной записью в журнал
+                s.journal.append(batch([{"op": "row", "row": roster.to_record(roster.people[pid])}
+                                        for pid in changed]))
+                if s.journal.count >= COMPACT_EVERY:
+                    s.journal.compact(roster.snapshot())
+                report()
+    except KeyboardInterrupt:
+        stop.set()
+    if not live:
+        report()
+
+
+def cmd_export(s, args):
+    if not s.roster.start_time:
+        raise CliError("Список не запущен: выгружать нечего")
+    hours = EXPORT_HOURS if args.hours == ["all"] else [float(h) if "." in h else int(h) for h in args.hours]
+    for path in export_reports(export_rows(s.roster), s.roster.start_time, hours, args.format, args.out):
+        print(path)
+
+
+def counters(s):
+    roster = s.roster
+    c = roster.counts
+    present = c[PRESENT]
+    roster.advance(datetime.now())
+    return {
+        "roster": s.name, "start": iso(roster.start_time), "total": c["total"],
+        "statuses": {st: c[st] for st in STATUSES}, "arrived": c["arrived"],
+        "late": c["late"], "ontime": c["ontime"], "overdue": len(roster.overdue),
+        "percent": round(c["arrived"] / present * 100, 1) if present else 0.0,
+    }
+
+
+def cmd_stats(s, args):
+    c = counters(s)
+    if args.json:
+        print(json.dumps(c, ensure_ascii=False, indent=1))
+        return
+    total = c["total"]
+
+    def pct(n):
+        return (n / total * 100) if total else 0
+
+    start = from_iso(c["start"])
+    if c["roster"]:
+        print(f"Список: {c['roster']}")
+    print(f"Время запуска: {start.strftime('%Y-%m-%d %H:%M') if start else '---'}")
+    print(f"Всего по списку: {total}")
+    for st, n in c["statuses"].items():
+        print(f"{st}: {n} ({pct(n):.1f}%)")
+    print(f"Пришли: {c['arrived']} (вовремя {c['ontime']}, опоздали {c['late']})")
+    print(f"Не пришли в срок: {c['overdue']}")
+    print(f"Процент прибытия: {c['percent']:.1f}%")
+
+
+def cmd_clear(s, args):
+    roster = s.roster
+    # Как в окне: перед очисткой сессия уходит в историю
+    if roster.start_time and len(roster) and not args.no_history:
+        archive(s)
+    roster.reset()
+    print("Факт, опоздание и статус обнулены")
+
+
+# команда -> (функция, переписывает ли она файл списка)
+COMMANDS = {"import": (cmd_import, True), "start": (cmd_start, True), "mark": (cmd_mark, True),
+            "ingest": (cmd_ingest, True),
+            "export": (cmd_export, False), "stats": (cmd_stats, False), "clear": (cmd_clear, True)}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m cli", description="Список прибытия без окна")
+    parser.add_argument("--roster", help="название списка (по умолчанию открытый в окне)")
+    parser.add_argument("--data", help="файл списка напрямую, минуя каталог списков")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("import", help="добавить ФИО из Excel (первый столбец)")
+    p.add_argument("file")
+    p.add_argument("--pos", default=POSITIONS[0], choices=POSITIONS)
+    p.add_argument("--arr", default=ARRIVAL_TIMES[0], choices=ARRIVAL_TIMES)
+    p.add_argument("--prune", action="store_true", help="удалить тех, кого нет в файле")
+
+    p = sub.add_parser("start", help="ЗАПУСК: время отсчёта опозданий")
+    p.add_argument("--at", help="ЧЧ:ММ сегодня или дата ISO (по умолчанию сейчас)")
+
+    p = sub.add_parser("mark", help="отметить прибытие по ФИО или номеру пропуска")
+    p.add_argument("keys", nargs="*", help="ФИО или номера пропусков")
+    p.add_argument("--file", "-f", action="append", default=[],
+                   help='файл со строками "ключ[;время]", "-" — stdin')
+    p.add_argument("--at", help="время для строк без времени (по умолчанию сейчас)")
+
+    p = sub.add_parser("ingest", help="отметки из журнала турникетов (CSV: время;пропуск или ФИО)")
+    p.add_argument("file", nargs="?", help="журнал доступа")
+    p.add_argument("--follow", action="store_true", help="следить за дописыванием, до Ctrl+C")
+    p.add_argument("--port", type=int, nargs="?", const=TURNSTILE_PORT,
+                   help=f"принимать события строками по TCP на 127.0.0.1 (по умолчанию {TURNSTILE_PORT})")
+
+    p = sub.add_parser("export", help="отчёты ч+X")
+    p.add_argument("--hours", nargs="+", default=["all"], help='часы, например 1 2.5, или "all"')
+    p.add_argument("--format", default=EXPORT_FORMATS[0], choices=EXPORT_FORMATS)
+    p.add_argument("--out", default="", help="папка для файлов")
+
+    p = sub.add_parser("stats", help="счётчики как в окне")
+    p.add_argument("--json", action="store_true")
+
+    p = sub.add_parser("clear", help="обнулить факт, опоздание и статус")
+    p.add_argument("--no-history", action="store_true", help="не архивировать сессию")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    fn, writes = COMMANDS[args.command]
+    try:
+        s = Session(args.roster, args.data, lock=writes)
+        try:
+            fn(s, args)
+            if writes:
+                s.save()
+        finally:
+            s.close()
+    except (CliError, OSError, ValueError) as e:
+        print(f"Ошибка: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,158 @@
+import os
+
+from roster import ARRIVAL_TIMES, format_timedelta
+
+# Чтение/запись Excel без Tk. Функции можно вызывать из рабочего потока.
+
+IMPORT_CHUNK = 500
+
+
+def _xlsx_first_column(path):
+    from openpyxl import load_workbook
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[0]
+        total = ws.max_row
+        # Первая строка — заголовок, как у pd.read_excel
+        rows = ws.iter_rows(min_row=2, max_col=1, values_only=True)
+        yield total - 1 if total else None
+        for row in rows:
+            yield row[0] if row else None
+    finally:
+        wb.close()
+
+
+def _xls_first_column(path):
+    import pandas as pd
+    df = pd.read_excel(path, usecols=[0])
+    yield len(df)
+    yield from df.iloc[:, 0]
+
+
+def read_names(path, chunk_size=IMPORT_CHUNK):
+    # Генератор: (список ФИО, прочитано строк, всего строк или None)
+    ext = os.path.splitext(path)[1].lower()
+    cells = _xls_first_column(path) if ext == ".xls" else _xlsx_first_column(path)
+    total = next(cells)
+    chunk = []
+    done = 0
+    for value in cells:
+        done += 1
+        if value is None:
+            continue
+        fio = str(value).strip()
+        if fio and fio != "nan":
+            chunk.append(fio)
+        if len(chunk) >= chunk_size:
+            yield chunk, done, total
+            chunk = []
+    yield chunk, done, total
+
+
+# ====== Выгрузка ======
+EXPORT_COLUMNS = ["Должность", "ФИО", "Время прибытия", "Факт", "Опоздание", "Статус"]
+EXPORT_HOURS = [1, 1.5, 2, 2.5, 3]
+EXPORT_FORMATS = ["xlsx", "csv"]
+CURVE_STEP = 15  # минут между точками кривой прибытия в отчёте
+
+
+class _XlsxWriter:
+    def __init__(self, path):
+        from openpyxl import Workbook
+        self.path = path
+        self.wb = Workbook(write_only=True)
+        self.ws = self.wb.create_sheet()
+
+    def write(self, row):
+        self.ws.append(row)
+
+    def close(self):
+        self.wb.save(self.path)
+
+
+class _CsvWriter:
+    def __init__(self, path):
+        import csv
+        self.path = path
+        # utf-8-sig и ";" — чтобы Excel открыл файл с кириллицей без мастера импорта
+        self.f = open(path, "w", encoding="utf-8-sig", newline="")
+        self.w = csv.writer(self.f, delimiter=";")
+
+    def write(self, row):
+        self.w.writerow(row)
+
+    def close(self):
+        self.f.close()
+
+
+WRITERS = {"xlsx": _XlsxWriter, "csv": _CsvWriter}
+
+
+def export_rows(roster):
+    # Снимок строк для рабочего потока: модель меняется в UI, пока идёт запись.
+    # Только сырые поля — текст для файла собирает рабочий поток
+    return [(p.pos, p.fio, p.arr, p.fact, p.late, p.status) for p in roster.sorted()]
+
+
+def export_values(row):
+    pos, fio, arr, fact, late, status = row
+    if not fact:
+        return [pos, fio, arr, "Еще не прибыл", "", status]
+    return [pos, fio, arr, fact.strftime("%H:%M"), format_timedelta(late) if late is not None else "", status]
+
+
+def export_path(hours, fmt="xlsx"):
+    return f"export_{hours}h.{fmt}"
+
+
+def _pad(row):
+    return list(row) + [""] * (len(EXPORT_COLUMNS) - len(row))
+
+
+def analytics_rows(stats):
+    # Блок аналитики в конце отчёта; ширина строк как у таблицы
+    out = [_pad([]), _pad(["Аналитика"])]
+    for q, v in zip((50, 90), stats.percentiles((50, 90))):
+        out.append(_pad([f"Прибыли {q}% пришедших, мин", "" if v is None else f"{v:.0f}"]))
+    for t, pct in zip(ARRIVAL_TIMES, stats.cutoffs()):
+        out.append(_pad([f"Пришли к ч+{t}", f"{pct:.1f}%"]))
+    out.append(_pad([]))
+    out.append(_pad(["Должность", "Присутствует", "Пришли", "Опоздали", "Процент прибытия"]))
+    for name, present, arrived, late, pct in stats.by_position():
+        out.append(_pad([name, present, arrived, late, f"{pct:.1f}%"]))
+    if len(stats.sorted):
+        points = int(stats.sorted[-1] // CURVE_STEP) + 2
+        t, pct = stats.curve(points, (points - 1) * CURVE_STEP)
+        out.append(_pad([]))
+        out.append(_pad(["Кривая прибытия: мин от запуска", "Пришли, %"]))
+        for minute, value in zip(t, pct):
+            out.append(_pad([f"{minute:.0f}", f"{value:.1f}%"]))
+    return out
+
+
+def export_reports(rows, start_time, hours_list, fmt="xlsx", folder=""):
+    # rows — из export_rows(): (должность, ФИО, время, факт, опоздание, статус) в порядке таблицы.
+    # Все отчёты пишутся за один проход по строкам. Возвращает пути к файлам.
+    paths = [os.path.abspath(os.path.join(folder, export_path(h, fmt))) for h in hours_list]
+    writers = [WRITERS[fmt](path) for path in paths]
+    date_str = start_time.strftime("%Y-%m-%d")
+    empty = [""] * (len(EXPORT_COLUMNS) - 1)
+    for w, h in zip(writers, hours_list):
+        w.write(EXPORT_COLUMNS)
+        w.write([f"{date_str}.прибытие ч+{h}"] + empty)
+
+    for row in rows:
+        vals = export_values(row)
+        for w in writers:
+            w.write(vals)
+
+    from analytics import Arrivals  # numpy — только когда нужен отчёт
+    stats = Arrivals.from_rows(rows, start_time)
+    block = analytics_rows(stats)
+    for w, percent in zip(writers, stats.cutoffs(hours_list)):
+        w.write([""] * len(EXPORT_COLUMNS))
+        w.write(["Процент прибытия"] + empty[:-1] + [f"{percent:.1f}%"])
+        for row in block:
+            w.write(row)
+        w.close()
+    return paths
@@ -0,0 +1,198 @@
+import sqlite3, threading
+from datetime import timedelta
+
+from roster import PRESENT, LATE_THRESHOLD, from_iso, sort_key
+from rosters import DEFAULT_ROSTER
+
+# История прошедших сессий (запуск -> очистка) в SQLite.
+# Архивирование идёт в отдельном потоке со своим соединением, чтобы
+# очистка данных в окне не ждала записи; чтение — из UI через индексы.
+# Сессия помнит свой список (подразделение, смену): запросы по списку не
+# смешивают людей и опоздания разных списков.
+
+HISTORY_FILE = "history.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    roster TEXT NOT NULL,
+    start TEXT NOT NULL,
+    date TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    present INTEGER NOT NULL,
+    arrived INTEGER NOT NULL,
+    late INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS arrivals (
+    session_id INTEGER NOT NULL REFERENCES sessions(id),
+    date TEXT NOT NULL,
+    person TEXT NOT NULL,      -- sort_key(ФИО): поиск без учёта регистра и ё
+    fio TEXT NOT NULL,
+    pos TEXT NOT NULL,
+    arr REAL NOT NULL,         -- ожидаемое время прибытия, ч
+    status TEXT NOT NULL,
+    fact TEXT,
+    offset REAL,               -- минут от запуска до прибытия
+    late REAL                  -- минут опоздания
+);
+CREATE INDEX IF NOT EXISTS arrivals_person ON arrivals(person, date);
+CREATE INDEX IF NOT EXISTS arrivals_date ON arrivals(date);
+CREATE INDEX IF NOT EXISTS arrivals_status ON arrivals(status, date);
+CREATE INDEX IF NOT EXISTS arrivals_session ON arrivals(session_id, offset);
+CREATE INDEX IF NOT EXISTS sessions_date ON sessions(date);
+"""
+INDEXES = """
+CREATE INDEX IF NOT EXISTS sessions_roster ON sessions(roster, start);
+"""
+
+
+def session_rows(roster):
+    # Компактный снимок сессии для архива; берётся в UI до сброса факта/статуса
+    return [(p.fio, p.pos, p.arrival, p.status, p.fact) for p in roster]
+
+
+def _connect(path):
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")  # чтение из UI не ждёт записи архива
+    conn.executescript(SCHEMA)
+    if "roster" not in [c[1] for c in conn.execute("PRAGMA table_info(sessions)")]:
+        # Архив до появления списков: все сессии были в основном
+        with conn:
+            conn.execute("ALTER TABLE sessions ADD COLUMN roster TEXT NOT NULL DEFAULT ''")
+            conn.execute("UPDATE sessions SET roster = ?", (DEFAULT_ROSTER,))
+    conn.executescript(INDEXES)
+    return conn
+
+
+def roster_filter(roster, column="roster"):
+    # (условие, аргументы); roster=None — все списки
+    if roster is None:
+        return "1", []
+    return f"{column} = ?", [roster]
+
+
+def write_session(path, start, rows, roster=DEFAULT_ROSTER):
+    date = start.strftime("%Y-%m-%d")
+    records = []
+    present = arrived = late_count = 0
+    for fio, pos, arrival, status, fact in rows:
+        offset = late = None
+        if status == PRESENT:
+            present += 1
+        if fact is not None:
+            offset = (fact - start).total_seconds() / 60
+            late = max(0.0, offset - arrival * 60)
+            if status == PRESENT:
+                arrived += 1
+                if late >= LATE_THRESHOLD / timedelta(minutes=1):
+                    late_count += 1
+        records.append((date, sort_key(fio), fio, pos, arrival, status,
+                        fact.isoformat() if fact else None, offset, late))
+    conn = _connect(path)
+    try:
+        with conn:
+            cur = conn.execute(
+                "INSERT INTO sessions (roster, start, date, total, present, arrived, late)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (roster, start.isoformat(), date, len(rows), present, arrived, late_count))
+            sid = cur.lastrowid
+            conn.executemany(
+                "INSERT INTO arrivals (session_id, date, person, fio, pos, arr, status, fact, offset, late)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(sid,) + r for r in records])
+    finally:
+        conn.close()
+    return sid
+
+
+class History:
+    def __init__(self, path=HISTORY_FILE):
+        self.path = path
+        self.conn = None
+        self.jobs = []
+        self.error = None
+
+    def _db(self):
+        if self.conn is None:
+            self.conn = _connect(self.path)
+        return self.conn
+
+    # ====== Запись ======
+    def archive(self, start, rows, roster=DEFAULT_ROSTER):
+        # rows — из session_rows(); запись в фоновом потоке
+        if start is None or not rows:
+            return
+
+        def worker():
+            try:
+                write_session(self.path, start, rows, roster)
+            except sqlite3.Error as e:
+                self.error = e
+
+        job = threading.Thread(target=worker, daemon=True)
+        job.start()
+        self.jobs = [j for j in self.jobs if j.is_alive()] + [job]
+
+    def take_error(self):
+        # Ошибка последней фоновой записи; сбрасывается, чтобы показать её один раз
+        error, self.error = self.error, None
+        return error
+
+    def wait(self, timeout=None):
+        for job in self.jobs:
+            job.join(timeout)
+        self.jobs = [j for j in self.jobs if j.is_alive()]
+        return not self.jobs
+
+    # ====== Запросы ======
+    def sessions(self, limit=100, date_from=None, date_to=None, roster=None):
+        cond, args = roster_filter(roster)
+        sql = f"SELECT id, start, total, present, arrived, late FROM sessions WHERE {cond}"
+        if date_from or date_to:
+            sql += " AND date BETWEEN ? AND ?"
+            args += [date_from or "0000-00-00", date_to or "9999-99-99"]
+        sql += " ORDER BY start DESC LIMIT ?"
+        return [(sid, from_iso(start), total, present, arrived, late)
+                for sid, start, total, present, arrived, late in self._db().execute(sql, args + [limit])]
+
+    def person_history(self, fio, limit=365, roster=None):
+        # [(дата, должность, статус, факт, опоздание в минутах)] от новых к старым
+        cond, args = roster_filter(roster, "s.roster")
+        rows = self._db().execute(
+            "SELECT a.date, a.pos, a.status, a.fact, a.late FROM arrivals a"
+            f" JOIN sessions s ON s.id = a.session_id WHERE a.person = ? AND {cond}"
+            " ORDER BY a.date DESC LIMIT ?", [sort_key(fio)] + args + [limit])
+        return [(date, pos, status, from_iso(fact), late) for date, pos, status, fact, late in rows]
+
+    def find_people(self, prefix, limit=20, roster=None):
+        # Подсказка ФИО по началу: поиск по индексу arrivals_person
+        key = sort_key(prefix)
+        cond, args = roster_filter(roster, "s.roster")
+        rows = self._db().execute(
+            "SELECT DISTINCT a.fio FROM arrivals a JOIN sessions s ON s.id = a.session_id"
+            f" WHERE a.person >= ? AND a.person < ? AND {cond} ORDER BY a.person LIMIT ?",
+            [key, key + "\uffff"] + args + [limit])
+        return [fio for (fio,) in rows]
+
+    def session_offsets(self, session_id):
+        # Минуты от запуска до прибытия по возрастанию — кривая прибытия сессии
+        rows = self._db().execute(
+            "SELECT offset FROM arrivals WHERE session_id = ? AND status = ? AND offset >= 0"
+            " ORDER BY offset", (session_id, PRESENT))
+        return [offset for (offset,) in rows]
+
+    def late_counts(self, date_from=None, date_to=None, limit=50, roster=None):
+        # Кто опаздывал чаще всего: [(ФИО, опозданий, сессий)]
+        cond, args = roster_filter(roster, "s.roster")
+        rows = self._db().execute(
+            "SELECT MIN(a.fio), SUM(a.status = ? AND a.late >= ?), COUNT(*) FROM arrivals a"
+            " JOIN sessions s ON s.id = a.session_id"
+            f" WHERE a.date BETWEEN ? AND ? AND {cond} GROUP BY a.person ORDER BY 2 DESC LIMIT ?",
+            [PRESENT, LATE_THRESHOLD / timedelta(minutes=1),
+             date_from or "0000-00-00", date_to or "9999-99-99"] + args + [limit])
+        return list(rows)
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
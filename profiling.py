@@ -0,0 +1,125 @@
+import functools, json, os, time
+from bisect import bisect_right
+from collections import deque
+
+# Замеры обработчиков событий: время каждого вызова, число вызовов Tcl,
+# журнал медленных событий. Включается ARRIVAL_PROFILE=1 или из скрытой
+# панели (Ctrl+Shift+D). Выключенный замер — одна проверка флага на вызов.
+
+ENABLED = os.environ.get("ARRIVAL_PROFILE") == "1"
+SLOW_MS = float(os.environ.get("ARRIVAL_PROFILE_SLOW", "50"))  # порог медленного события, мс
+SAMPLES = 5000  # последних замеров на обработчик для p50/p99
+SLOW_LOG = "profile_slow.log"
+STATS_FILE = "profile_stats.json"
+BUCKETS = [0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]  # границы гистограммы, мс
+
+
+class TclCounter:
+    # Подменяет интерпретатор у окна: все виджеты берут его от родителя,
+    # поэтому считается каждый вызов Tcl из Python
+    def __init__(self, tk):
+        self._tk = tk
+        self.calls = 0
+
+    def call(self, *args):
+        self.calls += 1
+        return self._tk.call(*args)
+
+    def __getattr__(self, name):
+        return getattr(self._tk, name)
+
+
+def percentile(values, q):
+    # values отсортированы
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(len(values) * q / 100))]
+
+
+class Profiler:
+    def __init__(self, enabled=ENABLED):
+        self.enabled = enabled
+        self.counter = None  # TclCounter, если установлен при запуске
+        self.idle = None     # update_idletasks: замер перерисовки после обработчика
+        self.depth = 0
+        self.samples = {}    # имя -> deque(мс)
+        self.hist = {}       # имя -> [число вызовов по BUCKETS]
+        self.counts = {}
+        self.tcl = {}        # имя -> вызовов Tcl всего
+        self.startup = {}    # этап запуска -> мс; меряется всегда, один раз
+
+    def wrap(self, name, fn):
+        @functools.wraps(fn)
+        def timed(*args, **kwargs):
+            if not self.enabled:
+                return fn(*args, **kwargs)
+            return self.measure(name, fn, args, kwargs)
+        return timed
+
+    def measure(self, name, fn, args, kwargs):
+        counter = self.counter
+        calls = counter.calls if counter else 0
+        self.depth += 1
+        t = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            ms = (time.perf_counter() - t) * 1000
+            self.record(name, ms, counter.calls - calls if counter else None)
+            if self.depth == 1 and self.idle:
+                # Перерисовка, которую Tk сделал бы сразу после обработчика
+                t = time.perf_counter()
+                self.idle()
+                self.record(name + ":redraw", (time.perf_counter() - t) * 1000, None)
+            self.depth -= 1
+
+    def phase(self, name, since):
+        # Этап запуска окна: мс от since; возвращает начало следующего этапа
+        now = time.perf_counter()
+        self.startup[name] = (now - since) * 1000
+        return now
+
+    def record(self, name, ms, tcl):
+        if name not in self.samples:
+            self.samples[name] = deque(maxlen=SAMPLES)
+            self.hist[name] = [0] * (len(BUCKETS) + 1)
+            self.counts[name] = 0
+            self.tcl[name] = 0
+        self.samples[name].append(ms)
+        self.hist[name][bisect_right(BUCKETS, ms)] += 1
+        self.counts[name] += 1
+        if tcl is not None:
+            self.tcl[name] += tcl
+        if ms >= SLOW_MS:
+            with open(SLOW_LOG, "a", encoding="utf8") as f:
+                f.write(f"{time.strftime('%Y-%m-%d %H:%M:%S')}\t{name}\t{ms:.1f} мс"
+                        + (f"\tTcl: {tcl}" if tcl is not None else "") + "\n")
+
+    def stats(self):
+        # [(имя, вызовов, p50, p99, max, вызовов Tcl на один вызов)] от самых дорогих
+        result = []
+        for name, samples in self.samples.items():
+            values = sorted(samples)
+            count = self.counts[name]
+            tcl = self.tcl[name] / count if self.counter and count else None
+            result.append((name, count, percentile(values, 50), percentile(values, 99), values[-1], tcl))
+        result.sort(key=lambda r: -r[3])
+        return result
+
+    def reset(self):
+        self.samples.clear()
+        self.hist.clear()
+        self.counts.clear()
+        self.tcl.clear()
+
+    def dump(self, path=STATS_FILE):
+        data = {"buckets_ms": BUCKETS, "slow_ms": SLOW_MS, "startup_ms": self.startup, "handlers": {}}
+        for name, count, p50, p99, worst, tcl in self.stats():
+            data["handlers"][name] = {
+                "count": count, "p50_ms": p50, "p99_ms": p99, "max_ms": worst,
+                "tcl_per_call": tcl, "histogram": self.hist[name],
+                "samples_ms": list(self.samples[name]),
+            }
+        with open(path, "w", encoding="utf8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=1)
+        return os.path.abspath(path)
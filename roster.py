@@ -0,0 +1,527 @@
+import gc, heapq, math, re
+from array import array
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta
+
+from search import SearchIndex, build_index
+
+# Модель списка без Tk: всё состояние таблицы живёт здесь, App только отображает.
+
+POSITIONS = ["Неизвестно", "Инженер", "Менеджер", "Техник", "Администратор", "Директор"]
+STATUSES = ["Присутствует", "Болен", "Командировка"]
+ARRIVAL_TIMES = ["1 час", "1.5 часа", "2 часа", "2.5 часа", "3 часа"]
+
+PRESENT = STATUSES[0]
+LATE_THRESHOLD = timedelta(minutes=1)  # опоздание меньше минуты показывается как 00:00
+REBUILD_SEARCH = 100  # при удалении большего числа строк индекс поиска строится заново
+EPOCH = datetime(2000, 1, 1)  # отсчёт минут в массиве фактов
+
+
+def parse_hours(text):
+    return float(text.replace("час", "").replace("а", "").strip())
+
+
+def hours_text(hours):
+    # 1 -> "1 час", 1.5 -> "1.5 часа"
+    for t in ARRIVAL_TIMES:
+        if parse_hours(t) == hours:
+            return t
+    return f"{hours:g} часа"
+
+
+def sort_key(fio):
+    # Порядок по алфавиту: без учёта регистра, ё вместе с е
+    return fio.casefold().replace("ё", "е")
+
+
+def format_timedelta(td):
+    total_minutes = int(td.total_seconds() // 60)
+    hours = total_minutes // 60
+    minutes = total_minutes % 60
+    return f"{hours:02d}:{minutes:02d}"
+
+
+def parse_time(text, day):
+    # "ЧЧ:ММ[:СС]" — время в день day, иначе дата и время ISO
+    text = text.strip()
+    m = re.fullmatch(r"(\d{1,2}):(\d{2})(?::(\d{2}))?", text)
+    try:
+        if m:
+            h, mi, sec = (int(x or 0) for x in m.groups())
+            return datetime(day.year, day.month, day.day, h, mi, sec)
+        return datetime.fromisoformat(text)
+    except ValueError:
+        raise ValueError(f"Не понял время: {text}") from None
+
+
+def iso(dt):
+    return dt.isoformat() if dt else None
+
+
+def from_iso(text):
+    return datetime.fromisoformat(text) if text else None
+
+
+class Person:
+    __slots__ = ("id", "pos", "fio", "key", "arr", "arrival", "fact", "status", "late", "badge", "slot")
+
+    def __init__(self, id, pos, fio, arr, fact=None, status=PRESENT, badge=None):
+        self.id = id
+        self.pos = pos
+        self.fio = fio
+        self.key = sort_key(fio)
+        self.arr = arr
+        self.arrival = parse_hours(arr)
+        self.fact = fact
+        self.status = status
+        self.late = None
+        self.badge = badge  # номер пропуска (штрихкод/RFID)
+
+
+class Roster:
+    def __init__(self):
+        self.people = {}   # id -> Person
+        self.by_fio = {}   # fio.lower() -> {id, ...}
+        self.by_badge = {}  # номер пропуска -> id
+        self.order = []    # [(sort_key(fio), id)] по алфавиту, как в таблице
+        self.search = SearchIndex()
+        self.search_dirty = None  # id строк, изменённых, пока индекс строится в фоне
+        self.start_time = None
+        self.next_id = 1
+        self.counts = self._zero_counts()
+        self.deadlines = []    # куча (срок прибытия, id) ещё не пришедших
+        self.overdue = set()   # id тех, у кого срок уже прошёл, а отметки нет
+        # Факт прибытия присутствующих в минутах от EPOCH по слоту строки, nan — не пришёл.
+        # Ведётся вместе со счётчиками: кривая прибытия берёт его целиком без прохода по строкам
+        self.facts = array("d")
+        self.free_slots = []
+
+    def __len__(self):
+        return len(self.people)
+
+    def __iter__(self):
+        return iter(self.people.values())
+
+    def get(self, pid):
+        return self.people.get(pid)
+
+    # ====== Индексы ======
+    def _index(self, p):
+        self.by_fio.setdefault(p.fio.lower(), set()).add(p.id)
+        if p.badge:
+            self.by_badge[p.badge] = p.id
+
+    def _unindex(self, p):
+        key = p.fio.lower()
+        ids = self.by_fio.get(key)
+        if ids is not None:
+            ids.discard(p.id)
+            if not ids:
+                del self.by_fio[key]
+        if p.badge and self.by_badge.get(p.badge) == p.id:
+            del self.by_badge[p.badge]
+
+    def find_fio(self, fio):
+        return self.by_fio.get(fio.lower(), set())
+
+    def find_badge(self, badge):
+        return self.by_badge.get(badge)
+
+    def find(self, query):
+        # Совпадения в порядке таблицы: [(sort_key(fio), id)]
+        if not self.search.ready:
+            # Фоновое построение ещё не закончилось: строим здесь
+            items, token = self.search_items()
+            self.install_search(build_index(items), token)
+        people = self.people
+        return sorted((people[pid].key, pid) for pid in self.search.search(query))
+
+    def search_items(self):
+        # Снимок для построения индекса в рабочем потоке; изменения строк
+        # до install_search копятся и накладываются на готовый индекс
+        self.search_dirty = set()
+        return [(p.id, p.fio) for p in self.people.values()], self.search_dirty
+
+    def install_search(self, index, token):
+        # token — из search_items(); после load/remove_all индекс устарел
+        if self.search.ready or token is not self.search_dirty:
+            return
+        self.search_dirty = None
+        for pid in token:
+            if pid in index.names:
+                index.remove(pid)
+            p = self.people.get(pid)
+            if p is not None:
+                index.add(pid, p.fio)
+        index.ready = True
+        self.search = index
+
+    def _search_changed(self, pid):
+        if self.search_dirty is not None:
+            self.search_dirty.add(pid)
+
+    # ====== Порядок ======
+    def index_of(self, pid):
+        return bisect_left(self.order, (self.people[pid].key, pid))
+
+    def sorted(self):
+        people = self.people
+        return [people[pid] for _, pid in self.order]
+
+    def sort(self):
+        self.order.sort()
+        heapq.heapify(self.deadlines)
+        if self.search.ready:
+            self.search.sort()
+
+    # ====== Счётчики ======
+    # Итоги поддерживаются при каждом изменении: вычитаем вклад строки до
+    # изменения и прибавляем после, без пересчёта по всему списку.
+    @staticmethod
+    def _zero_counts():
+        counts = dict.fromkeys(("total", "arrived", "late", "ontime"), 0)
+        counts.update(dict.fromkeys(STATUSES, 0))
+        return counts
+
+    def _count(self, p, d):
+        c = self.counts
+        c["total"] += d
+        c[p.status] = c.get(p.status, 0) + d
+        if p.status == PRESENT and p.fact is not None:
+            c["arrived"] += d
+            self.facts[p.slot] = (p.fact - EPOCH).total_seconds() / 60 if d > 0 else math.nan
+            if self.is_late(p):
+                c["late"] += d
+            else:
+                c["ontime"] += d
+
+    def recount(self):
+        self.counts = self._zero_counts()
+        self.facts = array("d", [math.nan]) * len(self.facts)
+        for p in self.people.values():
+            self._count(p, 1)
+
+    # ====== Опоздание ======
+    def _update_late(self, p):
+        if p.fact is None or self.start_time is None:
+            p.late = None
+            return
+        late = p.fact - (self.start_time + timedelta(hours=p.arrival))
+        p.late = late if late > timedelta(0) else timedelta(0)
+
+    def late_text(self, p):
+        return format_timedelta(p.late) if p.late is not None else ""
+
+    def is_late(self, p):
+        return p.status == PRESENT and p.late is not None and p.late >= LATE_THRESHOLD
+
+    def is_ontime(self, p):
+        return p.status == PRESENT and p.fact is not None and not self.is_late(p)
+
+    def tag(self, p):
+        if p.status != PRESENT:
+            return "other"
+        if self.is_late(p):
+            return "late"
+        if p.fact:
+            return "ontime"
+        if p.id in self.overdue:
+            return "overdue"
+        return ""
+
+    # ====== Сроки прибытия ======
+    # Вместо пересчёта всех строк по таймеру держим кучу сроков: снимаем с
+    # вершины только то, что уже наступило. Устаревшие записи (человек пришёл,
+    # сменил статус или время) отбрасываются при снятии.
+    def deadline(self, p):
+        # Позже этого момента прибытие уже считается опозданием
+        return self.start_time + timedelta(hours=p.arrival) + LATE_THRESHOLD
+
+    def _waiting(self, p):
+        return self.start_time is not None and p.status == PRESENT and p.fact is None
+
+    def _schedule(self, p):
+        self.overdue.discard(p.id)
+        if self._waiting(p):
+            heapq.heappush(self.deadlines, (self.deadline(p), p.id))
+
+    def _schedule_all(self):
+        self.overdue.clear()
+        self.deadlines = [(self.deadline(p), p.id) for p in self.people.values() if self._waiting(p)]
+        heapq.heapify(self.deadlines)
+
+    def _valid(self, entry):
+        when, pid = entry
+        p = self.people.get(pid)
+        return p is not None and self._waiting(p) and self.deadline(p) == when
+
+    def next_deadline(self):
+        heap = self.deadlines
+        while heap and not self._valid(heap[0]):
+            heapq.heappop(heap)
+        return heap[0][0] if heap else None
+
+    def advance(self, now):
+        # Переносит в overdue всех, чей срок наступил к now; возвращает их id
+        heap = self.deadlines
+        due = []
+        while heap and heap[0][0] <= now:
+            entry = heapq.heappop(heap)
+            pid = entry[1]
+            if self._valid(entry) and pid not in self.overdue:
+                self.overdue.add(pid)
+                due.append(pid)
+        return due
+
+    def values(self, p, num=""):
+        fact = p.fact.strftime("%H:%M") if p.fact else ""
+        return (num, p.pos, p.fio, p.arr, fact, self.late_text(p), p.status)
+
+    # ====== Изменения ======
+    def add(self, pos, fio, arr, status=PRESENT, fact=None, pid=None, keep_order=True, badge=None):
+        # keep_order=False для пакетной загрузки: потом один вызов sort()
+        if pid is None:
+            pid = self.next_id
+        self.next_id = max(self.next_id, pid + 1)
+        p = Person(pid, pos, fio, arr, fact, status, badge)
+        if self.free_slots:
+            p.slot = self.free_slots.pop()
+        else:
+            p.slot = len(self.facts)
+            self.facts.append(math.nan)
+        self._update_late(p)
+        self.people[pid] = p
+        self._index(p)
+        self._count(p, 1)
+        if keep_order:
+            insort(self.order, (p.key, pid))
+            self._schedule(p)
+        else:
+            self.order.append((p.key, pid))
+            if self._waiting(p):
+                self.deadlines.append((self.deadline(p), pid))
+        if self.search.ready:
+            self.search.add(pid, fio, keep_order)
+        self._search_changed(pid)
+        return p
+
+    def remove(self, pid):
+        idx = self.index_of(pid)
+        del self.order[idx]
+        p = self.people.pop(pid)
+        self._unindex(p)
+        if self.search.ready:
+            self.search.remove(pid)
+        self._search_changed(pid)
+        self._count(p, -1)
+        self.free_slots.append(p.slot)
+        self.overdue.discard(pid)
+        return p
+
+    def remove_many(self, pids):
+        # Пакетное удаление: порядок пересобирается одним проходом, а не
+        # сдвигом списка на каждую строку
+        gone = set(pids)
+        removed = []
+        for pid in gone:
+            p = self.people.pop(pid)
+            self._unindex(p)
+            self._count(p, -1)
+            self.free_slots.append(p.slot)
+            self.overdue.discard(pid)
+            removed.append(p)
+        self.order[:] = [e for e in self.order if e[1] not in gone]
+        if self.search.ready:
+            if len(gone) > REBUILD_SEARCH:
+                self.search.clear()
+            else:
+                for pid in gone:
+                    self.search.remove(pid)
+        if self.search_dirty is not None:
+            self.search_dirty |= gone
+        return removed
+
+    def remove_all(self):
+        self.people.clear()
+        self.by_fio.clear()
+        self.by_badge.clear()
+        self.order.clear()
+        self.search.clear()
+        self.search_dirty = None
+        self.counts = self._zero_counts()
+        self.deadlines = []
+        self.overdue.clear()
+        self.facts = array("d")
+        self.free_slots = []
+
+    def rename(self, pid, fio):
+        # Возвращает (старая позиция, новая позиция) в порядке сортировки
+        p = self.people[pid]
+        old = self.index_of(pid)
+        del self.order[old]
+        self._unindex(p)
+        p.fio = fio
+        p.key = sort_key(fio)
+        self._index(p)
+        if self.search.ready:
+            self.search.remove(pid)
+            self.search.add(pid, fio)
+        self._search_changed(pid)
+        insort(self.order, (p.key, pid))
+        return old, self.index_of(pid)
+
+    def set_badge(self, pid, badge):
+        # Один пропуск — один человек; занятый номер не переназначается
+        badge = badge or None
+        owner = self.by_badge.get(badge) if badge else None
+        if owner is not None and owner != pid:
+            return False
+        p = self.people[pid]
+        if p.badge and self.by_badge.get(p.badge) == pid:
+            del self.by_badge[p.badge]
+        p.badge = badge
+        if badge:
+            self.by_badge[badge] = pid
+        return True
+
+    def set_pos(self, pid, pos):
+        self.people[pid].pos = pos
+
+    def set_arrival(self, pid, arr):
+        p = self.people[pid]
+        self._count(p, -1)
+        p.arr = arr
+        p.arrival = parse_hours(arr)
+        self._update_late(p)
+        self._count(p, 1)
+        self._schedule(p)
+
+    def set_status(self, pid, status):
+        p = self.people[pid]
+        self._count(p, -1)
+        p.status = status
+        self._count(p, 1)
+        self._schedule(p)
+
+    def set_fact(self, pid, fact):
+        p = self.people[pid]
+        self._count(p, -1)
+        p.fact = fact
+        self._update_late(p)
+        self._count(p, 1)
+        self._schedule(p)
+
+    def mark(self, pid, now=None):
+        if not self.start_time:
+            return False
+        p = self.people[pid]
+        if p.fact is not None or p.status != PRESENT:
+            return False
+        self._count(p, -1)
+        p.fact = now or datetime.now()
+        self._update_late(p)
+        self._count(p, 1)
+        self.overdue.discard(pid)
+        return True
+
+    def start(self, now=None):
+        self.set_start(now or datetime.now())
+
+    def set_start(self, when):
+        # when=None — как до запуска (нужно для отмены первого запуска)
+        self.start_time = when
+        for p in self.people.values():
+            self._update_late(p)
+        self.recount()
+        self._schedule_all()
+
+    def reset(self):
+        self.start_time = None
+        for p in self.people.values():
+            p.fact = None
+            p.status = PRESENT
+            p.late = None
+        self.recount()
+        self.deadlines = []
+        self.overdue.clear()
+
+    # ====== Сохранение ======
+    def to_record(self, p):
+        return {"id": p.id, "pos": p.pos, "fio": p.fio, "arr": p.arr,
+                "fact": iso(p.fact), "status": p.status, "badge": p.badge}
+
+    def add_record(self, r, keep_order=True):
+        if "values" in r:
+            # Старый формат: значения строки Treeview
+            vals = r["values"]
+            pos, fio = vals[1], str(vals[2])
+            arr = hours_text(r["arrival"])
+        else:
+            pos, fio, arr = r["pos"], r["fio"], r["arr"]
+        return self.add(pos, fio, arr, r["status"], from_iso(r["fact"]), r.get("id"), keep_order,
+                        r.get("badge"))
+
+    def apply(self, record):
+        # Применяет запись журнала (в том числе пришедшую с другой станции)
+        # через те же изменения, что и UI, чтобы индексы и счётчики не расходились
+        op = record["op"]
+        if op == "row":
+            r = record["row"]
+            p = self.people.get(r["id"])
+            if p is None:
+                return self.add_record(r)
+            if p.fio != r["fio"]:
+                self.rename(p.id, r["fio"])
+            p.pos = r["pos"]
+            if p.arr != r["arr"]:
+                self.set_arrival(p.id, r["arr"])
+            if p.status != r["status"]:
+                self.set_status(p.id, r["status"])
+            if p.badge != r.get("badge"):
+                self.set_badge(p.id, r.get("badge"))
+            fact = from_iso(r["fact"])
+            if p.fact != fact:
+                self.set_fact(p.id, fact)
+            return p
+        if op == "del":
+            if record["id"] in self.people:
+                self.remove(record["id"])
+        elif op == "batch":
+            records = record["records"]
+            people = self.people
+            if all(r["op"] == "del" for r in records):
+                self.remove_many([r["id"] for r in records if r["id"] in people])
+            elif all(r["op"] == "row" and r["row"]["id"] not in people for r in records):
+                # Только новые строки (вставка, отмена удаления): одна сортировка в конце
+                for r in records:
+                    self.add_record(r["row"], keep_order=False)
+                self.sort()
+            else:
+                for r in records:
+                    self.apply(r)
+        elif op == "start":
+            self.set_start(from_iso(record["start"]))
+        elif op == "clear":
+            self.reset()
+        elif op == "wipe":
+            self.remove_all()
+        return None
+
+    def snapshot(self):
+        return {"start": iso(self.start_time),
+                "rows": [self.to_record(p) for p in self.people.values()]}
+
+    def load(self, data):
+        self.remove_all()
+        self.start_time = from_iso(data["start"])
+        # Сборщик мусора на больших списках срабатывает много раз подряд,
+        # хотя ни один созданный объект мусором не является
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            for r in data["rows"]:
+                self.add_record(r, keep_order=False)
+        finally:
+            if enabled:
+                gc.enable()
+        self.sort()
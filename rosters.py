@@ -0,0 +1,116 @@
+import json, os, re
+
+from roster import Roster, iso
+from storage import BACKUPS, DATA_FILE, Journal, generation, journal_path, lock_data, lock_path, write_atomic
+
+# Именованные списки (подразделения, смены) в одном окне. У каждого свой
+# снимок и журнал; в память загружен только активный. Для остальных в
+# каталоге rosters.json хранятся итоги — по ним считается сводка по всем
+# спискам без чтения строк. Итоги привязаны к размеру и времени изменения
+# файлов списка: если файлы менялись без окна, итоги считаются заново.
+
+INDEX_FILE = "rosters.json"
+ROSTERS_DIR = "rosters"
+DEFAULT_ROSTER = "Основной"  # его файл — прежний data.json
+
+
+def file_stamp(data_file):
+    stamp = []
+    for path in (data_file, journal_path(data_file)):
+        try:
+            st = os.stat(path)
+            stamp.append([st.st_size, st.st_mtime_ns])
+        except OSError:
+            stamp.append(None)
+    return stamp
+
+
+def roster_summary(roster):
+    return dict(roster.counts, start=iso(roster.start_time))
+
+
+class Rosters:
+    def __init__(self, path=INDEX_FILE, default_file=DATA_FILE):
+        self.path = path
+        self.active = DEFAULT_ROSTER
+        self.items = {DEFAULT_ROSTER: {"file": default_file, "summary": None, "stamp": None}}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf8") as f:
+                data = json.load(f)
+            self.items = data["rosters"]
+            if data.get("active") in self.items:
+                self.active = data["active"]
+
+    def save(self):
+        write_atomic(self.path, json.dumps({"active": self.active, "rosters": self.items},
+                                           ensure_ascii=False, indent=1))
+
+    def names(self):
+        return list(self.items)
+
+    def file(self, name):
+        return self.items[name]["file"]
+
+    def create(self, name):
+        name = name.strip()
+        if not name:
+            raise ValueError("Пустое название списка")
+        if name in self.items:
+            raise ValueError(f"Список «{name}» уже есть")
+        os.makedirs(ROSTERS_DIR, exist_ok=True)
+        base = re.sub(r"[^\w-]+", "_", name).strip("_") or "roster"
+        files = {item["file"] for item in self.items.values()}
+        path = os.path.join(ROSTERS_DIR, base + ".json")
+        n = 2
+        while path in files or os.path.exists(path):
+            path = os.path.join(ROSTERS_DIR, f"{base}_{n}.json")
+            n += 1
+        self.items[name] = {"file": path, "summary": roster_summary(Roster()), "stamp": file_stamp(path)}
+        self.save()
+
+    def delete(self, name):
+        if name == self.active:
+            raise ValueError("Нельзя удалить открытый список")
+        # Список, открытый командной строкой, не удаляется
+        lock = lock_data(self.items[name]["file"])
+        try:
+            item = self.items.pop(name)
+            for k in range(BACKUPS + 1):
+                for path in (item["file"], journal_path(item["file"])):
+                    path = generation(path, k)
+                    if os.path.exists(path):
+                        os.remove(path)
+        finally:
+            lock.close()
+        try:
+            os.remove(lock_path(item["file"]))
+        except OSError:
+            pass
+        self.save()
+
+    def remember(self, name, roster):
+        # Вызывается, когда всё записанное по списку уже на диске
+        item = self.items[name]
+        item["summary"] = roster_summary(roster)
+        item["stamp"] = file_stamp(item["file"])
+
+    def summary(self, name):
+        item = self.items[name]
+        if item["summary"] is None or item["stamp"] != file_stamp(item["file"]):
+            roster = Roster()
+            journal = Journal(item["file"])
+            roster.load(journal.load())
+            journal.close()
+            self.remember(name, roster)
+            self.save()
+        return item["summary"]
+
+    def totals(self, live=None):
+        # [(название, итоги)]; live — итоги открытого списка прямо из модели
+        result = []
+        for name in self.items:
+            if name == self.active and live is not None:
+                result.append((name, roster_summary(live)))
+            else:
+                result.append((name, self.summary(name)))
+        return result
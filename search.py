@@ -0,0 +1,121 @@
+from bisect import bisect_left, insort
+
+# Индекс поиска по ФИО. Имена приводятся к одной латинской записи
+# (регистр, ё/е, кириллица -> латиница), поэтому "Ёлкин", "елкин" и
+# "elkin" находят одно и то же.
+
+TRANSLIT = str.maketrans({
+    "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e", "ё": "e",
+    "ж": "zh", "з": "z", "и": "i", "й": "i", "к": "k", "л": "l", "м": "m",
+    "н": "n", "о": "o", "п": "p", "р": "r", "с": "s", "т": "t", "у": "u",
+    "ф": "f", "х": "kh", "ц": "ts", "ч": "ch", "ш": "sh", "щ": "shch",
+    "ъ": "", "ы": "y", "ь": "", "э": "e", "ю": "iu", "я": "ia",
+})
+# Распространённые латинские варианты записи тех же букв
+LATIN = [("yu", "iu"), ("ya", "ia"), ("yo", "e"), ("j", "i"), ("w", "v"), ("x", "ks"),
+         ("iy", "i"), ("ii", "i")]
+
+EMPTY = frozenset()
+
+
+def fold(text):
+    text = text.casefold().translate(TRANSLIT)
+    for a, b in LATIN:
+        text = text.replace(a, b)
+    return text
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class SearchIndex:
+    def __init__(self):
+        self.names = {}   # id -> свёрнутое ФИО
+        self.grams = {}   # триграмма -> {id}
+        self.words = []   # [(слово, id)] по алфавиту, для поиска по началу слова
+        self.ready = False  # заполняется владельцем: в фоне после загрузки или при первом поиске
+
+    def add(self, pid, fio, keep_order=True):
+        name = fold(fio)
+        self.names[pid] = name
+        for g in trigrams(name):
+            self.grams.setdefault(g, set()).add(pid)
+        for w in name.split():
+            if keep_order:
+                insort(self.words, (w, pid))
+            else:
+                self.words.append((w, pid))
+
+    def remove(self, pid):
+        name = self.names.pop(pid)
+        for g in trigrams(name):
+            ids = self.grams[g]
+            ids.discard(pid)
+            if not ids:
+                del self.grams[g]
+        for w in name.split():
+            idx = bisect_left(self.words, (w, pid))
+            del self.words[idx]
+
+    def clear(self):
+        self.names.clear()
+        self.grams.clear()
+        self.words.clear()
+        self.ready = False
+
+    def sort(self):
+        self.words.sort()
+
+    def _prefix(self, token):
+        words = self.words
+        found = set()
+        i = bisect_left(words, (token,))
+        while i < len(words) and words[i][0].startswith(token):
+            found.add(words[i][1])
+            i += 1
+        return found
+
+    def _substring(self, token):
+        sets = sorted((self.grams.get(g, EMPTY) for g in trigrams(token)), key=len)
+        if not sets[0]:
+            return set()
+        found = set(sets[0])
+        for ids in sets[1:]:
+            found &= ids
+            if not found:
+                return found
+        names = self.names
+        return {pid for pid in found if token in names[pid]}
+
+    def _estimate(self, token):
+        if len(token) < 3:
+            return len(self.names)
+        return min(len(self.grams.get(g, EMPTY)) for g in trigrams(token))
+
+    def search(self, query):
+        # Каждое слово запроса должно найтись: короткое — как начало любого
+        # слова ФИО, от трёх букв — как подстрока
+        found = None
+        names = self.names
+        # Начинаем с самого редкого слова: дальше только фильтруем кандидатов
+        for token in sorted(fold(query).split(), key=self._estimate):
+            if found is None:
+                found = self._prefix(token) if len(token) < 3 else self._substring(token)
+            elif len(token) < 3:
+                found = {pid for pid in found
+                         if any(w.startswith(token) for w in names[pid].split())}
+            else:
+                found = {pid for pid in found if token in names[pid]}
+            if not found:
+                return set()
+        return found or set()
+
+
+def build_index(items):
+    # items — [(id, ФИО)]; можно вызывать из рабочего потока
+    index = SearchIndex()
+    for pid, fio in items:
+        index.add(pid, fio, keep_order=False)
+    index.sort()
+    return index
@@ -0,0 +1,163 @@
+import tkinter as tk
+import time
+
+# Всплывающий список значений (должности, время прибытия, статусы, часы
+# выгрузки). Окно со строками строится один раз на список, дальше его
+# только переставляют, показывают и прячут. Управление: мышь, стрелки,
+# Home/End, Enter, Escape и ввод начала значения.
+
+ITEM_HEIGHT = 32
+MIN_WIDTH = 200
+TYPE_RESET = 1000  # мс паузы при вводе, после которой набор начинается заново
+BG = "#1f1f1f"
+HOVER = "#5a5a5a"
+
+
+class Selector:
+    def __init__(self, master, values, font):
+        self.master = master
+        self.values = list(values)
+        self.keys = [v.casefold() for v in self.values]
+        self.on_select = None
+        self.active = None
+        self.owner = None      # окно, которому вернуть захват после закрытия
+        self.typed = ""
+        self.typed_at = 0.0
+        self.open_ms = None    # задержка последнего открытия до отрисовки
+        self.font = font
+
+        popup = self.popup = tk.Toplevel(master)
+        popup.withdraw()
+        popup.overrideredirect(True)
+        popup.configure(bg="#1e1e1e")
+        self.container = tk.Frame(popup, bg=BG, highlightthickness=1, highlightbackground="#4a4a4a")
+        self.container.pack(fill="both", expand=True)
+        self.build()
+
+        popup.bind("<Escape>", lambda e: self.hide())
+        popup.bind("<Up>", lambda e: self.move(-1))
+        popup.bind("<Down>", lambda e: self.move(1))
+        popup.bind("<Home>", lambda e: self.set_active(0))
+        popup.bind("<End>", lambda e: self.set_active(len(self.values) - 1))
+        popup.bind("<Return>", lambda e: self.choose(self.active))
+        popup.bind("<KP_Enter>", lambda e: self.choose(self.active))
+        popup.bind("<Key>", self.on_key)
+
+    def build(self):
+        for child in self.container.winfo_children():
+            child.destroy()
+        self.labels = []
+        for k, text in enumerate(self.values):
+            row = tk.Frame(self.container, bg=BG, height=ITEM_HEIGHT)
+            row.pack_propagate(False)
+            row.pack(fill="x")
+            lbl = tk.Label(row, text=text, bg=BG, fg="white",
+                           font=self.font, anchor="w", padx=10)
+            lbl.pack(fill="both", expand=True)
+            tk.Frame(self.container, bg="#3a3a3a", height=1).pack(fill="x")
+            lbl.bind("<Enter>", lambda e, k=k: self.set_active(k))
+            lbl.bind("<ButtonRelease-1>", lambda e, k=k: self.choose(k))
+            self.labels.append(lbl)
+        self.height = (ITEM_HEIGHT + 1) * len(self.values) + 2
+
+    def set_values(self, values):
+        # Для меняющихся списков (списки подразделений): то же окно, новые строки
+        values = list(values)
+        if values == self.values:
+            return
+        self.hide()
+        self.values = values
+        self.keys = [v.casefold() for v in values]
+        self.active = None
+        self.build()
+
+    def visible(self):
+        return self.on_select is not None
+
+    def show(self, x, y, width, on_select, parent=None, modal=False, current=None):
+        t = time.perf_counter()
+        self.hide()
+        popup = self.popup
+        width = max(MIN_WIDTH, width)
+        # Подгоняем по экрану
+        if y + self.height > popup.winfo_screenheight():
+            y = max(0, y - self.height)
+        if x + width > popup.winfo_screenwidth():
+            x = max(0, popup.winfo_screenwidth() - width)
+        popup.geometry(f"{width}x{self.height}+{x}+{y}")
+        popup.transient(parent or "")
+        self.on_select = on_select
+        self.typed = ""
+        self.set_active(self.values.index(current) if current in self.values else None)
+        popup.deiconify()
+        popup.attributes("-topmost", True)
+        popup.lift()
+        if modal and parent is not None:
+            # Захват окна-родителя (диалога) переходит к списку и возвращается при закрытии
+            try:
+                popup.grab_set()
+                self.owner = parent
+            except tk.TclError:
+                self.owner = None
+        popup.focus_force()
+        popup.update_idletasks()
+        self.open_ms = (time.perf_counter() - t) * 1000
+
+    def hide(self):
+        if self.on_select is None:
+            return
+        self.on_select = None
+        popup = self.popup
+        popup.grab_release()
+        popup.withdraw()
+        owner, self.owner = self.owner, None
+        if owner is not None and owner.winfo_exists():
+            try:
+                owner.grab_set()
+            except tk.TclError:
+                pass
+
+    def choose(self, k):
+        if k is None or self.on_select is None:
+            return
+        on_select = self.on_select
+        self.hide()
+        on_select(self.values[k])
+
+    def set_active(self, k):
+        if self.active is not None:
+            self.labels[self.active].configure(bg=BG)
+        self.active = k
+        if k is not None:
+            self.labels[k].configure(bg=HOVER)
+
+    def move(self, step):
+        if self.active is None:
+            self.set_active(0 if step > 0 else len(self.values) - 1)
+        else:
+            self.set_active((self.active + step) % len(self.values))
+
+    def on_key(self, event):
+        # Ввод начала значения выделяет первое подходящее; повтор той же
+        # буквы перебирает значения на эту букву
+        char = event.char
+        if not char or not char.isprintable():
+            return
+        now = time.monotonic()
+        if now - self.typed_at > TYPE_RESET / 1000:
+            self.typed = ""
+        self.typed_at = now
+        char = char.casefold()
+        start = 0 if self.active is None else self.active
+        if self.typed == char:
+            start += 1
+            prefix = char
+        else:
+            self.typed += char
+            prefix = self.typed
+        n = len(self.values)
+        for i in range(n):
+            k = (start + i) % n
+            if self.keys[k].startswith(prefix):
+                self.set_active(k)
+                return
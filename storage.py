@@ -0,0 +1,442 @@
+import gc, json, os, threading, time, zlib
+
+# Журнал изменений: одна компактная JSON-строка на изменение.
+# Снимок data.json периодически пересобирается из журнала (компакция).
+COMPACT_EVERY = 500
+DATA_FILE = "data.json"
+
+# Надёжность записи. Снимок пишется во временный файл, сбрасывается на
+# диск и подменяет старый; первая строка — размер и CRC32 остального.
+# При пересборке прежние снимки сдвигаются в data.json.1..N вместе с
+# журналами, которые вели от каждого к следующему: при повреждённом
+# снимке загрузка берёт последнее целое поколение и дочитывает журналы.
+# Когда сбрасывать журнал на диск (fsync): "always" — каждую запись,
+# "interval" — не реже FSYNC_INTERVAL мс, "close" — только при закрытии.
+FSYNC = os.environ.get("ARRIVAL_FSYNC", "interval")
+FSYNC_INTERVAL = int(os.environ.get("ARRIVAL_FSYNC_MS", "1000"))
+BACKUPS = int(os.environ.get("ARRIVAL_BACKUPS", "3"))  # поколений снимка кроме текущего
+RETRY_DELAY = 2  # сек. до повтора записи после ошибки диска
+
+# Снимок хранится по столбцам: имена полей не повторяются в каждой строке,
+# а должность/время/статус кодируются номерами из короткого словаря.
+SNAPSHOT_VERSION = 2
+FIELDS = ("id", "pos", "fio", "arr", "fact", "status", "badge")
+CODED = ("pos", "arr", "status")
+
+
+def journal_path(data_file):
+    return os.path.splitext(data_file)[0] + ".journal"
+
+
+def lock_path(data_file):
+    return os.path.splitext(data_file)[0] + ".lock"
+
+
+class DataLocked(OSError):
+    pass
+
+
+def lock_data(data_file):
+    # Файл списка пишет один процесс: окно или командная строка. Блокировка
+    # держится, пока открыт возвращённый файл, и снимается ОС, если процесс упал
+    f = open(lock_path(data_file), "a+")
+    try:
+        if os.name == "nt":
+            import msvcrt
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        raise DataLocked(f"{data_file} уже открыт другим процессом (окно или python -m cli)")
+    return f
+
+
+def generation(path, k):
+    return path if k == 0 else f"{path}.{k}"
+
+
+def sync_dir(path):
+    # Переименование надёжно, когда записан и каталог (на Windows так нельзя)
+    if os.name != "posix":
+        return
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def write_atomic(path, text, fsync=True):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf8") as f:
+        f.write(text)
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp, path)
+    if fsync:
+        sync_dir(path)
+
+
+def pack_snapshot(text):
+    body = text.encode("utf8")
+    header = json.dumps({"size": len(body), "crc32": zlib.crc32(body)})
+    return header + "\n" + text
+
+
+def read_snapshot(path):
+    # Снимок с проверкой; ValueError — файл обрезан или испорчен
+    with open(path, "rb") as f:
+        raw = f.read()
+    head, _, body = raw.partition(b"\n")
+    try:
+        header = json.loads(head)
+    except ValueError:
+        header = None
+    if not isinstance(header, dict) or "crc32" not in header:
+        return json.loads(raw)  # файл без заголовка: прежний формат, проверить нечем
+    if len(body) != header["size"] or zlib.crc32(body) != header["crc32"]:
+        raise ValueError("контрольная сумма не сходится")
+    return json.loads(body)
+
+
+def encode_snapshot(data):
+    rows = data["rows"]
+    cols = {f: [r.get(f) for r in rows] for f in FIELDS}
+    for f in CODED:
+        values = list(dict.fromkeys(cols[f]))
+        codes = {v: i for i, v in enumerate(values)}
+        cols[f] = {"values": values, "codes": [codes[v] for v in cols[f]]}
+    return {"version": SNAPSHOT_VERSION, "start": data["start"], "cols": cols}
+
+
+def decode_snapshot(snap):
+    cols = snap["cols"]
+    for f in CODED:
+        values = cols[f]["values"]
+        cols[f] = [values[c] for c in cols[f]["codes"]]
+    # Столбцы, добавленные позже (например, badge), в старых снимках отсутствуют
+    n = len(cols["id"])
+    for f in FIELDS:
+        cols.setdefault(f, [None] * n)
+    rows = [dict(zip(FIELDS, vals)) for vals in zip(*(cols[f] for f in FIELDS))]
+    return {"start": snap["start"], "rows": rows}
+
+
+def dump_record(record):
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+
+
+def apply_record(data, rows, record):
+    # rows: id -> строка снимка, чтобы воспроизведение было O(1) на запись
+    op = record["op"]
+    if op == "row":
+        row = record["row"]
+        rows[row["id"]] = row
+    elif op == "del":
+        rows.pop(record["id"], None)
+    elif op == "start":
+        data["start"] = record["start"]
+    elif op == "clear":
+        data["start"] = None
+        # Строки заменяются, а не правятся на месте: те же словари могут жить в записях отмены
+        for pid, r in rows.items():
+            rows[pid] = dict(r, fact=None, status="Присутствует")
+    elif op == "wipe":
+        rows.clear()
+    elif op == "batch":
+        # Пачка изменений одной строкой журнала: после сбоя применяется целиком или никак
+        for r in record["records"]:
+            apply_record(data, rows, r)
+
+
+class Journal:
+    def __init__(self, data_file, fsync=FSYNC, backups=BACKUPS):
+        self.data_file = data_file
+        self.path = journal_path(data_file)
+        self.fsync = fsync
+        self.backups = backups
+        self.count = 0
+        self.migrate = False  # снимок в старом формате, нужно переписать
+        self.recovered = None  # (поколение, ошибки), если текущий снимок не прочитался
+        self.dirty = False     # есть записи, ещё не сброшенные на диск
+        self.synced_at = time.monotonic()
+        self.torn = None       # длина целой части журнала, если запись оборвалась
+        self.f = None
+
+    def _read(self):
+        # Последнее целое поколение снимка: (данные, номер поколения)
+        errors = []
+        for k in range(self.backups + 1):
+            path = generation(self.data_file, k)
+            if not os.path.exists(path):
+                continue
+            enabled = gc.isenabled()
+            gc.disable()
+            try:
+                data = read_snapshot(path)
+                if "cols" in data:
+                    data = decode_snapshot(data)
+                elif k == 0:
+                    self.migrate = True
+                if not isinstance(data.get("rows"), list):
+                    raise ValueError("нет строк")
+                return data, k, errors
+            except (ValueError, KeyError, TypeError, IndexError, OSError) as e:
+                errors.append(f"{path}: {e}")
+            finally:
+                if enabled:
+                    gc.enable()
+        return {"start": None, "rows": []}, 0, errors
+
+    def load(self):
+        data, gen, errors = self._read()
+        self.recovered = (gen, errors) if errors else None
+        # Старые файлы без id: нумеруем строки по порядку
+        next_id = max((r.get("id", 0) for r in data["rows"]), default=0) + 1
+        for r in data["rows"]:
+            if "id" not in r:
+                r["id"] = next_id
+                next_id += 1
+        rows = {r["id"]: r for r in data["rows"]}
+        self.count = 0
+        self.torn = None
+        # Журналы от взятого поколения до текущего: записи строк полные,
+        # поэтому пропавший журнал теряет только свои изменения
+        for k in range(gen, -1, -1):
+            path = generation(self.path, k)
+            if not os.path.exists(path):
+                continue
+            with open(path, "rb") as f:
+                good = 0
+                for line in f:
+                    complete = line.endswith(b"\n")
+                    try:
+                        record = json.loads(line) if complete and line.strip() else None
+                    except ValueError:
+                        complete = False
+                    if not complete:
+                        # Недописанная последняя строка после сбоя; у текущего
+                        # журнала её отрежет первая же запись
+                        if k == 0:
+                            self.torn = good
+                        break
+                    good += len(line)
+                    if record is None:
+                        continue
+                    apply_record(data, rows, record)
+                    if k == 0:
+                        self.count += 1
+        if gen:
+            self.migrate = True  # пересобрать снимок из восстановленного
+        data["rows"] = list(rows.values())
+        return data
+
+    def append(self, record):
+        self.append_many([record])
+
+    def append_many(self, records):
+        # Пачка ложится целиком или никак: при ошибке хвост отрезается
+        # до прежней длины, чтобы повтор не оставил оборванную строку
+        if self.torn is not None:
+            if self.f is not None:
+                self.f.close()
+                self.f = None
+            os.truncate(self.path, self.torn)
+            self.torn = None
+        if self.f is None:
+            self.f = open(self.path, "a", encoding="utf8")
+        start = self.f.tell()
+        try:
+            self.f.write("".join(dump_record(r) + "\n" for r in records))
+            self.f.flush()
+            self.dirty = True
+            if self.fsync == "always" or (self.fsync == "interval" and self.sync_wait() == 0):
+                self.sync()
+        except OSError:
+            self.torn = start
+            try:
+                self.f.close()
+            except OSError:
+                pass
+            self.f = None
+            raise
+        self.count += len(records)
+
+    def sync_wait(self):
+        # Сколько секунд ещё можно не сбрасывать журнал; None — без срока
+        if not self.dirty or self.fsync != "interval":
+            return None
+        return max(0.0, self.synced_at + FSYNC_INTERVAL / 1000 - time.monotonic())
+
+    def sync(self):
+        # Срок отсчитывается до fsync: при ошибке следующая попытка — через интервал
+        self.synced_at = time.monotonic()
+        if self.f is not None and self.dirty:
+            os.fsync(self.f.fileno())
+        self.dirty = False
+
+    def rotate(self):
+        # data.json -> .1 -> ... -> .N вместе с журналами. Сначала снимок,
+        # потом его журнал: при сбое посередине загрузка соберёт то же состояние
+        if not self.backups:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            return
+        if not os.path.exists(self.data_file):
+            # Текущего снимка нет (первая запись или сбой при сдвиге):
+            # поколения не сдвигаем, чтобы не потерять целое резервное
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            return
+        for k in range(self.backups - 1, -1, -1):
+            for path in (self.data_file, self.path):
+                src, dst = generation(path, k), generation(path, k + 1)
+                if os.path.exists(src):
+                    os.replace(src, dst)
+                elif os.path.exists(dst):
+                    os.remove(dst)  # не оставлять журнал от чужого снимка
+
+    def compact(self, data):
+        text = pack_snapshot(json.dumps(encode_snapshot(data), ensure_ascii=False, separators=(",", ":")))
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+        self.dirty = False
+        self.torn = None  # оборванный хвост уходит вместе с журналом в поколение .1
+        self.rotate()
+        write_atomic(self.data_file, text)
+        self.migrate = False
+        self.recovered = None
+        self.count = 0
+
+    def close(self):
+        if self.f is not None:
+            self.sync()
+            self.f.close()
+            self.f = None
+
+
+class Writer(threading.Thread):
+    # Фоновая запись на диск: пачка изменений сливается в одну запись,
+    # из нескольких запрошенных снимков пишется только последний.
+    # Поток держит свою копию строк (последний снимок плюс записанный журнал)
+    # и каждые COMPACT_EVERY записей сам сворачивает журнал в снимок, без UI.
+    def __init__(self, journal):
+        super().__init__(daemon=True)
+        self.journal = journal
+        self.cond = threading.Condition()
+        self.pending = []
+        self.snapshot = None
+        self.since_snapshot = 0
+        self.busy = False
+        self.stopping = False
+        self.writes = 0
+        self.error = None
+        self.retry_at = 0.0
+        self.state = None  # {"start": ...} копии; None — копии нет, снимок собирает UI
+        self.rows = None   # id -> строка копии
+
+    def seed(self, data):
+        # Загруженное состояние, которому соответствует журнал на диске
+        rows = {r["id"]: r for r in data["rows"]}
+        with self.cond:
+            self.state = {"start": data["start"]}
+            self.rows = rows
+
+    def append(self, record):
+        # True — пора снимок, а собрать его может только UI (копии ещё нет)
+        with self.cond:
+            self.pending.append(record)
+            self.since_snapshot += 1
+            self.cond.notify()
+            return self.rows is None and self.since_snapshot >= COMPACT_EVERY
+
+    def save(self, snapshot):
+        # Снимок уже содержит все изменения, поставленные в очередь до него
+        with self.cond:
+            self.snapshot = snapshot
+            self.pending = []
+            self.since_snapshot = 0
+            self.cond.notify()
+
+    def idle(self):
+        with self.cond:
+            return not self.busy and not self.pending and self.snapshot is None
+
+    def run(self):
+        while True:
+            with self.cond:
+                while not self.stopping:
+                    # После ошибки диска повтор не раньше чем через RETRY_DELAY
+                    delay = self.retry_at - time.monotonic()
+                    if delay > 0:
+                        self.cond.wait(delay)
+                        continue
+                    if self.pending or self.snapshot is not None:
+                        break
+                    # Отложенный fsync журнала делается здесь, а не в UI
+                    wait = self.journal.sync_wait()
+                    if wait == 0:
+                        break
+                    self.cond.wait(wait)
+                if not self.pending and self.snapshot is None and self.stopping:
+                    return
+                snapshot, self.snapshot = self.snapshot, None
+                records, self.pending = self.pending, []
+                self.busy = True
+            idle_sync = snapshot is None and not records
+            try:
+                if snapshot is not None:
+                    self.journal.compact(snapshot)
+                    self.writes += 1
+                    self.seed(snapshot)
+                    snapshot = None
+                if records:
+                    self.journal.append_many(records)
+                    self.writes += 1
+                    if self.rows is not None:
+                        for r in records:
+                            apply_record(self.state, self.rows, r)
+                    records = []
+                if self.rows is not None and self.journal.count >= COMPACT_EVERY:
+                    # Журнал сворачивается в снимок здесь: UI не собирает строки
+                    self.journal.compact({"start": self.state["start"], "rows": list(self.rows.values())})
+                    self.writes += 1
+                    with self.cond:
+                        self.since_snapshot = len(self.pending)
+                if idle_sync:
+                    self.journal.sync()
+                self.error = None
+            except OSError as e:
+                self.error = e
+                with self.cond:
+                    # Не записанное возвращается в очередь; более новый снимок
+                    # уже содержит всё, что было до него
+                    if self.snapshot is None:
+                        self.snapshot = snapshot
+                        self.pending[:0] = records
+                    self.retry_at = time.monotonic() + RETRY_DELAY
+                if self.stopping:
+                    return
+            finally:
+                with self.cond:
+                    self.busy = False
+                    self.cond.notify_all()
+
+    def flush(self, timeout=None):
+        with self.cond:
+            self.cond.wait_for(lambda: not self.busy and not self.pending and self.snapshot is None,
+                               timeout)
+
+    def stop(self, timeout=None):
+        with self.cond:
+            self.stopping = True
+            self.cond.notify_all()
+        self.join(timeout)
+        if not self.is_alive():
+            self.journal.close()
+        return not self.is_alive()
@@ -0,0 +1,340 @@
+import argparse, json, queue, socket, socketserver, threading, time, uuid
+
+from roster import Roster, from_iso
+from storage import Journal, Writer, dump_record
+
+# Синхронизация нескольких станций регистрации через общий сервер.
+# Протокол — JSON-строки с теми же записями, что и в журнале
+# (row/del/batch/start/clear/wipe), плюс hello/snapshot при подключении
+# и ack — подтверждение приёма записи станции по её номеру seq.
+# Сервер хранит общий список и рассылает каждое принятое изменение
+# всем станциям; станции применяют его к своей модели точечно.
+#
+# Запуск сервера: python sync.py --host 0.0.0.0 --port 8765
+# Станция подключается, если задана переменная ARRIVAL_SYNC=хост:порт.
+
+SYNC_PORT = 8765
+SERVER_FILE = "server.json"
+ID_BLOCK = 1_000_000   # диапазон id на одно подключение: новые строки станций не пересекаются
+RETRY_DELAY = 3        # сек. между попытками переподключения
+SEND_TIMEOUT = 5       # сек. на отправку, после чего связь считается оборванной
+SEND_CHUNK = 65536     # байт за одну отправку станции: таймаут отсчитывается на кусок
+SEND_BACKLOG = 10000   # сообщений в очереди станции на сервере, сверх — станция отключается
+
+
+def merge_row(old, new):
+    # Правило конфликтов: факт прибытия не затирается и не переписывается
+    # более поздней отметкой — остаётся самая ранняя. Остальные поля — последняя запись.
+    if old is None or not old["fact"]:
+        return new
+    if new["fact"] and from_iso(new["fact"]) < from_iso(old["fact"]):
+        return new
+    if new["fact"] == old["fact"]:
+        return new
+    return dict(new, fact=old["fact"])
+
+
+# ====== Сервер ======
+class SyncState:
+    def __init__(self, data_file):
+        self.lock = threading.Lock()
+        self.clients = set()
+        self.acked = {}  # станция -> номер последней принятой от неё записи
+        journal = Journal(data_file)
+        roster = Roster()
+        roster.load(journal.load())  # приводит старые форматы строк к текущему
+        self.start = roster.snapshot()["start"]
+        self.rows = {p.id: roster.to_record(p) for p in roster}
+        self.next_block = (max(self.rows, default=0) // ID_BLOCK + 1) * ID_BLOCK
+        if journal.count or journal.migrate:
+            journal.compact(self.snapshot())
+        # Журнал пишет фоновый поток: блокировка сервера не ждёт диск
+        self.writer = Writer(journal)
+        self.writer.seed(self.snapshot())
+        self.writer.start()
+
+    def snapshot(self):
+        return {"start": self.start, "rows": list(self.rows.values())}
+
+    def join(self, client):
+        with self.lock:
+            block = self.next_block
+            self.next_block += ID_BLOCK
+            self.clients.add(client)
+            # Под блокировкой: все рассылки после снимка встанут в очередь станции после него
+            client.send({"op": "snapshot", "data": self.snapshot(), "next_id": block})
+
+    def leave(self, client):
+        with self.lock:
+            self.clients.discard(client)
+
+    def _apply(self, record, sender):
+        # Возвращает принятую запись (возможно, исправленную) или None
+        op = record["op"]
+        if op == "row":
+            row = record["row"]
+            old = self.rows.get(row["id"])
+            # Отмена на станции возвращает строку как была, в том числе снимает отметку
+            merged = row if record.get("undo") else merge_row(old, row)
+            if merged == old:
+                if merged != row:
+                    # Станция проиграла конфликт: возвращаем ей верную строку
+                    sender.send({"op": "row", "row": merged})
+                return None
+            self.rows[row["id"]] = merged
+            return {"op": "row", "row": merged}
+        if op == "del":
+            if self.rows.pop(record["id"], None) is None:
+                return None
+        elif op == "batch":
+            records = [r for r in (self._apply(r, sender) for r in record["records"]) if r]
+            return {"op": "batch", "records": records} if records else None
+        elif op == "start":
+            self.start = record["start"]
+        elif op == "clear":
+            # Строки не меняются на месте: их читают потоки записи и отправки
+            self.start = None
+            self.rows = {pid: dict(r, fact=None, status="Присутствует") for pid, r in self.rows.items()}
+        elif op == "wipe":
+            self.rows = {}
+        else:
+            return None
+        return record
+
+    def apply(self, msg, sender):
+        seq = msg.pop("seq", None)
+        with self.lock:
+            # Повтор после обрыва связи: запись уже принята, нужно только подтверждение
+            if seq is None or seq > self.acked.get(sender.client_id, 0):
+                record = self._apply(msg, sender)
+                if record is not None:
+                    self.writer.append(record)
+                    # Отправителю тоже: тогда каждая станция применяет изменения
+                    # в порядке сервера и приходит к тому же состоянию
+                    for client in list(self.clients):
+                        client.send(record)
+            if seq is not None:
+                self.acked[sender.client_id] = seq
+                sender.send({"op": "ack", "seq": seq})
+
+
+class SyncHandler(socketserver.StreamRequestHandler):
+    # Приём — в потоке обработчика, отправка — в своём потоке у каждой станции:
+    # зависшая станция копит только свою очередь и не держит блокировку сервера
+    def setup(self):
+        super().setup()
+        self.client_id = None
+        self.outbox = queue.Queue(maxsize=SEND_BACKLOG)
+        self.alive = True
+        threading.Thread(target=self.pump, daemon=True).start()
+
+    def send(self, msg):
+        if not self.alive:
+            return
+        try:
+            self.outbox.put_nowait(msg)
+        except queue.Full:
+            # Станция не забирает данные — отключаем её, пусть переподключится
+            self.alive = False
+            self.server.state.clients.discard(self)
+            self.close()
+
+    def close(self):
+        try:
+            self.connection.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def pump(self):
+        while True:
+            msgs = [self.outbox.get()]
+            while True:
+                try:
+                    msgs.append(self.outbox.get_nowait())
+                except queue.Empty:
+                    break
+            if None in msgs:
+                return
+            try:
+                self.wfile.write("".join(dump_record(m) + "\n" for m in msgs).encode("utf8"))
+            except OSError:
+                self.alive = False
+                self.server.state.leave(self)
+                self.close()
+                return
+
+    def handle(self):
+        state = self.server.state
+        try:
+            for line in self.rfile:
+                line = line.strip()
+                if not line:
+                    continue
+                msg = json.loads(line)
+                if msg["op"] == "hello":
+                    self.client_id = msg.get("client")
+                    state.join(self)
+                else:
+                    state.apply(msg, self)
+        except (OSError, ValueError):
+            pass
+        finally:
+            state.leave(self)
+            self.alive = False
+            try:
+                self.outbox.put_nowait(None)
+            except queue.Full:
+                pass  # поток отправки упрётся в закрытый сокет и выйдет сам
+
+
+class SyncServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, data_file=SERVER_FILE):
+        self.state = SyncState(data_file)
+        super().__init__(address, SyncHandler)
+
+
+# ====== Станция ======
+class SyncClient:
+    # Сеть — в отдельных потоках: приём и отправка. send() из UI только ставит
+    # запись в очередь, UI забирает входящие сообщения из inbox через after().
+    # Запись хранится, пока сервер не подтвердит её приём (ack с её номером);
+    # после обрыва неподтверждённое уходит заново вслед за hello.
+    def __init__(self, host, port):
+        self.address = (host, port)
+        self.inbox = queue.Queue()
+        self.cond = threading.Condition()
+        self.sock = None
+        self.client_id = uuid.uuid4().hex  # по нему сервер узнаёт повторы после обрыва
+        self.seq = 0
+        self.outbox = []  # (номер, запись), ещё не подтверждённые сервером
+        self.sent = 0     # сколько из outbox уже отправлено по текущей связи
+        self.stopping = False
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def _write(self, sock, records):
+        # Зависший сервер или полуоткрытая связь: кусок не ушёл за SEND_TIMEOUT — обрыв
+        data = "".join(dump_record(r) + "\n" for r in records).encode("utf8")
+        for k in range(0, len(data), SEND_CHUNK):
+            sock.sendall(data[k:k + SEND_CHUNK])
+
+    def send(self, record):
+        with self.cond:
+            self.seq += 1
+            self.outbox.append((self.seq, record))
+            self.cond.notify_all()
+
+    def pump(self, sock):
+        # Отправка очереди; при ошибке всё неподтверждённое ждёт переподключения
+        try:
+            self._write(sock, [{"op": "hello", "client": self.client_id}])
+            while True:
+                with self.cond:
+                    while self.sent == len(self.outbox) and self.sock is sock and not self.stopping:
+                        self.cond.wait()
+                    if self.sock is not sock or self.stopping:
+                        return
+                    chunk = self.outbox[self.sent:]
+                    self.sent = len(self.outbox)
+                self._write(sock, [dict(r, seq=seq) for seq, r in chunk])
+        except OSError:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)  # приём увидит обрыв и переподключится
+            except OSError:
+                pass
+
+    def confirm(self, seq):
+        with self.cond:
+            n = 0
+            while n < len(self.outbox) and self.outbox[n][0] <= seq:
+                n += 1
+            del self.outbox[:n]
+            self.sent = max(self.sent - n, 0)
+
+    def receive(self, sock):
+        # Таймаут сокета нужен отправке; при приёме тишина от сервера — не обрыв
+        parts = []
+        while not self.stopping:
+            try:
+                data = sock.recv(65536)
+            except socket.timeout:
+                continue
+            if not data:
+                return
+            parts.append(data)
+            if b"\n" not in data:
+                continue
+            *lines, rest = b"".join(parts).split(b"\n")
+            parts = [rest]
+            for line in lines:
+                if not line.strip():
+                    continue
+                msg = json.loads(line)
+                if msg["op"] == "ack":
+                    self.confirm(msg["seq"])
+                elif msg["op"] == "snapshot":
+                    # Всё неподтверждённое сервер получит после hello, то есть после
+                    # снимка: станция досылает это поверх снимка у себя
+                    with self.cond:
+                        replay = [r for _, r in self.outbox]
+                    self.inbox.put(("snapshot", msg["data"], msg["next_id"], replay))
+                else:
+                    self.inbox.put(("record", msg))
+
+    def run(self):
+        while not self.stopping:
+            try:
+                sock = socket.create_connection(self.address, timeout=RETRY_DELAY)
+                sock.settimeout(SEND_TIMEOUT)
+            except OSError:
+                time.sleep(RETRY_DELAY)
+                continue
+            with self.cond:
+                self.sent = 0
+                self.sock = sock
+            threading.Thread(target=self.pump, args=(sock,), daemon=True).start()
+            self.inbox.put(("online", True))
+            try:
+                self.receive(sock)
+            except (OSError, ValueError):
+                pass
+            with self.cond:
+                self.sock = None
+                self.cond.notify_all()
+            sock.close()
+            self.inbox.put(("online", False))
+            if not self.stopping:
+                time.sleep(RETRY_DELAY)
+
+    def stop(self):
+        with self.cond:
+            self.stopping = True
+            self.cond.notify_all()
+            if self.sock is not None:
+                try:
+                    self.sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сервер синхронизации станций регистрации")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=SYNC_PORT)
+    parser.add_argument("--data", default=SERVER_FILE)
+    args = parser.parse_args()
+    with SyncServer((args.host, args.port), args.data) as server:
+        print(f"Сервер синхронизации: {args.host}:{args.port}, данные в {args.data}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    server.state.writer.stop()
+
+
+if __name__ == "__main__":
+    main()
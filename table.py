@@ -0,0 +1,164 @@
+# Виртуальная таблица: в Treeview живут только видимые строки (окно по
+# roster.order), остальные берутся из модели при прокрутке. Выделение
+# хранится в модели по id, поэтому переживает прокрутку.
+
+SHIFT = 0x0001
+CONTROL = 0x0004
+
+
+class VirtualTable:
+    def __init__(self, tree, scrollbar, roster, row_height):
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.roster = roster
+        self.row_height = row_height
+        self.top = 0           # индекс первой видимой строки в roster.order
+        self.rows = 20         # сколько строк помещается в окно
+        self.window = []       # id видимых строк
+        self.selected = set()  # id выделенных строк, в том числе невидимых
+        self.anchor = None     # опорная строка для выделения с Shift
+        self.mode = None       # модификатор последнего клика: None/"shift"/"ctrl"
+
+        scrollbar.configure(command=self.yview)
+        tree.bind("<Configure>", self.on_resize, add="+")
+        tree.bind("<Button-4>", lambda e: self.scroll(-3), add="+")
+        tree.bind("<Button-5>", lambda e: self.scroll(3), add="+")
+        tree.bind("<ButtonPress-1>", self.on_press, add="+")
+        for key, step in (("<Up>", -1), ("<Down>", 1), ("<Prior>", None), ("<Next>", None)):
+            tree.bind(key, lambda e, s=step, k=key: self.move_cursor(s, k, e), add="+")
+
+    # ====== Отрисовка ======
+    def render(self):
+        order = self.roster.order
+        n = len(order)
+        self.top = max(0, min(self.top, n - self.rows))
+        window = [pid for _, pid in order[self.top:self.top + self.rows]]
+        people = self.roster.people
+        tree = self.tree
+        if window != self.window:
+            focus = tree.focus()
+            children = tree.get_children()
+            if children:
+                tree.delete(*children)
+            for k, pid in enumerate(window):
+                p = people[pid]
+                tag = self.roster.tag(p)
+                tree.insert("", "end", iid=str(pid), values=self.roster.values(p, self.top + k + 1),
+                            tags=(tag,) if tag else ())
+            self.window = window
+            if focus and int(focus) in people and int(focus) in window:
+                tree.focus(focus)
+        else:
+            for k, pid in enumerate(window):
+                self._set_row(people[pid], self.top + k + 1)
+        self._show_selection()
+        if n:
+            self.scrollbar.set(self.top / n, min(1.0, (self.top + self.rows) / n))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def _set_row(self, p, num):
+        tag = self.roster.tag(p)
+        self.tree.item(str(p.id), values=self.roster.values(p, num), tags=(tag,) if tag else ())
+
+    def refresh(self, p):
+        # Обновляет одну строку, если она сейчас на экране
+        if p.id in self.window:
+            self._set_row(p, self.top + self.window.index(p.id) + 1)
+
+    def on_resize(self, event):
+        children = self.tree.get_children()
+        header = self.tree.bbox(children[0])[1] if children and self.tree.bbox(children[0]) else self.row_height
+        rows = max(1, (event.height - header) // self.row_height)
+        if rows != self.rows:
+            self.rows = rows
+            self.render()
+
+    # ====== Прокрутка ======
+    def yview(self, *args):
+        n = len(self.roster.order)
+        if args[0] == "moveto":
+            self.top = int(float(args[1]) * n)
+        elif args[0] == "scroll":
+            step = int(args[1])
+            self.top += step * self.rows if args[2] == "pages" else step
+        self.render()
+
+    def scroll(self, units):
+        self.top += units
+        self.render()
+        return "break"
+
+    def see(self, pid):
+        idx = self.roster.index_of(pid)
+        if idx < self.top:
+            self.top = idx
+        elif idx >= self.top + self.rows:
+            self.top = idx - self.rows + 1
+        self.render()
+
+    # ====== Выделение ======
+    def selection(self):
+        # id выделенных строк в порядке таблицы
+        people = self.roster.people
+        pids = [pid for pid in self.selected if pid in people]
+        pids.sort(key=self.roster.index_of)
+        return pids
+
+    def select(self, pids):
+        self.selected = set(pids)
+        self.anchor = pids[0] if pids else None
+        self._show_selection()
+
+    def forget(self, pids):
+        self.selected.difference_update(pids)
+
+    def _show_selection(self):
+        shown = [str(pid) for pid in self.window if pid in self.selected]
+        if set(self.tree.selection()) != set(shown):
+            self.tree.selection_set(shown)
+
+    def on_press(self, event):
+        if event.state & SHIFT:
+            self.mode = "shift"
+        elif event.state & CONTROL:
+            self.mode = "ctrl"
+        else:
+            self.mode = None
+
+    def sync_selection(self):
+        # Переносим выделение, сделанное мышью в Treeview, в модель
+        chosen = {int(i) for i in self.tree.selection()}
+        visible = set(self.window)
+        if chosen == self.selected & visible:
+            return
+        focus = self.tree.focus()
+        focus = int(focus) if focus else None
+        if self.mode == "shift" and self.anchor in self.roster.people and focus is not None:
+            a = self.roster.index_of(self.anchor)
+            b = self.roster.index_of(focus)
+            lo, hi = min(a, b), max(a, b)
+            self.selected = {pid for _, pid in self.roster.order[lo:hi + 1]}
+            self._show_selection()
+            return
+        if self.mode == "ctrl":
+            self.selected = (self.selected - visible) | chosen
+        else:
+            self.selected = chosen
+        self.anchor = focus
+
+    def move_cursor(self, step, key, event):
+        order = self.roster.order
+        if not order:
+            return "break"
+        if step is None:
+            step = self.rows if key == "<Next>" else -self.rows
+        focus = self.tree.focus()
+        idx = self.roster.index_of(int(focus)) if focus else self.top
+        idx = max(0, min(len(order) - 1, idx + step))
+        pid = order[idx][1]
+        self.see(pid)
+        self.tree.focus(str(pid))
+        self.select([pid])
+        self.tree.event_generate("<<TreeviewSelect>>")
+        return "break"
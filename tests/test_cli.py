@@ -0,0 +1,93 @@
+import json, os
+
+import pytest
+from openpyxl import Workbook
+
+import cli
+from history import History
+from storage import lock_data
+
+
+@pytest.fixture
+def data(tmp_path, monkeypatch):
+    monkeypatch.setattr(cli, "HISTORY_FILE", str(tmp_path / "history.sqlite"))
+    return str(tmp_path / "data.json")
+
+
+def names_file(tmp_path, names):
+    path = str(tmp_path / "names.xlsx")
+    wb = Workbook()
+    wb.active.append(["ФИО"])
+    for fio in names:
+        wb.active.append([fio])
+    wb.save(path)
+    return path
+
+
+def run(data, *argv):
+    return cli.main(["--data", data, *argv])
+
+
+def stats(data, capsys):
+    capsys.readouterr()
+    assert run(data, "stats", "--json") == 0
+    return json.loads(capsys.readouterr().out)
+
+
+def test_import_keeps_namesakes_and_prunes(tmp_path, data, capsys):
+    path = names_file(tmp_path, ["Иванов", "Иванов", "Петров"])
+    assert run(data, "import", path) == 0
+    # Повторный импорт ничего не добавляет, тёзки из файла остаются
+    assert run(data, "import", path) == 0
+    assert "Добавлено: 0, уже в списке: 3" in capsys.readouterr().out
+    assert stats(data, capsys)["total"] == 3
+    assert run(data, "import", "--prune", names_file(tmp_path, ["Петров", "Сидоров"])) == 0
+    assert stats(data, capsys)["total"] == 2
+
+
+def test_start_mark_stats_export(tmp_path, data, capsys):
+    assert run(data, "import", names_file(tmp_path, ["Иванов", "Петров", "Сидоров"])) == 0
+    assert run(data, "mark", "Иванов") == 1  # до запуска отмечать нельзя
+    assert run(data, "start", "--at", "08:00") == 0
+    assert run(data, "mark", "Иванов;08:30", "Петров;09:30", "Нет такого") == 0
+    c = stats(data, capsys)
+    assert (c["arrived"], c["ontime"], c["late"]) == (2, 1, 1)
+    out = tmp_path / "reports"
+    out.mkdir()
+    assert run(data, "export", "--hours", "1", "--format", "csv", "--out", str(out)) == 0
+    with open(out / "export_1h.csv", encoding="utf-8-sig") as f:
+        text = f.read()
+    assert "Иванов;1 час;08:30;00:00;Присутствует" in text
+    assert "Еще не прибыл" in text
+
+
+def test_clear_archives_session(tmp_path, data, capsys):
+    assert run(data, "import", names_file(tmp_path, ["Иванов"])) == 0
+    assert run(data, "start", "--at", "08:00") == 0
+    assert run(data, "mark", "Иванов;08:10") == 0
+    assert run(data, "clear") == 0
+    c = stats(data, capsys)
+    assert (c["start"], c["arrived"]) == (None, 0)
+    history = History(cli.HISTORY_FILE)
+    assert [s[2] for s in history.sessions()] == [1]
+    history.close()
+
+
+def test_clear_fails_when_history_is_not_written(tmp_path, data, capsys):
+    assert run(data, "import", names_file(tmp_path, ["Иванов"])) == 0
+    assert run(data, "start", "--at", "08:00") == 0
+    os.mkdir(cli.HISTORY_FILE)  # SQLite не откроет каталог
+    assert run(data, "clear") == 1
+    assert "не записана в историю" in capsys.readouterr().err
+    assert stats(data, capsys)["start"] is not None
+
+
+def test_writing_command_refused_while_list_is_open(tmp_path, data, capsys):
+    assert run(data, "start", "--at", "08:00") == 0
+    lock = lock_data(data)
+    try:
+        assert run(data, "clear") == 1
+        # Чтение блокировку не ждёт
+        assert run(data, "stats") == 0
+    finally:
+        lock.close()
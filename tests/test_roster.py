@@ -0,0 +1,85 @@
+import math
+from datetime import datetime, timedelta
+
+from roster import EPOCH, PRESENT, STATUSES, Roster
+
+START = datetime(2026, 1, 1, 8, 0)
+
+
+def make(*names):
+    roster = Roster()
+    for fio in names:
+        roster.add("Инженер", fio, "1 час")
+    return roster
+
+
+def test_order_follows_fio_and_rename():
+    roster = make("Сидоров", "ёлкин", "Абрамов", "Елисеев")
+    assert [p.fio for p in roster.sorted()] == ["Абрамов", "Елисеев", "ёлкин", "Сидоров"]
+    pid = roster.find_fio("Сидоров").pop()
+    old, new = roster.rename(pid, "Борисов")
+    assert (old, new) == (3, 1)
+    assert [p.fio for p in roster.sorted()] == ["Абрамов", "Борисов", "Елисеев", "ёлкин"]
+    assert roster.index_of(pid) == 1
+
+
+def test_counts_follow_marks_and_status():
+    roster = make("А", "Б", "В")
+    roster.start(START)
+    a, b, c = (roster.find_fio(n).pop() for n in ("А", "Б", "В"))
+    assert roster.mark(a, START + timedelta(minutes=30))
+    assert roster.mark(b, START + timedelta(hours=2))
+    roster.set_status(c, STATUSES[1])
+    counts = roster.counts
+    assert counts["total"] == 3
+    assert counts[PRESENT] == 2 and counts[STATUSES[1]] == 1
+    assert counts["arrived"] == 2 and counts["ontime"] == 1 and counts["late"] == 1
+    # Повторная отметка не переписывает факт
+    assert not roster.mark(a, START + timedelta(hours=3))
+    # Итоги, которые ведутся по ходу, совпадают с пересчётом с нуля
+    kept = dict(counts)
+    roster.recount()
+    assert roster.counts == kept
+
+
+def test_facts_array_tracks_present_arrivals():
+    roster = make("А", "Б")
+    roster.start(START)
+    a, b = roster.find_fio("А").pop(), roster.find_fio("Б").pop()
+    when = START + timedelta(minutes=45)
+    roster.mark(a, when)
+    slot_a, slot_b = roster.people[a].slot, roster.people[b].slot
+    assert roster.facts[slot_a] == (when - EPOCH).total_seconds() / 60
+    assert math.isnan(roster.facts[slot_b])
+    # Не присутствующий выпадает из кривой прибытия
+    roster.set_status(a, STATUSES[2])
+    assert math.isnan(roster.facts[slot_a])
+    # Слот удалённой строки достаётся новой
+    roster.remove(a)
+    c = roster.add("Инженер", "В", "1 час").id
+    assert roster.people[c].slot == slot_a
+    assert math.isnan(roster.facts[slot_a])
+
+
+def test_remove_many_and_snapshot_roundtrip():
+    roster = make(*(f"Человек {n:03d}" for n in range(200)))
+    roster.start(START)
+    roster.mark(1, START + timedelta(minutes=5))
+    roster.remove_many(range(100, 201))
+    assert len(roster) == 99
+    assert [pid for _, pid in roster.order] == sorted(roster.people, key=lambda pid: roster.people[pid].key)
+    copy = Roster()
+    copy.load(roster.snapshot())
+    assert copy.counts == roster.counts
+    assert [p.fio for p in copy.sorted()] == [p.fio for p in roster.sorted()]
+
+
+def test_apply_batch_of_new_rows_and_deletes():
+    roster = make("А")
+    rows = [{"op": "row", "row": {"id": n, "pos": "Инженер", "fio": f"Н{n}", "arr": "1 час",
+                                  "fact": None, "status": PRESENT, "badge": None}} for n in (5, 3)]
+    roster.apply({"op": "batch", "records": rows})
+    assert [p.fio for p in roster.sorted()] == ["А", "Н3", "Н5"]
+    roster.apply({"op": "batch", "records": [{"op": "del", "id": 3}, {"op": "del", "id": 5}]})
+    assert [p.fio for p in roster.sorted()] == ["А"]
+    assert roster.counts["total"] == 1
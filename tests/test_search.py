@@ -0,0 +1,66 @@
+from roster import Roster
+from search import SearchIndex, build_index, fold
+
+
+def index(*names):
+    return build_index(list(enumerate(names, 1)))
+
+
+def test_fold_translit_and_yo():
+    assert fold("Ёлкин") == fold("елкин") == "elkin"
+    assert fold("Юлия") == fold("Yuliya") == fold("Julija")
+    assert fold("Щукин") == "shchukin"
+
+
+def test_prefix_and_substring():
+    idx = index("Иванов Пётр", "Петров Иван", "Сидоров Семён")
+    # Короткое слово — начало любого слова ФИО
+    assert idx.search("ив") == {1, 2}
+    assert idx.search("пе") == {1, 2}
+    # От трёх букв — подстрока
+    assert idx.search("идор") == {3}
+    assert idx.search("иван петр") == {1, 2}
+    assert idx.search("иванов се") == set()
+
+
+def test_latin_query_finds_cyrillic():
+    idx = index("Иванов Пётр", "Ёлкин Юрий")
+    assert idx.search("ivanov") == {1}
+    assert idx.search("elkin yurii") == {2}
+
+
+def test_add_and_remove_keep_index_consistent():
+    idx = SearchIndex()
+    idx.add(1, "Иванов")
+    idx.add(2, "Иванова")
+    assert idx.search("иванов") == {1, 2}
+    idx.remove(1)
+    assert idx.search("иванов") == {2}
+    assert idx.search("ив") == {2}
+
+
+def test_background_build_picks_up_changes():
+    roster = Roster()
+    for n in range(10):
+        roster.add("Инженер", f"Иванов {n}", "1 час")
+    items, token = roster.search_items()
+    built = build_index(items)
+    # Пока индекс строится, строки меняются
+    roster.rename(1, "Петров")
+    roster.remove(2)
+    new = roster.add("Инженер", "Сидоров", "1 час").id
+    roster.install_search(built, token)
+    assert roster.search.ready
+    assert [pid for _, pid in roster.find("петров")] == [1]
+    assert [pid for _, pid in roster.find("сидоров")] == [new]
+    assert 2 not in {pid for _, pid in roster.find("иванов")}
+
+
+def test_stale_build_is_discarded():
+    roster = Roster()
+    roster.add("Инженер", "Иванов", "1 час")
+    items, token = roster.search_items()
+    roster.load({"start": None, "rows": []})
+    roster.install_search(build_index(items), token)
+    assert not roster.search.ready
+    assert roster.find("иванов") == []
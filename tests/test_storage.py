@@ -0,0 +1,121 @@
+import os, time
+
+import storage
+from storage import Journal, Writer
+
+
+def row(n):
+    return {"op": "row", "row": {"id": n, "pos": "п", "fio": f"Человек {n}", "arr": "ч+1",
+                                 "fact": None, "status": "Присутствует", "badge": None}}
+
+
+def start_writer(tmp_path):
+    journal = Journal(str(tmp_path / "data.json"), fsync="close")
+    journal.load()
+    writer = Writer(journal)
+    writer.start()
+    return writer
+
+
+def wait_for(check, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not check() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return check()
+
+
+def reload(tmp_path):
+    journal = Journal(str(tmp_path / "data.json"))
+    data = journal.load()
+    journal.close()
+    return journal, {r["id"] for r in data["rows"]}
+
+
+def test_rapid_appends_are_batched(tmp_path):
+    writer = start_writer(tmp_path)
+    for n in range(1000):
+        writer.append(row(n))
+    writer.flush()
+    assert writer.stop(5)
+    # 1000 отметок подряд сливаются в несколько записей, а не в 1000
+    assert 1 <= writer.writes <= 50
+    journal, ids = reload(tmp_path)
+    assert ids == set(range(1000))
+    assert journal.count == 1000
+
+
+def test_failed_write_is_retried(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "RETRY_DELAY", 0.05)
+    writer = start_writer(tmp_path)
+    # Журнал не открыть: на его месте каталог
+    os.mkdir(writer.journal.path)
+    for n in range(10):
+        writer.append(row(n))
+    assert wait_for(lambda: writer.error is not None)
+    # Несохранённое не пропадает: оно снова в очереди
+    assert not writer.idle()
+    os.rmdir(writer.journal.path)
+    writer.flush(5)
+    assert writer.error is None
+    assert writer.stop(5)
+    assert reload(tmp_path)[1] == set(range(10))
+
+
+def test_torn_tail_is_cut_before_append(tmp_path):
+    path = tmp_path / "data.journal"
+    path.write_text(storage.dump_record(row(1)) + "\n" + storage.dump_record(row(2))[:15],
+                    encoding="utf8")
+    journal = Journal(str(tmp_path / "data.json"))
+    journal.load()
+    assert journal.torn is not None
+    journal.append(row(3))
+    journal.close()
+    journal, ids = reload(tmp_path)
+    assert ids == {1, 3}
+    assert journal.torn is None
+
+
+def test_writer_compacts_without_ui_snapshot(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "COMPACT_EVERY", 100)
+    journal = Journal(str(tmp_path / "data.json"), fsync="close")
+    writer = Writer(journal)
+    writer.seed(journal.load())
+    writer.start()
+    for n in range(250):
+        # Никто не просит снимок у UI: поток записи сворачивает журнал сам
+        assert not writer.append(row(n))
+    writer.append({"op": "del", "id": 7})
+    writer.flush()
+    assert writer.stop(5)
+    assert os.path.exists(tmp_path / "data.json")
+    journal, ids = reload(tmp_path)
+    assert ids == set(range(250)) - {7}
+    assert journal.count < 100
+
+
+def test_clear_does_not_touch_shared_rows():
+    record = row(1)
+    record["row"]["fact"] = "2026-01-01T08:30:00"
+    data = {"start": "2026-01-01T08:00:00"}
+    rows = {}
+    storage.apply_record(data, rows, record)
+    storage.apply_record(data, rows, {"op": "clear"})
+    assert rows[1]["fact"] is None
+    # Та же запись может храниться для повтора в журнале отмены
+    assert record["row"]["fact"] == "2026-01-01T08:30:00"
+
+
+def test_corrupt_snapshot_falls_back_to_previous_generation(tmp_path):
+    journal = Journal(str(tmp_path / "data.json"), fsync="close")
+    journal.load()
+    journal.compact({"start": None, "rows": [row(1)["row"]]})
+    journal.append(row(2))
+    journal.compact({"start": None, "rows": [row(1)["row"], row(2)["row"]]})
+    journal.append(row(3))
+    journal.close()
+    # Текущий снимок испорчен: берётся прежний и дочитываются оба журнала
+    (tmp_path / "data.json").write_text("{мусор", encoding="utf8")
+    journal, ids = reload(tmp_path)
+    assert ids == {1, 2, 3}
+    gen, errors = journal.recovered
+    assert gen == 1 and errors
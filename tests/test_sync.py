@@ -0,0 +1,55 @@
+import threading, time
+
+from sync import SyncClient, SyncServer, merge_row
+
+
+def row(fact, status="Присутствует"):
+    return {"id": 1, "pos": "Инженер", "fio": "Иванов", "arr": "1 час", "fact": fact,
+            "status": status, "badge": None}
+
+
+def wait_for(check, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not check() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return check()
+
+
+def test_new_row_and_first_mark_win():
+    assert merge_row(None, row(None)) == row(None)
+    assert merge_row(row(None), row("2026-01-01T08:30:00")) == row("2026-01-01T08:30:00")
+
+
+def test_earliest_fact_is_kept():
+    early, late = "2026-01-01T08:10:00", "2026-01-01T08:40:00"
+    assert merge_row(row(early), row(late))["fact"] == early
+    assert merge_row(row(late), row(early))["fact"] == early
+
+
+def test_fact_is_not_cleared_by_other_station():
+    merged = merge_row(row("2026-01-01T08:10:00"), row(None, status="Болен"))
+    # Остальные поля — последняя запись, отметка остаётся
+    assert merged["fact"] == "2026-01-01T08:10:00"
+    assert merged["status"] == "Болен"
+
+
+def test_server_acks_and_skips_repeats(tmp_path):
+    server = SyncServer(("127.0.0.1", 0), str(tmp_path / "server.json"))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = SyncClient(*server.server_address)
+    try:
+        client.send({"op": "row", "row": row(None)})
+        client.start()
+        assert wait_for(lambda: not client.outbox)
+        assert server.state.rows[1] == row(None)
+        # Подтверждение потерялось: та же запись с тем же номером не применяется второй раз
+        with client.cond:
+            client.outbox.append((1, {"op": "del", "id": 1}))
+            client.cond.notify_all()
+        assert wait_for(lambda: not client.outbox)
+        assert 1 in server.state.rows
+    finally:
+        client.stop()
+        server.shutdown()
+        server.server_close()
+        server.state.writer.stop(5)
@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from roster import STATUSES, Roster
+from turnstile import Ingest, chunks, parse_event
+
+START = datetime(2026, 1, 1, 8, 0)
+
+
+def at(minutes):
+    return START + timedelta(minutes=minutes)
+
+
+def make():
+    roster = Roster()
+    roster.add("Инженер", "Иванов", "1 час", badge="100")
+    roster.add("Инженер", "Петров", "1 час", badge="200")
+    roster.add("Инженер", "Сидоров", "1 час")
+    roster.add("Инженер", "Сидоров", "1 час")
+    roster.start(START)
+    return roster
+
+
+def test_parse_event_either_order():
+    day = START.date()
+    assert parse_event("08:15;100", day) == (at(15), "100")
+    assert parse_event("100,08:15:30", day) == (at(15) + timedelta(seconds=30), "100")
+    assert parse_event("время;пропуск", day) is None
+    assert parse_event("", day) is None
+
+
+def test_chunks_split_and_count_bad_lines():
+    stats = {"bad": 0}
+    lines = ["08:01;1\n", "мусор\n", "08:02;2\n", "08:03;3\n"]
+    assert [len(c) for c in chunks(lines, START.date(), size=2, stats=stats)] == [2, 1]
+    assert stats["bad"] == 1
+
+
+def test_earliest_event_wins():
+    roster = make()
+    ingest = Ingest(roster)
+    changed = ingest.apply([(at(40), "100"), (at(20), "100"), (at(30), "Петров")])
+    assert sorted(changed) == [1, 2]
+    assert roster.people[1].fact == at(20)
+    # Более позднее событие из следующей пачки факт не переписывает, более раннее — да
+    assert ingest.apply([(at(50), "100"), (at(25), "200")]) == [2]
+    assert roster.people[1].fact == at(20)
+    assert roster.people[2].fact == at(25)
+    assert ingest.stats["marked"] == 2
+
+
+def test_early_unknown_and_ambiguous_events():
+    roster = make()
+    ingest = Ingest(roster)
+    changed = ingest.apply([(at(-5), "100"), (at(5), "999"), (at(5), "Сидоров")])
+    assert changed == []
+    assert roster.people[1].fact is None
+    st = ingest.stats
+    assert (st["early"], st["unknown"], st["ambiguous"]) == (1, 1, 1)
+
+
+def test_not_present_is_not_marked():
+    roster = make()
+    roster.set_status(1, STATUSES[1])
+    ingest = Ingest(roster)
+    assert ingest.apply([(at(10), "100")]) == []
+    assert ingest.stats["other"] == 1
+
+
+def test_events_for_other_roster_are_refused():
+    roster = make()
+    ingest = Ingest(roster, "Основной")
+    with pytest.raises(ValueError):
+        ingest.apply([(at(10), "100")], "Смена 2")
+    assert roster.people[1].fact is None
@@ -0,0 +1,60 @@
+from undo import UndoLog, batch, delete, deleted_ids, restore
+
+
+def row(n):
+    return {"id": n, "fio": f"Человек {n}"}
+
+
+def step(*ids):
+    return batch([{"op": "row", "row": row(n)} for n in ids]), restore([row(n) for n in ids])
+
+
+def test_undo_redo_order():
+    log = UndoLog()
+    log.push(*step(1))
+    log.push(*step(2))
+    assert log.undo() == restore([row(2)])
+    assert log.undo() == restore([row(1)])
+    assert log.undo() is None
+    assert log.redo() == {"op": "row", "row": row(1)}
+    # Новое действие обрывает цепочку повтора
+    log.push(*step(3))
+    assert log.redo() is None
+
+
+def test_oldest_steps_evicted_by_rows():
+    log = UndoLog(max_rows=10, max_steps=100)
+    for n in range(4):
+        log.push(*step(3 * n, 3 * n + 1))  # 4 строки на шаг
+    assert len(log.done) == 2
+    assert log.rows == 8
+    # Шаг больше лимита остаётся один
+    log.push(*step(*range(20)))
+    assert len(log.done) == 1
+    assert log.rows == 40
+    assert not log.fits(11)
+
+
+def test_oldest_steps_evicted_by_count():
+    log = UndoLog(max_rows=1000, max_steps=3)
+    for n in range(5):
+        log.push(*step(n))
+    assert [entry[0]["row"]["id"] for entry in log.done] == [2, 3, 4]
+
+
+def test_forget_drops_steps_touching_rows():
+    log = UndoLog()
+    log.push(*step(1))
+    log.push(*step(2, 3))
+    log.push({"op": "start", "start": None}, {"op": "start", "start": None})
+    log.undo()
+    log.forget([3])
+    assert [entry[0]["op"] for entry in log.done] == ["row"]
+    assert [entry[0]["op"] for entry in log.undone] == ["start"]
+    assert log.rows == 4
+
+
+def test_deleted_ids():
+    assert deleted_ids(delete([4])) == [4]
+    assert deleted_ids(delete([1, 2])) == [1, 2]
+    assert deleted_ids(restore([row(1)])) == []
@@ -0,0 +1,196 @@
+import os, socket
+
+from roster import PRESENT, parse_time
+
+# Приём событий турникетов: журнал доступа CSV ("время;пропуск" или
+# "пропуск;время", разделитель ; , или табуляция). Строки читаются потоком
+# (целый файл, дописываемый файл или локальный сокет) и идут пачками:
+# в памяти только текущая пачка, а не весь журнал. Пропуск или ФИО
+# ищется по хеш-индексам модели; фактом прибытия становится самое
+# раннее событие человека после запуска, опоздание — от времени события.
+
+EVENT_CHUNK = 5000        # событий в одной пачке
+TAIL_POLL = 0.5           # сек. между проверками дописанного журнала
+TURNSTILE_PORT = 8766     # порт локального приёма событий
+DELIMITERS = (";", "\t", ",")
+
+
+# ====== Источники строк ======
+# Генераторы строк; None — новых строк пока нет (пора применить неполную пачку)
+def read_log(path):
+    with open(path, "r", encoding="utf8", errors="replace") as f:
+        yield from f
+
+
+def follow(path, stop, from_start=True):
+    # Как tail -f: дочитывает новые строки, переживает усечение и ротацию файла
+    f = None
+    pos = 0
+    buf = ""
+    while not stop.is_set():
+        if f is None:
+            try:
+                f = open(path, "r", encoding="utf8", errors="replace")
+            except OSError:
+                yield None
+                stop.wait(TAIL_POLL)
+                continue
+            if not from_start:
+                f.seek(0, os.SEEK_END)
+            from_start = True  # после ротации новый файл читается с начала
+            pos = f.tell()
+        chunk = f.readline()
+        if chunk:
+            pos = f.tell()
+            buf += chunk
+            if buf.endswith("\n"):
+                yield buf
+                buf = ""
+            continue
+        try:
+            st = os.stat(path)
+            rotated = st.st_size < pos or not os.path.samestat(st, os.fstat(f.fileno()))
+        except OSError:
+            rotated = False
+        if rotated:
+            f.close()
+            f = None
+            buf = ""
+            continue
+        yield None
+        stop.wait(TAIL_POLL)
+    if f is not None:
+        f.close()
+
+
+def listen(port, stop, host="127.0.0.1"):
+    # Локальная замена шлюза турникетов: события строками по TCP
+    srv = socket.create_server((host, port))
+    srv.settimeout(TAIL_POLL)
+    try:
+        while not stop.is_set():
+            try:
+                conn, _ = srv.accept()
+            except socket.timeout:
+                yield None
+                continue
+            conn.settimeout(TAIL_POLL)
+            buf = b""
+            with conn:
+                while not stop.is_set():
+                    try:
+                        data = conn.recv(65536)
+                    except socket.timeout:
+                        yield None
+                        continue
+                    if not data:
+                        break
+                    buf += data
+                    *lines, buf = buf.split(b"\n")
+                    for line in lines:
+                        yield line.decode("utf8", errors="replace")
+    finally:
+        srv.close()
+
+
+# ====== Разбор ======
+def parse_event(line, day):
+    # (время, ключ) или None для заголовка и испорченной строки
+    line = line.strip()
+    if not line:
+        return None
+    for d in DELIMITERS:
+        if d in line:
+            fields = [x.strip() for x in line.split(d)]
+            break
+    else:
+        return None
+    for k in (0, 1):
+        try:
+            when = parse_time(fields[k], day)
+        except (ValueError, IndexError):
+            continue
+        key = fields[1 - k]
+        return (when, key) if key else None
+    return None
+
+
+def chunks(lines, day, size=EVENT_CHUNK, stats=None):
+    # Пачки [(время, ключ)]: полная пачка или то, что накопилось к паузе источника
+    chunk = []
+    for line in lines:
+        if line is not None:
+            event = parse_event(line, day)
+            if event is not None:
+                chunk.append(event)
+            elif stats is not None:
+                stats["bad"] += 1
+            if len(chunk) < size:
+                continue
+        if chunk:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# ====== Сопоставление ======
+class Ingest:
+    # name — список, к которому относятся события; другой список в той же
+    # модели (после переключения) они не отмечают
+    def __init__(self, roster, name=None):
+        self.roster = roster
+        self.name = name
+        self.stats = dict.fromkeys(("events", "marked", "unknown", "ambiguous", "early", "other", "bad"), 0)
+
+    def find(self, key):
+        # id строки или причина, по которой событие не сопоставлено
+        roster = self.roster
+        pid = roster.find_badge(key)
+        if pid is not None:
+            return pid
+        ids = roster.find_fio(key)
+        if len(ids) == 1:
+            return next(iter(ids))
+        return "ambiguous" if ids else "unknown"
+
+    def apply(self, events, name=None):
+        # Применяет пачку к модели; возвращает id изменённых строк.
+        # name — открытый сейчас список
+        if self.name is not None and name != self.name:
+            raise ValueError(f"События турникетов для списка «{self.name}», открыт «{name}»")
+        roster = self.roster
+        start = roster.start_time
+        stats = self.stats
+        stats["events"] += len(events)
+        cache = {}   # ключ -> результат find: в журнале один пропуск повторяется много раз
+        first = {}   # id -> самое раннее событие в пачке
+        for when, key in events:
+            if start is None or when < start:
+                stats["early"] += 1
+                continue
+            pid = cache.get(key)
+            if pid is None:
+                pid = cache[key] = self.find(key)
+            if isinstance(pid, str):
+                stats[pid] += 1
+                continue
+            if pid not in first or when < first[pid]:
+                first[pid] = when
+        changed = []
+        people = roster.people
+        for pid, when in first.items():
+            p = people.get(pid)
+            if p is None:
+                continue
+            if p.status != PRESENT:
+                stats["other"] += 1
+                continue
+            # Уже отмеченный раньше не переписывается: остаётся самое раннее время
+            if p.fact is not None and p.fact <= when:
+                continue
+            if p.fact is None:
+                stats["marked"] += 1
+            roster.set_fact(pid, when)
+            changed.append(pid)
+        return changed
@@ -0,0 +1,104 @@
+import os
+from collections import deque
+
+# Журнал отмены: для каждого действия хранятся прямая и обратная записи в
+# формате журнала (только затронутые строки), а не копия всего списка.
+# Отмена и повтор идут через Roster.apply — те же точечные изменения.
+
+UNDO_ROWS = int(os.environ.get("ARRIVAL_UNDO_ROWS", "200000"))  # строк во всех шагах вместе
+UNDO_STEPS = 100
+
+
+def batch(records):
+    return records[0] if len(records) == 1 else {"op": "batch", "records": records}
+
+
+def restore(rows):
+    # Вернуть строки как были; пометка undo — чтобы сервер синхронизации
+    # не оставил более раннюю отметку прибытия
+    return batch([{"op": "row", "row": r, "undo": True} for r in rows])
+
+
+def delete(pids):
+    return batch([{"op": "del", "id": pid} for pid in pids])
+
+
+def deleted_ids(record):
+    if record["op"] == "del":
+        return [record["id"]]
+    if record["op"] == "batch":
+        return [pid for r in record["records"] for pid in deleted_ids(r)]
+    return []
+
+
+def touched(record):
+    # id строк, которые меняет запись
+    if record["op"] == "row":
+        return {record["row"]["id"]}
+    if record["op"] == "del":
+        return {record["id"]}
+    if record["op"] == "batch":
+        return set().union(*(touched(r) for r in record["records"]))
+    return set()
+
+
+def size(record):
+    if record["op"] == "batch":
+        return sum(size(r) for r in record["records"]) or 1
+    return 1
+
+
+class UndoLog:
+    def __init__(self, max_rows=UNDO_ROWS, max_steps=UNDO_STEPS):
+        self.max_rows = max_rows
+        self.max_steps = max_steps
+        self.done = deque()   # [(прямая, обратная, строк, id затронутых строк)]
+        self.undone = []
+        self.rows = 0
+
+    def fits(self, rows):
+        return rows <= self.max_rows
+
+    def push(self, forward, inverse):
+        for entry in self.undone:
+            self.rows -= entry[2]
+        self.undone.clear()
+        n = size(forward) + size(inverse)
+        self.done.append((forward, inverse, n, touched(forward) | touched(inverse)))
+        self.rows += n
+        # Вытесняем самые старые шаги; последний остаётся, даже если он больше лимита
+        while len(self.done) > 1 and (self.rows > self.max_rows or len(self.done) > self.max_steps):
+            self.rows -= self.done.popleft()[2]
+
+    def undo(self):
+        if not self.done:
+            return None
+        entry = self.done.pop()
+        self.undone.append(entry)
+        return entry[1]
+
+    def redo(self):
+        if not self.undone:
+            return None
+        entry = self.undone.pop()
+        self.done.append(entry)
+        return entry[0]
+
+    def forget(self, pids):
+        # Строки изменены мимо журнала отмены (турникеты): шаги, которые их трогают,
+        # вернули бы устаревшие строки — выбрасываем их, остальные шаги не зависят от этих строк
+        pids = set(pids)
+        if not pids:
+            return
+        for steps in (self.done, self.undone):
+            keep = [e for e in steps if e[3].isdisjoint(pids)]
+            for entry in steps:
+                if not entry[3].isdisjoint(pids):
+                    self.rows -= entry[2]
+            steps.clear()
+            steps.extend(keep)
+
+    def clear(self):
+        self.done.clear()
+        self.undone.clear()
+        self.rows = 0